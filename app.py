@@ -1,17 +1,21 @@
 """Main Streamlit application entry point for UBA (Unbeaten Area) - 不败之地."""
 import streamlit as st
-import textwrap
+import numpy as np
 from datetime import datetime, date
+from sqlalchemy import select, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import selectinload
 
 # Import UI styles
 from src.ui import (
-    GLOBAL_CSS, APP_NAME_CN, APP_NAME_EN, APP_FULL_NAME, APP_SLOGAN,
-    render_main_header, render_metric_card, render_alert, render_footer,
+    GLOBAL_CSS, APP_NAME_CN, APP_NAME_EN, APP_SLOGAN,
+    render_main_header, render_metric_card, render_alert, render_footer, render_nav_grid,
+    render_sidebar_brand,
     require_auth, render_auth_sidebar, get_current_user_id
 )
 
 # Import database modules
-from src.database import init_db, get_session
+from src.database import init_db, get_scoped_session, session_scope
 from src.database.models import Asset, Signal, SignalStatus, PortfolioPosition, VisitLog
 
 st.set_page_config(
@@ -28,218 +32,180 @@ st.markdown(GLOBAL_CSS, unsafe_allow_html=True)
 init_db()
 
 def get_today_visits(db_session, user_id: int) -> int:
-    """Get and increment today's visit count."""
-    today = date.today()
-    visit_log = db_session.query(VisitLog).filter(
-        VisitLog.visit_date == today,
-        VisitLog.user_id == user_id
-    ).first()
-    if visit_log:
-        visit_log.count += 1
-    else:
-        visit_log = VisitLog(user_id=user_id, visit_date=today, count=1)
-        db_session.add(visit_log)
+    """Increment and return today's visit count with a single atomic upsert."""
+    now = datetime.now()
+    stmt = sqlite_insert(VisitLog).values(
+        user_id=user_id, visit_date=date.today(), count=1, updated_at=now
+    ).on_conflict_do_update(
+        index_elements=["user_id", "visit_date"],
+        set_={"count": VisitLog.count + 1, "updated_at": now}
+    ).returning(VisitLog.count)
+    count = db_session.execute(stmt).scalar_one()
     db_session.commit()
-    return visit_log.count
+    return count
 
 # Render main header
 st.markdown(render_main_header(), unsafe_allow_html=True)
-from src.services import RealtimeService
+from src.services.cache_utils import get_session_quotes, clear_quotes_cache
 
-session = get_session()
+session = get_scoped_session()
 require_auth(session)
 user_id = get_current_user_id()
-realtime_service = RealtimeService()
-
-# Get basic stats
-stocks = session.query(Asset).filter(Asset.user_id == user_id).all()
-stock_codes = [s.code for s in stocks]
-
-# Fetch real-time data
-if stock_codes:
-    realtime_data = realtime_service.get_batch_quotes(stock_codes)
-else:
-    realtime_data = {}
 
-# Stats Section
-st.markdown("### 📊 系统概览")
-
-col1, col2, col3, col4 = st.columns(4)
 
-with col1:
-    stock_count = len(stocks)
-    st.markdown(render_metric_card(f"{stock_count} 只", "股票池", "📋"), unsafe_allow_html=True)
+@st.fragment
+def render_overview(user_id: int):
+    """系统概览统计卡片（局部重跑，不触发整页刷新）"""
+    with session_scope() as db_session:
+        # 三项统计合并为一条聚合查询
+        stock_count, open_signals, total_position = db_session.execute(
+            select(
+                select(func.count(Asset.id)).where(
+                    Asset.user_id == user_id
+                ).scalar_subquery(),
+                select(func.count(Signal.id)).where(
+                    Signal.status == SignalStatus.OPEN,
+                    Signal.user_id == user_id
+                ).scalar_subquery(),
+                select(func.coalesce(func.sum(PortfolioPosition.position_pct), 0)).where(
+                    PortfolioPosition.position_pct > 0,
+                    PortfolioPosition.user_id == user_id
+                ).scalar_subquery()
+            )
+        ).one()
+
+    st.markdown("### 📊 系统概览")
+
+    col1, col2, col3, col4 = st.columns(4)
+
+    with col1:
+        st.markdown(render_metric_card(f"{stock_count} 只", "股票池", "📋"), unsafe_allow_html=True)
+
+    with col2:
+        st.markdown(render_metric_card(f"{open_signals} 个", "待处理信号", "🔔"), unsafe_allow_html=True)
+
+    with col3:
+        st.markdown(render_metric_card(f"{total_position:.1f}%", "总仓位", "💼"), unsafe_allow_html=True)
+
+    with col4:
+        cash_position = 100 - total_position
+        st.markdown(render_metric_card(f"{cash_position:.1f}%", "现金比例", "💰"), unsafe_allow_html=True)
+
+
+ALERT_ICON_MAP = {"BUY": "🟢", "ADD": "🟡", "SELL": "🔴"}
+ALERT_ACTION_MAP = {"BUY": "买入", "ADD": "加仓", "SELL": "卖出"}
+ALERT_TYPE_MAP = {"BUY": "success", "ADD": "warning", "SELL": "danger"}
+
+
+def render_triggered_alert(item: dict) -> str:
+    """Build the alert HTML for one triggered stock."""
+    icon = ALERT_ICON_MAP.get(item["type"], "⚪")
+    action = ALERT_ACTION_MAP.get(item["type"], "")
+    alert_type = ALERT_TYPE_MAP.get(item["type"], "info")
+
+    change_str = f"+{item['change_pct']:.2f}%" if item['change_pct'] > 0 else f"{item['change_pct']:.2f}%"
+
+    message = f"""
+    <strong>{item['name']}</strong> ({item['code']}) 触发 <strong>{action}</strong> 信号！<br>
+    当前 PB: <strong>{item['current_pb']:.2f}</strong> | 阈值: {item['threshold']:.2f} |
+    价格: ¥{item['price']:.2f} ({change_str})
+    """
+    return render_alert(message, alert_type, icon)
+
+
+@st.fragment(run_every="15s")
+def render_alerts(user_id: int):
+    """实时触发提醒，每 15 秒局部刷新一次"""
+    st.markdown("### ⚡ 实时触发提醒")
+    st.caption("💡 仅显示关注指数评分 ≥ 4⭐ 的股票")
+
+    triggered_stocks = []
+    with session_scope() as db_session:
+        stocks = db_session.query(Asset).options(
+            selectinload(Asset.threshold)
+        ).filter(Asset.user_id == user_id).all()
+
+        # Fetch real-time data
+        realtime_data = get_session_quotes([s.code for s in stocks])
+
+        # 单次遍历收集列数据，阈值与行情各只取一次
+        watched, current_pbs, buy_pbs, add_pbs, sell_pbs = [], [], [], [], []
+        for stock in stocks:
+            # 只显示关注指数评分 >= 4 且已设置阈值、有有效 PB 的股票
+            score = stock.competence_score
+            threshold = stock.threshold
+            quote = realtime_data.get(stock.code)
+            if not (score and score >= 4 and threshold and quote and quote.pb):
+                continue
+
+            watched.append((stock, quote))
+            current_pbs.append(quote.pb)
+            buy_pbs.append(threshold.buy_pb)
+            # 未设置的加仓/卖出阈值记为 NaN，比较结果恒为 False
+            add_pbs.append(threshold.add_pb or np.nan)
+            sell_pbs.append(threshold.sell_pb or np.nan)
+
+        if watched:
+            # 列式数组 + 向量化比较，替代逐只 if/elif 判断
+            current_pb = np.array(current_pbs, dtype=np.float64)
+            buy_pb = np.array(buy_pbs, dtype=np.float64)
+            add_pb = np.array(add_pbs, dtype=np.float64)
+            sell_pb = np.array(sell_pbs, dtype=np.float64)
+
+            buy_mask = current_pb <= buy_pb
+            add_mask = ~buy_mask & (current_pb <= add_pb)
+            sell_mask = ~buy_mask & ~add_mask & (current_pb >= sell_pb)
+
+            masks = [buy_mask, add_mask, sell_mask]
+            signal_types = np.select(masks, ["BUY", "ADD", "SELL"], default="")
+            thresholds = np.select(masks, [buy_pb, add_pb, sell_pb], default=np.nan)
+
+            for i in np.flatnonzero(buy_mask | add_mask | sell_mask):
+                stock, quote = watched[i]
+                triggered_stocks.append({
+                    "type": str(signal_types[i]),
+                    "name": stock.name,
+                    "code": stock.code,
+                    "current_pb": quote.pb,
+                    "threshold": float(thresholds[i]),
+                    "price": quote.price,
+                    "change_pct": quote.change_pct
+                })
+
+    if triggered_stocks:
+        # 所有提醒拼成一段 HTML，一次 st.markdown 输出
+        alerts_html = "".join(render_triggered_alert(item) for item in triggered_stocks)
+        st.markdown(alerts_html, unsafe_allow_html=True)
+    else:
+        st.markdown(render_alert("📡 实时监控中，暂无触发信号", "info"), unsafe_allow_html=True)
 
-with col2:
-    open_signals = session.query(Signal).filter(
-        Signal.status == SignalStatus.OPEN,
-        Signal.user_id == user_id
-    ).count()
-    st.markdown(render_metric_card(f"{open_signals} 个", "待处理信号", "🔔"), unsafe_allow_html=True)
+    st.caption(f"⏰ 行情更新: {datetime.now().strftime('%H:%M:%S')}")
 
-with col3:
-    positions = session.query(PortfolioPosition).filter(
-        PortfolioPosition.position_pct > 0,
-        PortfolioPosition.user_id == user_id
-    ).all()
-    total_position = sum(p.position_pct for p in positions)
-    st.markdown(render_metric_card(f"{total_position:.1f}%", "总仓位", "💼"), unsafe_allow_html=True)
 
-with col4:
-    cash_position = 100 - total_position
-    st.markdown(render_metric_card(f"{cash_position:.1f}%", "现金比例", "💰"), unsafe_allow_html=True)
+# Stats Section
+render_overview(user_id)
 
 st.divider()
 
 # Triggered alerts
-st.markdown("### ⚡ 实时触发提醒")
-st.caption("💡 仅显示关注指数评分 ≥ 4⭐ 的股票")
-
-triggered_stocks = []
-for stock in stocks:
-    # 只显示关注指数评分 >= 4 的股票
-    if not stock.threshold or not stock.competence_score or stock.competence_score < 4:
-        continue
-
-    quote = realtime_data.get(stock.code)
-    if quote and quote.pb:
-        current_pb = quote.pb
-        buy_pb = stock.threshold.buy_pb
-
-        if current_pb <= buy_pb:
-            triggered_stocks.append({
-                "type": "BUY",
-                "name": stock.name,
-                "code": stock.code,
-                "current_pb": current_pb,
-                "threshold": buy_pb,
-                "price": quote.price,
-                "change_pct": quote.change_pct
-            })
-        elif stock.threshold.add_pb and current_pb <= stock.threshold.add_pb:
-            triggered_stocks.append({
-                "type": "ADD",
-                "name": stock.name,
-                "code": stock.code,
-                "current_pb": current_pb,
-                "threshold": stock.threshold.add_pb,
-                "price": quote.price,
-                "change_pct": quote.change_pct
-            })
-        elif stock.threshold.sell_pb and current_pb >= stock.threshold.sell_pb:
-            triggered_stocks.append({
-                "type": "SELL",
-                "name": stock.name,
-                "code": stock.code,
-                "current_pb": current_pb,
-                "threshold": stock.threshold.sell_pb,
-                "price": quote.price,
-                "change_pct": quote.change_pct
-            })
-
-if triggered_stocks:
-    for item in triggered_stocks:
-        icon_map = {"BUY": "🟢", "ADD": "🟡", "SELL": "🔴"}
-        action_map = {"BUY": "买入", "ADD": "加仓", "SELL": "卖出"}
-        type_map = {"BUY": "success", "ADD": "warning", "SELL": "danger"}
-
-        icon = icon_map.get(item["type"], "⚪")
-        action = action_map.get(item["type"], "")
-        alert_type = type_map.get(item["type"], "info")
-
-        change_str = f"+{item['change_pct']:.2f}%" if item['change_pct'] > 0 else f"{item['change_pct']:.2f}%"
-
-        message = f"""
-        <strong>{item['name']}</strong> ({item['code']}) 触发 <strong>{action}</strong> 信号！<br>
-        当前 PB: <strong>{item['current_pb']:.2f}</strong> | 阈值: {item['threshold']:.2f} |
-        价格: ¥{item['price']:.2f} ({change_str})
-        """
-        st.markdown(render_alert(message, alert_type, icon), unsafe_allow_html=True)
-else:
-    st.markdown(render_alert("📡 实时监控中，暂无触发信号", "info"), unsafe_allow_html=True)
+render_alerts(user_id)
 
 st.divider()
 
 # Navigation guide
-st.markdown("### 🚀 快速导航")
-
-col1, col2, col3 = st.columns(3)
-
-with col1:
-    st.markdown(textwrap.dedent("""
-    <div class="metric-card">
-        <h4>📋 股票池</h4>
-        <ul style="color: #666; margin: 0; padding-left: 1.2rem;">
-            <li>添加/删除股票</li>
-            <li>设置 PB 阈值</li>
-            <li>自动分析推荐</li>
-        </ul>
-    </div>
-    """), unsafe_allow_html=True)
-
-with col2:
-    st.markdown(textwrap.dedent("""
-    <div class="metric-card">
-        <h4>📊 仪表盘</h4>
-        <ul style="color: #666; margin: 0; padding-left: 1.2rem;">
-            <li>实时 PB 监控</li>
-            <li>自动刷新数据</li>
-            <li>信号状态一览</li>
-        </ul>
-    </div>
-    """), unsafe_allow_html=True)
-
-with col3:
-    st.markdown(textwrap.dedent("""
-    <div class="metric-card">
-        <h4>🎯 智能选股</h4>
-        <ul style="color: #666; margin: 0; padding-left: 1.2rem;">
-            <li>一键筛选低估股</li>
-            <li>PB 接近请客价</li>
-            <li>批量加入股票池</li>
-        </ul>
-    </div>
-    """), unsafe_allow_html=True)
+NAV_CARDS = (
+    ("📋 股票池", ("添加/删除股票", "设置 PB 阈值", "自动分析推荐")),
+    ("📊 仪表盘", ("实时 PB 监控", "自动刷新数据", "信号状态一览")),
+    ("🎯 智能选股", ("一键筛选低估股", "PB 接近请客价", "批量加入股票池")),
+    ("🔔 信号中心", ("处理触发信号", "执行四动作", "记录交易日志")),
+    ("💼 持仓管理", ("查看当前持仓", "盈亏分析", "风险控制")),
+    ("🧠 AI 分析", ("智能投资建议", "基本面分析", "估值诊断")),
+)
 
-st.markdown("<br>", unsafe_allow_html=True)
+st.markdown("### 🚀 快速导航")
 
-col1, col2, col3 = st.columns(3)
-
-with col1:
-    st.markdown(textwrap.dedent("""
-    <div class="metric-card">
-        <h4>🔔 信号中心</h4>
-        <ul style="color: #666; margin: 0; padding-left: 1.2rem;">
-            <li>处理触发信号</li>
-            <li>执行四动作</li>
-            <li>记录交易日志</li>
-        </ul>
-    </div>
-    """), unsafe_allow_html=True)
-
-with col2:
-    st.markdown(textwrap.dedent("""
-    <div class="metric-card">
-        <h4>💼 持仓管理</h4>
-        <ul style="color: #666; margin: 0; padding-left: 1.2rem;">
-            <li>查看当前持仓</li>
-            <li>盈亏分析</li>
-            <li>风险控制</li>
-        </ul>
-    </div>
-    """), unsafe_allow_html=True)
-
-with col3:
-    st.markdown(textwrap.dedent("""
-    <div class="metric-card">
-        <h4>🧠 AI 分析</h4>
-        <ul style="color: #666; margin: 0; padding-left: 1.2rem;">
-            <li>智能投资建议</li>
-            <li>基本面分析</li>
-            <li>估值诊断</li>
-        </ul>
-    </div>
-    """), unsafe_allow_html=True)
+# 六张卡片拼成一个 CSS 网格，一次 st.markdown 输出
+st.markdown(render_nav_grid(NAV_CARDS), unsafe_allow_html=True)
 
 st.markdown("<br>", unsafe_allow_html=True)
 st.info("👈 使用左侧导航栏进入各功能模块")
@@ -254,19 +220,14 @@ today_visits = get_today_visits(session, user_id)
 with st.sidebar:
     render_auth_sidebar()
     st.divider()
-    st.markdown(textwrap.dedent(f"""
-    <div style="text-align: center; padding: 1rem 0;">
-        <div style="font-size: 2.5rem;">🛡️</div>
-        <div style="font-size: 1.2rem; font-weight: 700; color: #1E88E5;">{APP_NAME_CN}</div>
-        <div style="font-size: 0.8rem; color: #666;">{APP_NAME_EN} • {APP_FULL_NAME}</div>
-    </div>
-    """), unsafe_allow_html=True)
+    st.markdown(render_sidebar_brand(), unsafe_allow_html=True)
 
     st.divider()
 
     st.caption(f"⏰ 更新时间: {datetime.now().strftime('%H:%M:%S')}")
 
     if st.button("🔄 刷新数据", use_container_width=True):
+        clear_quotes_cache()
         st.rerun()
 
     st.divider()
@@ -1,14 +1,18 @@
 """Stock pool management page with auto-analysis and real-time data."""
+import queue
 import streamlit as st
-import pandas as pd
-import plotly.graph_objects as go
 from datetime import datetime
-from src.database import get_session, init_db
+from concurrent.futures import ThreadPoolExecutor
+from src.database import get_scoped_session, init_db
 from src.database.models import Market, Valuation
-from src.services import StockPoolService, ValuationService, StockAnalyzer, RealtimeService, AIAnalyzer
+from src.services import StockPoolService, ValuationService
+from src.services.cache_utils import (
+    get_session_quotes, clear_quotes_cache, load_stock_pool, load_pb_history,
+    get_stock_analyzer, get_ai_analyzer
+)
 from src.ui import (
     GLOBAL_CSS, APP_NAME_CN, APP_NAME_EN, render_header, render_footer,
-    require_auth, render_auth_sidebar, get_current_user_id
+    require_auth, render_auth_sidebar, get_current_user_id, lttb_downsample
 )
 
 st.set_page_config(
@@ -26,11 +30,12 @@ st.markdown(render_header("股票池管理", "添加、编辑和管理您的关
 col1, col2 = st.columns([4, 1])
 with col2:
     if st.button("🔄 刷新", use_container_width=True):
+        clear_quotes_cache()
         st.rerun()
 
 # Initialize services
 init_db()
-session = get_session()
+session = get_scoped_session()
 require_auth(session)
 user_id = get_current_user_id()
 with st.sidebar:
@@ -38,13 +43,8 @@ with st.sidebar:
     st.divider()
 stock_service = StockPoolService(session, user_id)
 valuation_service = ValuationService(session)
-realtime_service = RealtimeService()
-
-@st.cache_resource
-def get_analyzer():
-    return StockAnalyzer()
 
-analyzer = get_analyzer()
+analyzer = get_stock_analyzer()
 
 # Session state
 if 'analysis_result' not in st.session_state:
@@ -158,26 +158,38 @@ if st.session_state.analysis_result:
                 st.caption(f"📈 数据范围: 近 {pb_analysis.data_years} 年，共 {pb_analysis.data_count} 条数据")
 
                 if pb_analysis.pb_history:
-                    dates = [d[0] for d in pb_analysis.pb_history]
-                    pbs = [d[1] for d in pb_analysis.pb_history]
-
-                    fig = go.Figure()
-                    fig.add_trace(go.Scatter(x=dates, y=pbs, mode='lines', name='PB',
-                                            line=dict(color='#1E88E5', width=2)))
-                    fig.add_hline(y=pb_analysis.recommended_buy_pb, line_dash="dash", line_color="#4CAF50",
-                                  annotation_text=f"推荐请客价: {pb_analysis.recommended_buy_pb}")
-                    fig.add_hline(y=pb_analysis.avg_pb, line_dash="dot", line_color="#9E9E9E",
-                                  annotation_text=f"平均值: {pb_analysis.avg_pb}")
-                    fig.update_layout(
-                        title=dict(text=f"{stock_info.name} 历史 PB 走势", font=dict(size=16)),
-                        xaxis_title="日期",
-                        yaxis_title="PB",
-                        height=350,
-                        margin=dict(l=0, r=0, t=40, b=0),
-                        plot_bgcolor='rgba(0,0,0,0)',
-                        paper_bgcolor='rgba(0,0,0,0)'
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
+                    # 同一分析结果重跑时复用已构建的图表，只有股票或数据变化才重建
+                    fig_key = (stock_info.code, len(pb_analysis.pb_history), pb_analysis.recommended_buy_pb)
+                    if st.session_state.get('pb_fig_key') != fig_key:
+                        # 仅在需要绘图时加载 plotly，浏览股票列表时不付出导入开销
+                        import plotly.graph_objects as go
+
+                        # 多年日线点数较多，降采样后再交给 Plotly
+                        dates, pbs = lttb_downsample(
+                            [d[0] for d in pb_analysis.pb_history if d[1] is not None],
+                            [d[1] for d in pb_analysis.pb_history if d[1] is not None]
+                        )
+
+                        fig = go.Figure()
+                        fig.add_trace(go.Scatter(x=dates, y=pbs, mode='lines', name='PB',
+                                                line=dict(color='#1E88E5', width=2)))
+                        fig.add_hline(y=pb_analysis.recommended_buy_pb, line_dash="dash", line_color="#4CAF50",
+                                      annotation_text=f"推荐请客价: {pb_analysis.recommended_buy_pb}")
+                        fig.add_hline(y=pb_analysis.avg_pb, line_dash="dot", line_color="#9E9E9E",
+                                      annotation_text=f"平均值: {pb_analysis.avg_pb}")
+                        fig.update_layout(
+                            title=dict(text=f"{stock_info.name} 历史 PB 走势", font=dict(size=16)),
+                            xaxis_title="日期",
+                            yaxis_title="PB",
+                            height=350,
+                            margin=dict(l=0, r=0, t=40, b=0),
+                            plot_bgcolor='rgba(0,0,0,0)',
+                            paper_bgcolor='rgba(0,0,0,0)'
+                        )
+                        st.session_state.pb_fig = fig
+                        st.session_state.pb_fig_key = fig_key
+
+                    st.plotly_chart(st.session_state.pb_fig, use_container_width=True)
 
                 st.info(f"""
                 **💡 推荐阈值** (基于历史分位数)
@@ -232,12 +244,16 @@ if st.session_state.analysis_result:
                     )
 
                     if pb_analysis and pb_analysis.pb_history:
-                        for pb_date, pb_value in pb_analysis.pb_history:
-                            try:
-                                valuation_service.save_valuation(asset_id=asset.id, val_date=pb_date, pb=pb_value, data_source="analysis")
-                            except Exception:
-                                pass
+                        try:
+                            valuation_service.bulk_save_valuations([
+                                {"asset_id": asset.id, "date": pb_date, "pb": pb_value, "data_source": "analysis"}
+                                for pb_date, pb_value in pb_analysis.pb_history
+                            ])
+                            load_pb_history.clear()
+                        except Exception as e:
+                            st.warning(f"历史PB数据保存失败: {e}")
 
+                    load_stock_pool.clear(user_id)
                     st.success(f"✅ 成功添加: {form_name} ({stock_info.code})")
                     st.session_state.analysis_result = None
                     st.rerun()
@@ -252,75 +268,95 @@ st.divider()
 # ==================== Stock List with Real-time Data ====================
 st.markdown("### 📋 股票列表")
 
-# Get stocks
-stocks = stock_service.get_all_stocks()
+# Get stocks（股票池及阈值取自缓存，增删改时已失效）
+stocks = load_stock_pool(user_id)
 
 if stocks:
+    import numpy as np
+    import pandas as pd
+
     # Fetch real-time data
     stock_codes = [s.code for s in stocks]
     with st.spinner("获取实时数据..."):
-        realtime_data = realtime_service.get_batch_quotes(stock_codes)
+        realtime_data = get_session_quotes(stock_codes)
 
     st.caption(f"📡 实时数据更新于: {datetime.now().strftime('%H:%M:%S')}")
 
-    # Build table data
-    data = []
+    # Build table data：单次遍历收集列数据，状态与距离用向量运算一次算出
+    # （保留数值列，格式化交给前端完成，支持点击列头排序）
+    codes, names, industries, competence_scores, ai_scores = [], [], [], [], []
+    prices, change_pcts, current_pbs, buy_pbs, sell_pbs = [], [], [], [], []
     for stock in stocks:
         quote = realtime_data.get(stock.code)
-        current_pb = quote.pb if quote else None
-        current_price = quote.price if quote else None
-        change_pct = quote.change_pct if quote else 0
-
-        threshold = stock.threshold
-        buy_pb = threshold.buy_pb if threshold else None
-
-        # Status
-        if current_pb and buy_pb:
-            if current_pb <= buy_pb:
-                status = "🟢 触发"
-            elif threshold.sell_pb and current_pb >= threshold.sell_pb:
-                status = "🔴 高估"
-            else:
-                status = "⚪ 监控"
-        else:
-            status = "❓"
-
-        # Distance
-        if current_pb and buy_pb:
-            distance = ((current_pb - buy_pb) / buy_pb) * 100
-            distance_str = f"{distance:+.1f}%"
-        else:
-            distance_str = "-"
-
-        data.append({
-            "状态": status,
-            "代码": stock.code,
-            "名称": stock.name,
-            "行业": stock.industry or "-",
-            "现价": f"{current_price:.2f}" if current_price else "-",
-            "涨跌": f"{change_pct:+.2f}%" if change_pct else "-",
-            "实时PB": f"{current_pb:.2f}" if current_pb else "-",
-            "请客价": f"{buy_pb:.2f}" if buy_pb else "-",
-            "距离": distance_str,
-            "关注指数": "⭐" * stock.competence_score,
-            "AI评分": (f"🤖 {stock.ai_score}分") if stock.ai_score else "-"
-        })
-
-    df = pd.DataFrame(data)
-    st.dataframe(df, use_container_width=True, hide_index=True, height=400)
+
+        codes.append(stock.code)
+        names.append(stock.name)
+        industries.append(stock.industry or "-")
+        competence_scores.append(stock.competence_score)
+        ai_scores.append(stock.ai_score)
+        prices.append(quote.price if quote else None)
+        change_pcts.append(quote.change_pct if quote else None)
+        # 0 / None 均视为缺失，转为 NaN 后不参与比较
+        current_pbs.append((quote.pb or None) if quote else None)
+        buy_pbs.append(stock.buy_pb or None)
+        sell_pbs.append(stock.sell_pb or None)
+
+    current_pbs = np.array(current_pbs, dtype=np.float64)
+    buy_pbs = np.array(buy_pbs, dtype=np.float64)
+    sell_pbs = np.array(sell_pbs, dtype=np.float64)
+
+    has_pb = ~np.isnan(current_pbs) & ~np.isnan(buy_pbs)
+    status = np.select(
+        [~has_pb, current_pbs <= buy_pbs, current_pbs >= sell_pbs],
+        ["❓", "🟢 触发", "🔴 高估"],
+        default="⚪ 监控"
+    )
+    distance = np.where(has_pb, (current_pbs - buy_pbs) / buy_pbs * 100, np.nan)
+
+    df = pd.DataFrame({
+        "状态": status,
+        "代码": codes,
+        "名称": names,
+        "行业": industries,
+        "现价": np.array(prices, dtype=np.float64),
+        "涨跌": np.array(change_pcts, dtype=np.float64),
+        "实时PB": current_pbs,
+        "请客价": buy_pbs,
+        "距离": distance,
+        "关注指数": competence_scores,
+        "AI评分": np.array(ai_scores, dtype=np.float64)
+    })
+
+    st.dataframe(
+        df,
+        use_container_width=True,
+        hide_index=True,
+        height=400,
+        column_config={
+            "现价": st.column_config.NumberColumn(format="%.2f"),
+            "涨跌": st.column_config.NumberColumn(format="%+.2f%%"),
+            "实时PB": st.column_config.NumberColumn(format="%.2f"),
+            "请客价": st.column_config.NumberColumn(format="%.2f"),
+            "距离": st.column_config.NumberColumn(format="%+.1f%%"),
+            "关注指数": st.column_config.NumberColumn(format="%d ⭐"),
+            "AI评分": st.column_config.NumberColumn(format="🤖 %d分")
+        }
+    )
 
     # Edit section
     st.divider()
     st.markdown("### ✏️ 编辑股票")
 
+    # 代码 -> 股票映射：下拉选项的显示名与选中后的取值都走字典查找
+    stocks_by_code = {s.code: s for s in stocks}
     selected_code = st.selectbox(
         "选择股票",
-        [s.code for s in stocks],
-        format_func=lambda x: f"{x} - {next((s.name for s in stocks if s.code == x), '')}"
+        list(stocks_by_code),
+        format_func=lambda x: f"{x} - {stocks_by_code[x].name}"
     )
 
     if selected_code:
-        stock = stock_service.get_stock(selected_code)
+        stock = stocks_by_code.get(selected_code)
         if stock:
             quote = realtime_data.get(stock.code)
 
@@ -352,13 +388,14 @@ if stocks:
 
                 if st.button("💾 保存评分", use_container_width=True, key="save_score"):
                     stock_service.update_stock(stock.code, competence_score=new_competence)
+                    load_stock_pool.clear(user_id)
                     st.success("评分已保存")
                     st.rerun()
 
             with col2:
                 st.markdown("**阈值设置**")
 
-                if stock.threshold:
+                if stock.has_threshold:
                     # 获取推荐阈值按钮
                     if st.button("📊 获取推荐阈值", use_container_width=True, key="get_recommended"):
                         with st.spinner("分析PB历史数据..."):
@@ -395,9 +432,9 @@ if stocks:
                         default_sell = recommended['sell_pb']
                         st.info(f"💡 使用推荐阈值: 请客价 {default_buy} / 加仓价 {default_add} / 退出价 {default_sell}")
                     else:
-                        default_buy = float(stock.threshold.buy_pb)
-                        default_add = float(stock.threshold.add_pb or 0.0)
-                        default_sell = float(stock.threshold.sell_pb or 0.0)
+                        default_buy = float(stock.buy_pb)
+                        default_add = float(stock.add_pb or 0.0)
+                        default_sell = float(stock.sell_pb or 0.0)
 
                     new_buy_pb = st.number_input("请客价", value=default_buy, min_value=0.01, step=0.01, key="edit_buy")
                     new_add_pb = st.number_input("加仓价", value=default_add, min_value=0.0, step=0.01, key="edit_add")
@@ -407,6 +444,7 @@ if stocks:
                         stock_service.update_threshold(stock.code, buy_pb=new_buy_pb,
                                                        add_pb=new_add_pb if new_add_pb > 0 else None,
                                                        sell_pb=new_sell_pb if new_sell_pb > 0 else None)
+                        load_stock_pool.clear(user_id)
                         # 清除推荐阈值缓存
                         st.session_state.edit_recommended_thresholds = None
                         st.success("已保存")
@@ -418,47 +456,74 @@ if stocks:
                     with st.spinner("获取数据..."):
                         pb_data = analyzer.fetch_pb_history(stock.code, years=5)
                         if pb_data:
-                            for d in pb_data:
-                                if d.get('pb'):
-                                    valuation_service.save_valuation(asset_id=stock.id, val_date=d['date'], pb=d['pb'], data_source="update")
-                            st.success(f"已更新 {len(pb_data)} 条数据")
+                            # 一次批量 upsert，替代逐条查询 + 提交
+                            saved = valuation_service.bulk_save_valuations([
+                                {"asset_id": stock.id, "date": d['date'], "pb": d['pb'], "data_source": "update"}
+                                for d in pb_data if d.get('pb')
+                            ])
+                            load_pb_history.clear()
+                            st.success(f"已更新 {saved} 条数据")
                         else:
                             st.warning("未获取到数据")
 
             with col2:
                 if st.button("🤖 更新AI评分", use_container_width=True):
-                    with st.spinner("AI分析中..."):
-                        try:
-                            ai_analyzer = AIAnalyzer()
-                            if ai_analyzer.last_error:
-                                st.error(ai_analyzer.last_error)
-                            else:
-                                fundamental = ai_analyzer.fetch_fundamental_data(stock.code)
-                                if fundamental:
-                                    pb_data = analyzer.fetch_pb_history(stock.code, years=5)
-                                    report = ai_analyzer.generate_analysis_report(
-                                        fundamental,
-                                        pb_history=pb_data,
-                                        threshold_buy=stock.threshold.buy_pb if stock.threshold else None
-                                    )
-                                    if report:
-                                        stock_service.update_stock(
-                                            stock.code,
-                                            ai_score=report.ai_score,
-                                            ai_suggestion=report.summary
+                    try:
+                        ai_analyzer = get_ai_analyzer()
+                        if ai_analyzer.init_error:
+                            st.error(ai_analyzer.init_error)
+                        else:
+                            with st.spinner("获取数据..."):
+                                # 基本面与历史PB互不依赖，并发获取
+                                with ThreadPoolExecutor(max_workers=2) as executor:
+                                    fundamental_future = executor.submit(ai_analyzer.fetch_fundamental_data, stock.code)
+                                    pb_future = executor.submit(analyzer.fetch_pb_history, stock.code, 5)
+                                    fundamental = fundamental_future.result()
+                                    pb_data = pb_future.result()
+
+                            if fundamental:
+                                # 后台线程请求模型，正文增量经队列交给 st.write_stream 实时显示
+                                deltas = queue.Queue()
+
+                                def run_report():
+                                    try:
+                                        report = ai_analyzer.generate_analysis_report(
+                                            fundamental,
+                                            pb_history=pb_data,
+                                            threshold_buy=stock.buy_pb,
+                                            on_delta=deltas.put
                                         )
-                                        st.success(f"AI评分已更新: {report.ai_score}分")
-                                        st.rerun()
-                                    else:
-                                        st.error(ai_analyzer.last_error or "AI分析失败")
+                                        # last_error 按线程记录，需在工作线程内读取
+                                        return report, ai_analyzer.last_error
+                                    finally:
+                                        deltas.put(None)
+
+                                with ThreadPoolExecutor(max_workers=1) as executor:
+                                    report_future = executor.submit(run_report)
+                                    with st.expander("AI 分析中...", expanded=True):
+                                        st.write_stream(iter(deltas.get, None))
+                                    report, error = report_future.result()
+
+                                if report:
+                                    stock_service.update_stock(
+                                        stock.code,
+                                        ai_score=report.ai_score,
+                                        ai_suggestion=report.summary
+                                    )
+                                    load_stock_pool.clear(user_id)
+                                    st.success(f"AI评分已更新: {report.ai_score}分")
+                                    st.rerun()
                                 else:
-                                    st.error("无法获取股票数据")
-                        except Exception as e:
-                            st.error(f"AI分析失败: {e}")
+                                    st.error(error or "AI分析失败")
+                            else:
+                                st.error("无法获取股票数据")
+                    except Exception as e:
+                        st.error(f"AI分析失败: {e}")
 
             with col3:
                 if st.button("🗑️ 删除股票", type="secondary", use_container_width=True):
                     stock_service.remove_stock(selected_code)
+                    load_stock_pool.clear(user_id)
                     st.success(f"已删除 {selected_code}")
                     st.rerun()
 else:
@@ -1,12 +1,13 @@
 """Dashboard page with real-time PB monitoring."""
 import streamlit as st
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
-from src.database import get_session, init_db
-from src.database.models import Asset, Signal, SignalStatus, PortfolioPosition
-from src.services import StockPoolService, SignalEngine, RealtimeService
+from src.database import get_scoped_session, init_db, session_scope
+from src.database.models import Signal, SignalStatus, PortfolioPosition
+from src.services import SignalEngine
+from src.services.cache_utils import load_stock_pool, get_session_quotes, clear_quotes_cache
 from src.ui import require_auth, render_auth_sidebar, get_current_user_id
 
 st.set_page_config(page_title="仪表盘 - 不败之地", page_icon="📊", layout="wide")
@@ -33,37 +34,44 @@ with col2:
     st.session_state.auto_refresh = auto_refresh
 
 with col3:
-    if st.button("🔄 刷新数据", use_container_width=True):
-        st.session_state.last_refresh = datetime.now()
-        st.rerun()
+    refresh_clicked = st.button("🔄 刷新数据", use_container_width=True)
 
 # Initialize services
 init_db()
-session = get_session()
+session = get_scoped_session()
 require_auth(session)
 user_id = get_current_user_id()
 with st.sidebar:
     render_auth_sidebar()
     st.divider()
 
-# Show last update time
-st.caption(f"📡 最后更新: {st.session_state.last_refresh.strftime('%Y-%m-%d %H:%M:%S')}")
-stock_service = StockPoolService(session, user_id)
+if refresh_clicked:
+    # 只清除当前用户的股票池缓存
+    st.session_state.last_refresh = datetime.now()
+    load_stock_pool.clear(user_id)
+    clear_quotes_cache()
+    st.rerun()
+
 signal_engine = SignalEngine(session, user_id)
-realtime_service = RealtimeService()
-
-# Get all stocks
-stocks = stock_service.get_all_stocks()
-stock_codes = [s.code for s in stocks]
-
-# Fetch real-time data
-if stock_codes:
-    with st.spinner("获取实时数据..."):
-        realtime_data = realtime_service.get_batch_quotes(stock_codes)
-        st.session_state.realtime_data = realtime_data
-        st.session_state.last_refresh = datetime.now()
-else:
-    realtime_data = {}
+
+# Get all stocks（缓存的普通记录，阈值已随股票预加载）
+stocks = load_stock_pool(user_id)
+# 只有设置了阈值的股票参与监控和信号检查
+monitored = [s for s in stocks if s.has_threshold]
+# 信号、持仓均属于股票池内的股票，直接按 ID 查表，避免逐条查询
+asset_map = {s.id: s for s in stocks}
+
+# 持仓只查询一次，顶部指标与持仓概览共用
+positions = session.query(PortfolioPosition).filter(
+    PortfolioPosition.position_pct > 0,
+    PortfolioPosition.user_id == user_id
+).all()
+
+# 只为监控股票和持仓股票获取行情；两者皆空时整批请求直接跳过
+stock_codes = sorted(
+    {s.code for s in monitored}
+    | {asset_map[p.asset_id].code for p in positions if p.asset_id in asset_map}
+)
 
 # Top metrics
 col1, col2, col3, col4 = st.columns(4)
@@ -76,10 +84,6 @@ with col2:
     st.metric("待处理信号", f"{len(open_signals)}")
 
 with col3:
-    positions = session.query(PortfolioPosition).filter(
-        PortfolioPosition.position_pct > 0,
-        PortfolioPosition.user_id == user_id
-    ).all()
     total_position = sum(p.position_pct for p in positions)
     st.metric("总仓位", f"{total_position:.1f}%")
 
@@ -88,221 +92,203 @@ with col4:
 
 st.divider()
 
-# Main content
-col_left, col_right = st.columns([1, 1])
-
-with col_left:
-    st.subheader("📈 实时监控")
-
-    if stocks and realtime_data:
-        monitoring_data = []
-
-        for stock in stocks:
-            if not stock.threshold:
-                continue
-
-            quote = realtime_data.get(stock.code)
-            current_pb = quote.pb if quote else None
-            current_price = quote.price if quote else None
-            change_pct = quote.change_pct if quote else 0
-
-            buy_threshold = stock.threshold.buy_pb
-
-            if current_pb:
-                distance = ((current_pb - buy_threshold) / buy_threshold) * 100
-
-                if current_pb <= buy_threshold:
-                    status = "🟢 触发买入"
-                    status_sort = 0
-                elif stock.threshold.add_pb and current_pb <= stock.threshold.add_pb:
-                    status = "🔵 触发加仓"
-                    status_sort = 1
-                elif stock.threshold.sell_pb and current_pb >= stock.threshold.sell_pb:
-                    status = "🔴 触发卖出"
-                    status_sort = 2
-                else:
-                    status = "⚪ 监控中"
-                    status_sort = 3
-            else:
-                distance = None
-                status = "❓ 无数据"
-                status_sort = 4
-
-            # Price change color
-            if change_pct > 0:
-                price_display = f"🔺 {current_price:.2f}" if current_price else "-"
-            elif change_pct < 0:
-                price_display = f"🔻 {current_price:.2f}" if current_price else "-"
+# 实时区块：自动刷新时只重跑行情相关的监控表和今日信号，
+# 持仓、图表等静态内容不随计时器重跑
+@st.fragment(run_every=REFRESH_INTERVAL if st.session_state.auto_refresh else None)
+def realtime_panel():
+    # Fetch real-time data（短 TTL 缓存：刷新间隔内的其他交互不再请求行情接口）
+    if stock_codes:
+        with st.spinner("获取实时数据..."):
+            realtime_data = get_session_quotes(stock_codes)
+            st.session_state.realtime_data = realtime_data
+            st.session_state.last_refresh = datetime.now()
+    else:
+        realtime_data = {}
+
+    # Show last update time
+    st.caption(f"📡 最后更新: {st.session_state.last_refresh.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    # 计时器触发的局部重跑发生在整页脚本结束之后，使用独立会话
+    with session_scope() as panel_session:
+        panel_engine = SignalEngine(panel_session, user_id)
+
+        # Main content
+        col_left, col_right = st.columns([1, 1])
+
+        with col_left:
+            st.subheader("📈 实时监控")
+
+            if not monitored:
+                st.info("请先在股票池中添加股票并设置阈值")
+            elif realtime_data:
+                # 列式构建：先取数值列，状态、距离、排序键均用向量运算得到
+                quotes = [realtime_data.get(s.code) for s in monitored]
+                current_pb = np.array([(q.pb or np.nan) if q else np.nan for q in quotes], dtype=np.float64)
+                current_price = np.array([q.price if q else np.nan for q in quotes], dtype=np.float64)
+                change_pct = np.array([q.change_pct if q else np.nan for q in quotes], dtype=np.float64)
+                buy_pb = np.array([s.buy_pb for s in monitored], dtype=np.float64)
+                add_pb = np.array([s.add_pb or np.nan for s in monitored], dtype=np.float64)
+                sell_pb = np.array([s.sell_pb or np.nan for s in monitored], dtype=np.float64)
+
+                status_sort = np.select(
+                    [np.isnan(current_pb), current_pb <= buy_pb, current_pb <= add_pb, current_pb >= sell_pb],
+                    [4, 0, 1, 2],
+                    default=3
+                )
+                status_labels = np.array(["🟢 触发买入", "🔵 触发加仓", "🔴 触发卖出", "⚪ 监控中", "❓ 无数据"])
+                distance = (current_pb - buy_pb) / buy_pb * 100
+
+                # Price change color
+                price_prefix = np.select([change_pct > 0, change_pct < 0], ["🔺 ", "🔻 "], default="")
+                price_display = pd.Series(price_prefix).str.cat(
+                    pd.Series(current_price).map("{:.2f}".format)
+                ).where(~np.isnan(current_price), "-")
+
+                df = pd.DataFrame({
+                    "_sort": status_sort,
+                    "状态": status_labels[status_sort],
+                    "股票": [s.name for s in monitored],
+                    "代码": [s.code for s in monitored],
+                    "现价": price_display,
+                    "涨跌": change_pct,
+                    "当前PB": current_pb,
+                    "请客价": buy_pb,
+                    "距离": distance
+                })
+
+                # Sort by status (triggered first), then by distance
+                df = df.sort_values(["_sort", "距离"], na_position="last", kind="stable").drop(columns="_sort")
+
+                # Style the dataframe
+                st.dataframe(
+                    df,
+                    use_container_width=True,
+                    hide_index=True,
+                    height=400,
+                    column_config={
+                        "涨跌": st.column_config.NumberColumn(format="%+.2f%%"),
+                        "当前PB": st.column_config.NumberColumn(format="%.2f"),
+                        "请客价": st.column_config.NumberColumn(format="%.2f"),
+                        "距离": st.column_config.NumberColumn(format="%+.1f%%")
+                    }
+                )
             else:
-                price_display = f"{current_price:.2f}" if current_price else "-"
-
-            monitoring_data.append({
-                "_sort": status_sort,
-                "状态": status,
-                "股票": stock.name,
-                "代码": stock.code,
-                "现价": price_display,
-                "涨跌": f"{change_pct:+.2f}%" if change_pct else "-",
-                "当前PB": f"{current_pb:.2f}" if current_pb else "-",
-                "请客价": f"{buy_threshold:.2f}",
-                "距离": f"{distance:+.1f}%" if distance is not None else "-"
-            })
+                st.info("无法获取实时数据")
 
-        if monitoring_data:
-            # Sort by status (triggered first)
-            monitoring_data.sort(key=lambda x: (x["_sort"], x.get("距离", "999")))
+        with col_right:
+            st.subheader("🔔 今日信号")
 
-            # Remove sort key for display
-            for item in monitoring_data:
-                del item["_sort"]
+            # Scan for new signals based on real-time data（一次批量检查）
+            new_signals_count = 0
+            if monitored and realtime_data:
+                new_signals_count = len(panel_engine.check_triggers_bulk(monitored, realtime_data))
 
-            df = pd.DataFrame(monitoring_data)
+            today_signals = panel_engine.get_today_signals()
 
-            # Style the dataframe
-            st.dataframe(
-                df,
-                use_container_width=True,
-                hide_index=True,
-                height=400
-            )
-        else:
-            st.info("请先在股票池中添加股票并设置阈值")
-    else:
-        st.info("股票池为空或无法获取数据")
-
-with col_right:
-    st.subheader("🔔 今日信号")
-
-    # Scan for new signals based on real-time data
-    new_signals_count = 0
-    if stocks and realtime_data:
-        for stock in stocks:
-            if not stock.threshold:
-                continue
-
-            quote = realtime_data.get(stock.code)
-            if quote and quote.pb:
-                # Check if signal should be triggered
-                signal = signal_engine.check_triggers(stock)
-                if signal:
-                    new_signals_count += 1
-
-    today_signals = signal_engine.get_today_signals()
-
-    if today_signals:
-        for signal in today_signals:
-            asset = session.query(Asset).filter(
-                Asset.id == signal.asset_id,
-                Asset.user_id == user_id
-            ).first()
-            if asset:
-                quote = realtime_data.get(asset.code)
-
-                with st.container():
-                    status_icon = "🟢" if signal.status == SignalStatus.OPEN else "✅"
-                    signal_icon = {"BUY": "🟢", "ADD": "🔵", "SELL": "🔴"}.get(signal.signal_type.value, "⚪")
-
-                    col1, col2 = st.columns([3, 1])
-
-                    with col1:
-                        st.markdown(f"**{status_icon} {asset.name}** ({asset.code})")
-                        st.markdown(f"{signal_icon} **{signal.signal_type.value}** | PB: {signal.pb:.2f}")
-
-                        if quote:
-                            realtime_pb = quote.pb
-                            if realtime_pb:
-                                st.caption(f"实时PB: {realtime_pb:.2f} | 价格: {quote.price:.2f}")
-
-                    with col2:
-                        if signal.status == SignalStatus.OPEN:
-                            st.markdown("**待处理**")
-
-                    st.divider()
-    else:
-        st.info("今日暂无信号")
-
-    if st.button("🔍 扫描信号", use_container_width=True):
-        with st.spinner("扫描中..."):
-            new_signals = signal_engine.scan_all_stocks()
-            if new_signals:
-                st.success(f"发现 {len(new_signals)} 个新信号!")
-                st.rerun()
+            if today_signals:
+                for signal in today_signals:
+                    asset = asset_map.get(signal.asset_id)
+                    if asset:
+                        quote = realtime_data.get(asset.code)
+
+                        with st.container():
+                            status_icon = "🟢" if signal.status == SignalStatus.OPEN else "✅"
+                            signal_icon = {"BUY": "🟢", "ADD": "🔵", "SELL": "🔴"}.get(signal.signal_type.value, "⚪")
+
+                            col1, col2 = st.columns([3, 1])
+
+                            with col1:
+                                st.markdown(f"**{status_icon} {asset.name}** ({asset.code})")
+                                st.markdown(f"{signal_icon} **{signal.signal_type.value}** | PB: {signal.pb:.2f}")
+
+                                if quote:
+                                    realtime_pb = quote.pb
+                                    if realtime_pb:
+                                        st.caption(f"实时PB: {realtime_pb:.2f} | 价格: {quote.price:.2f}")
+
+                            with col2:
+                                if signal.status == SignalStatus.OPEN:
+                                    st.markdown("**待处理**")
+
+                            st.divider()
             else:
-                st.info("未发现新信号")
+                st.info("今日暂无信号")
+
+            if st.button("🔍 扫描信号", use_container_width=True):
+                with st.spinner("扫描中..."):
+                    new_signals = panel_engine.scan_all_stocks()
+                    if new_signals:
+                        st.success(f"发现 {len(new_signals)} 个新信号!")
+                        st.rerun()
+                    else:
+                        st.info("未发现新信号")
+
+
+realtime_panel()
 
 st.divider()
 
 # Portfolio section
 st.subheader("💼 持仓概览")
 
-positions = session.query(PortfolioPosition).filter(
-    PortfolioPosition.position_pct > 0,
-    PortfolioPosition.user_id == user_id
-).all()
+# 持仓表沿用实时区块本轮获取的行情
+realtime_data = st.session_state.realtime_data
 
 if positions:
     col1, col2 = st.columns([1, 1])
 
-    with col1:
-        portfolio_data = []
-        total_value_change = 0
-
-        for pos in positions:
-            asset = session.query(Asset).filter(
-                Asset.id == pos.asset_id,
-                Asset.user_id == user_id
-            ).first()
-            if asset:
-                quote = realtime_data.get(asset.code)
-                current_price = quote.price if quote else None
-                change_pct = quote.change_pct if quote else 0
-                current_pb = quote.pb if quote else None
-
-                # Calculate P&L if we have cost basis
-                if pos.avg_cost and current_price:
-                    pnl_pct = ((current_price - pos.avg_cost) / pos.avg_cost) * 100
-                else:
-                    pnl_pct = None
-
-                portfolio_data.append({
-                    "股票": asset.name,
-                    "仓位": f"{pos.position_pct:.1f}%",
-                    "现价": f"{current_price:.2f}" if current_price else "-",
-                    "成本": f"{pos.avg_cost:.2f}" if pos.avg_cost else "-",
-                    "盈亏": f"{pnl_pct:+.1f}%" if pnl_pct is not None else "-",
-                    "今日": f"{change_pct:+.2f}%" if change_pct else "-",
-                    "PB": f"{current_pb:.2f}" if current_pb else "-"
-                })
+    # 持仓、股票、行情一次配对，持仓表和饼图共用
+    held = [(pos, asset_map[pos.asset_id]) for pos in positions if pos.asset_id in asset_map]
+    quotes = [realtime_data.get(asset.code) for _, asset in held]
+    position_pct = [pos.position_pct for pos, _ in held]
+    names = [asset.name for _, asset in held]
 
-        if portfolio_data:
-            df = pd.DataFrame(portfolio_data)
-            st.dataframe(df, use_container_width=True, hide_index=True)
+    with col1:
+        if held:
+            current_price = np.array([(q.price or np.nan) if q else np.nan for q in quotes], dtype=np.float64)
+            avg_cost = np.array([pos.avg_cost or np.nan for pos, _ in held], dtype=np.float64)
+            # Calculate P&L if we have cost basis：成本缺失或非正时记为 NaN，不产生 inf
+            pnl = np.divide(
+                current_price - avg_cost, avg_cost,
+                out=np.full_like(avg_cost, np.nan), where=avg_cost > 0
+            ) * 100
+
+            df = pd.DataFrame({
+                "股票": names,
+                "仓位": position_pct,
+                "现价": current_price,
+                "成本": avg_cost,
+                "盈亏": pnl,
+                "今日": np.array([q.change_pct if q else np.nan for q in quotes], dtype=np.float64),
+                "PB": np.array([(q.pb or np.nan) if q else np.nan for q in quotes], dtype=np.float64)
+            })
+            st.dataframe(
+                df,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "仓位": st.column_config.NumberColumn(format="%.1f%%"),
+                    "现价": st.column_config.NumberColumn(format="%.2f"),
+                    "成本": st.column_config.NumberColumn(format="%.2f"),
+                    "盈亏": st.column_config.NumberColumn(format="%+.1f%%"),
+                    "今日": st.column_config.NumberColumn(format="%+.2f%%"),
+                    "PB": st.column_config.NumberColumn(format="%.2f")
+                }
+            )
 
     with col2:
-        # Pie chart
-        chart_data = []
-        for pos in positions:
-            asset = session.query(Asset).filter(
-                Asset.id == pos.asset_id,
-                Asset.user_id == user_id
-            ).first()
-            if asset:
-                chart_data.append({"名称": asset.name, "仓位": pos.position_pct})
-
-        cash_pct = 100 - sum(p.position_pct for p in positions)
-        chart_data.append({"名称": "现金", "仓位": cash_pct})
-
-        fig = px.pie(chart_data, values="仓位", names="名称", hole=0.4)
-        fig.update_traces(textposition='inside', textinfo='percent+label')
+        # Pie chart：直接传入标签/数值列表，避免 px.pie 构造 DataFrame 和校验
+        labels = names + ["现金"]
+        values = position_pct + [100 - sum(p.position_pct for p in positions)]
+
+        fig = go.Figure(data=[go.Pie(
+            labels=labels, values=values, hole=0.4,
+            textposition="inside", textinfo="percent+label"
+        )])
         fig.update_layout(margin=dict(l=0, r=0, t=0, b=0), height=300)
-        st.plotly_chart(fig, use_container_width=True)
+        # 纯展示图表，静态渲染省去交互初始化
+        st.plotly_chart(fig, use_container_width=True, config={"staticPlot": True})
 else:
     st.info("暂无持仓")
 
 session.close()
-
-# Auto-refresh logic
-if st.session_state.auto_refresh:
-    import time
-    time.sleep(REFRESH_INTERVAL)
-    st.rerun()
@@ -2,8 +2,8 @@
 import streamlit as st
 import pandas as pd
 from datetime import date
-from src.database import get_session, init_db
-from src.database.models import Asset, Signal, SignalStatus, ActionType
+from src.database import get_scoped_session, init_db
+from src.database.models import Signal, SignalStatus, ActionType
 from src.services import SignalEngine, ActionService, RiskControl
 from src.ui import require_auth, render_auth_sidebar, get_current_user_id
 
@@ -11,7 +11,7 @@ st.set_page_config(page_title="信号中心 - 不败之地", page_icon="🔔", l
 st.title("🔔 信号中心")
 
 init_db()
-session = get_session()
+session = get_scoped_session()
 require_auth(session)
 user_id = get_current_user_id()
 with st.sidebar:
@@ -21,169 +21,211 @@ signal_engine = SignalEngine(session, user_id)
 action_service = ActionService(session, user_id)
 risk_control = RiskControl(session, user_id)
 
+SIGNAL_NUMBER_COLUMNS = {
+    "PB": st.column_config.NumberColumn(format="%.2f"),
+    "阈值": st.column_config.NumberColumn(format="%.2f")
+}
+
+
+def render_signal_table(signals):
+    """已处理/已忽略信号表：数值列保持 float，由 column_config 负责格式化"""
+    assets = [signal.asset for signal in signals]
+    df = pd.DataFrame({
+        "日期": [signal.date for signal in signals],
+        "股票": [asset.name if asset else "-" for asset in assets],
+        "代码": [asset.code if asset else "-" for asset in assets],
+        "类型": [signal.signal_type.value for signal in signals],
+        "PB": [signal.pb for signal in signals],
+        "阈值": [signal.triggered_threshold for signal in signals]
+    })
+    st.dataframe(df, use_container_width=True, hide_index=True, column_config=SIGNAL_NUMBER_COLUMNS)
+
+
 # Tabs for different signal views
 tab1, tab2, tab3 = st.tabs(["待处理", "已处理", "已忽略"])
 
 with tab1:
-    open_signals = signal_engine.get_signals_by_status(SignalStatus.OPEN)
-
-    # 过滤：只显示关注指数评分 >= 4 的股票
-    filtered_signals = []
-    for signal in open_signals:
-        asset = session.query(Asset).filter(
-            Asset.id == signal.asset_id,
-            Asset.user_id == user_id
-        ).first()
-        if asset and asset.competence_score and asset.competence_score >= 4:
-            filtered_signals.append((signal, asset))
+    # 过滤：只显示关注指数评分 >= 4 的股票（在 SQL 中联表过滤）
+    filtered_signals = signal_engine.get_signals_with_assets(SignalStatus.OPEN, min_competence=4)
+    open_count = signal_engine.count_signals_by_status(SignalStatus.OPEN)
 
     if filtered_signals:
         # 显示过滤提示
-        if len(filtered_signals) < len(open_signals):
-            st.caption(f"💡 仅显示关注指数评分 ≥ 4⭐ 的股票信号 ({len(filtered_signals)}/{len(open_signals)})")
+        if len(filtered_signals) < open_count:
+            st.caption(f"💡 仅显示关注指数评分 ≥ 4⭐ 的股票信号 ({len(filtered_signals)}/{open_count})")
 
-        for signal, asset in filtered_signals:
-            with st.expander(f"🔔 {asset.name} ({asset.code}) - {signal.signal_type.value} | 关注指数: {'⭐' * asset.competence_score}", expanded=True):
-                # Signal info
-                col1, col2 = st.columns([2, 1])
+        # 列表只展示摘要，完整的执行表单只为选中的一条信号渲染
+        signal_map = {signal.id: (signal, asset) for signal, asset in filtered_signals}
+        st.dataframe(
+            pd.DataFrame({
+                "日期": [signal.date for signal, _ in filtered_signals],
+                "股票": [asset.name for _, asset in filtered_signals],
+                "代码": [asset.code for _, asset in filtered_signals],
+                "类型": [signal.signal_type.value for signal, _ in filtered_signals],
+                "PB": [signal.pb for signal, _ in filtered_signals],
+                "阈值": [signal.triggered_threshold for signal, _ in filtered_signals],
+                "关注指数": ['⭐' * asset.competence_score for _, asset in filtered_signals]
+            }),
+            use_container_width=True,
+            hide_index=True,
+            column_config=SIGNAL_NUMBER_COLUMNS
+        )
 
-                with col1:
-                    st.markdown(f"**信号类型:** {signal.signal_type.value}")
-                    st.markdown(f"**触发日期:** {signal.date}")
-                    st.markdown(f"**当前 PB:** {signal.pb:.2f}")
-                    st.markdown(f"**触发阈值:** {signal.triggered_threshold:.2f}")
-                    st.markdown(f"**解释:** {signal.explanation}")
+        # 已处理的信号不在列表中时回到第一条
+        if st.session_state.get("active_signal") not in signal_map:
+            st.session_state.active_signal = filtered_signals[0][0].id
 
-                with col2:
-                    # Risk info
-                    available = risk_control.get_available_position(asset.id)
-                    st.metric("可用仓位", f"{available:.1f}%")
+        active_id = st.selectbox(
+            "处理中信号",
+            options=list(signal_map),
+            format_func=lambda sid: f"{signal_map[sid][1].name} ({signal_map[sid][1].code}) - {signal_map[sid][0].signal_type.value}",
+            key="active_signal"
+        )
+        signal, asset = signal_map[active_id]
 
-                st.divider()
+        with st.container(border=True):
+            st.markdown(f"#### 🔔 {asset.name} ({asset.code}) - {signal.signal_type.value} | 关注指数: {'⭐' * asset.competence_score}")
 
-                # Action form
-                st.markdown("**执行动作**")
+            # Signal info
+            col1, col2 = st.columns([2, 1])
 
-                action_type = st.radio(
-                    "选择动作",
-                    options=["BUY", "ADD", "HOLD", "SELL"],
-                    horizontal=True,
-                    key=f"action_{signal.id}"
-                )
+            with col1:
+                st.markdown(f"**信号类型:** {signal.signal_type.value}")
+                st.markdown(f"**触发日期:** {signal.date}")
+                st.markdown(f"**当前 PB:** {signal.pb:.2f}")
+                st.markdown(f"**触发阈值:** {signal.triggered_threshold:.2f}")
+                st.markdown(f"**解释:** {signal.explanation}")
 
-                col1, col2 = st.columns(2)
+            with col2:
+                # Risk info
+                available = risk_control.get_available_position(asset.id)
+                st.metric("可用仓位", f"{available:.1f}%")
 
-                with col1:
-                    if action_type in ["BUY", "ADD"]:
-                        position_pct = st.number_input(
-                            "买入仓位 (%)",
-                            min_value=0.0,
-                            max_value=10.0,
-                            value=float(min(5.0, available)),
-                            step=0.5,
-                            key=f"position_{signal.id}"
-                        )
-                    elif action_type == "SELL":
-                        # Get current position
-                        from src.database.models import PortfolioPosition
-                        pos = session.query(PortfolioPosition).filter(
-                            PortfolioPosition.asset_id == asset.id
-                        ).first()
-                        current_pos = float(pos.position_pct) if pos and pos.position_pct else 0.0
-
-                        position_pct = st.number_input(
-                            "卖出仓位 (%)",
-                            min_value=0.0,
-                            max_value=max(0.01, current_pos),
-                            value=current_pos,
-                            step=0.5,
-                            key=f"position_{signal.id}"
-                        )
-                    else:
-                        position_pct = 0
+            st.divider()
+
+            # Action form
+            st.markdown("**执行动作**")
+
+            action_type = st.radio(
+                "选择动作",
+                options=["BUY", "ADD", "HOLD", "SELL"],
+                horizontal=True,
+                key=f"action_{signal.id}"
+            )
+
+            col1, col2 = st.columns(2)
 
-                    price = st.number_input(
-                        "成交价格 (可选)",
+            with col1:
+                if action_type in ["BUY", "ADD"]:
+                    position_pct = st.number_input(
+                        "买入仓位 (%)",
                         min_value=0.0,
-                        value=0.0,
-                        step=0.01,
-                        key=f"price_{signal.id}"
+                        max_value=10.0,
+                        value=float(min(5.0, available)),
+                        step=0.5,
+                        key=f"position_{signal.id}"
                     )
+                elif action_type == "SELL":
+                    # Get current position
+                    from src.database.models import PortfolioPosition
+                    pos = session.query(PortfolioPosition).filter(
+                        PortfolioPosition.asset_id == asset.id
+                    ).first()
+                    current_pos = float(pos.position_pct) if pos and pos.position_pct else 0.0
 
-                with col2:
-                    emotion = st.selectbox(
-                        "当前情绪 (可选)",
-                        options=["", "理性", "恐惧", "贪婪", "犹豫", "兴奋", "焦虑"],
-                        key=f"emotion_{signal.id}"
+                    position_pct = st.number_input(
+                        "卖出仓位 (%)",
+                        min_value=0.0,
+                        max_value=max(0.01, current_pos),
+                        value=current_pos,
+                        step=0.5,
+                        key=f"position_{signal.id}"
                     )
+                else:
+                    position_pct = 0
 
-                reason = st.text_area(
-                    "交易理由 (必填)",
-                    placeholder="请说明为什么执行此动作，至少5个字符",
-                    key=f"reason_{signal.id}"
+                price = st.number_input(
+                    "成交价格 (可选)",
+                    min_value=0.0,
+                    value=0.0,
+                    step=0.01,
+                    key=f"price_{signal.id}"
                 )
 
-                # Cost inputs
-                with st.expander("交易成本 (可选)"):
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        fee = st.number_input("手续费", min_value=0.0, value=0.0, key=f"fee_{signal.id}")
-                    with col2:
-                        tax = st.number_input("印花税", min_value=0.0, value=0.0, key=f"tax_{signal.id}")
-                    with col3:
-                        slippage = st.number_input("滑点", min_value=0.0, value=0.0, key=f"slippage_{signal.id}")
-
-                # Force execute option
-                force_execute = st.checkbox("强制执行 (如果超出仓位限制)", key=f"force_{signal.id}")
-                force_reason = ""
-                if force_execute:
-                    force_reason = st.text_input("强制执行原因", key=f"force_reason_{signal.id}")
-
-                # Action buttons
-                col1, col2 = st.columns(2)
+            with col2:
+                emotion = st.selectbox(
+                    "当前情绪 (可选)",
+                    options=["", "理性", "恐惧", "贪婪", "犹豫", "兴奋", "焦虑"],
+                    key=f"emotion_{signal.id}"
+                )
 
-                with col1:
-                    if st.button("✅ 执行动作", key=f"execute_{signal.id}", type="primary"):
-                        if not reason or len(reason.strip()) < 5:
-                            st.error("请填写交易理由（至少5个字符）")
-                        else:
-                            try:
-                                action_enum = ActionType[action_type]
-                                action, message = action_service.execute_action(
-                                    asset_id=asset.id,
-                                    action_type=action_enum,
-                                    planned_position_pct=position_pct,
-                                    reason=reason,
-                                    signal_id=signal.id,
-                                    price=price if price > 0 else None,
-                                    emotion=emotion if emotion else None,
-                                    force_execute=force_execute,
-                                    force_reason=force_reason if force_execute else None,
-                                    fee=fee,
-                                    tax=tax,
-                                    slippage=slippage
-                                )
-                                st.success(message)
-                                st.rerun()
-                            except ValueError as e:
-                                st.error(str(e))
-                            except Exception as e:
-                                st.error(f"执行失败: {e}")
+            reason = st.text_area(
+                "交易理由 (必填)",
+                placeholder="请说明为什么执行此动作，至少5个字符",
+                key=f"reason_{signal.id}"
+            )
 
+            # Cost inputs
+            with st.expander("交易成本 (可选)"):
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    fee = st.number_input("手续费", min_value=0.0, value=0.0, key=f"fee_{signal.id}")
                 with col2:
-                    if st.button("⏭️ 忽略信号", key=f"ignore_{signal.id}"):
-                        if not reason or len(reason.strip()) < 5:
-                            st.error("请填写忽略原因（至少5个字符）")
-                        else:
-                            try:
-                                action_service.ignore_signal(signal.id, reason)
-                                st.success("信号已忽略")
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"操作失败: {e}")
+                    tax = st.number_input("印花税", min_value=0.0, value=0.0, key=f"tax_{signal.id}")
+                with col3:
+                    slippage = st.number_input("滑点", min_value=0.0, value=0.0, key=f"slippage_{signal.id}")
+
+            # Force execute option
+            force_execute = st.checkbox("强制执行 (如果超出仓位限制)", key=f"force_{signal.id}")
+            force_reason = ""
+            if force_execute:
+                force_reason = st.text_input("强制执行原因", key=f"force_reason_{signal.id}")
+
+            # Action buttons
+            col1, col2 = st.columns(2)
+
+            with col1:
+                if st.button("✅ 执行动作", key=f"execute_{signal.id}", type="primary"):
+                    if not reason or len(reason.strip()) < 5:
+                        st.error("请填写交易理由（至少5个字符）")
+                    else:
+                        try:
+                            action_enum = ActionType[action_type]
+                            action, message = action_service.execute_action(
+                                asset_id=asset.id,
+                                action_type=action_enum,
+                                planned_position_pct=position_pct,
+                                reason=reason,
+                                signal_id=signal.id,
+                                price=price if price > 0 else None,
+                                emotion=emotion if emotion else None,
+                                force_execute=force_execute,
+                                force_reason=force_reason if force_execute else None,
+                                fee=fee,
+                                tax=tax,
+                                slippage=slippage
+                            )
+                            st.success(message)
+                            st.rerun()
+                        except ValueError as e:
+                            st.error(str(e))
+                        except Exception as e:
+                            st.error(f"执行失败: {e}")
+
+            with col2:
+                if st.button("⏭️ 忽略信号", key=f"ignore_{signal.id}"):
+                    if not reason or len(reason.strip()) < 5:
+                        st.error("请填写忽略原因（至少5个字符）")
+                    else:
+                        try:
+                            action_service.ignore_signal(signal.id, reason)
+                            st.success("信号已忽略")
+                            st.rerun()
+                        except Exception as e:
+                            st.error(f"操作失败: {e}")
     else:
-        if open_signals:
-            st.info(f"有 {len(open_signals)} 个信号，但均为关注指数评分 < 4⭐ 的股票，已过滤")
+        if open_count:
+            st.info(f"有 {open_count} 个信号，但均为关注指数评分 < 4⭐ 的股票，已过滤")
         else:
             st.info("暂无待处理信号")
 
@@ -194,10 +236,7 @@ with tab1:
                     # 统计高评分信号数量
                     high_score_count = 0
                     for sig in new_signals:
-                        a = session.query(Asset).filter(
-                            Asset.id == sig.asset_id,
-                            Asset.user_id == user_id
-                        ).first()
+                        a = sig.asset
                         if a and a.competence_score and a.competence_score >= 4:
                             high_score_count += 1
                     st.success(f"发现 {len(new_signals)} 个新信号，其中 {high_score_count} 个来自高评分股票!")
@@ -209,23 +248,7 @@ with tab2:
     done_signals = signal_engine.get_signals_by_status(SignalStatus.DONE)
 
     if done_signals:
-        data = []
-        for signal in done_signals:
-            asset = session.query(Asset).filter(
-                Asset.id == signal.asset_id,
-                Asset.user_id == user_id
-            ).first()
-            data.append({
-                "日期": signal.date,
-                "股票": asset.name if asset else "-",
-                "代码": asset.code if asset else "-",
-                "类型": signal.signal_type.value,
-                "PB": f"{signal.pb:.2f}",
-                "阈值": f"{signal.triggered_threshold:.2f}"
-            })
-
-        df = pd.DataFrame(data)
-        st.dataframe(df, use_container_width=True, hide_index=True)
+        render_signal_table(done_signals)
     else:
         st.info("暂无已处理信号")
 
@@ -233,23 +256,7 @@ with tab3:
     ignored_signals = signal_engine.get_signals_by_status(SignalStatus.IGNORED)
 
     if ignored_signals:
-        data = []
-        for signal in ignored_signals:
-            asset = session.query(Asset).filter(
-                Asset.id == signal.asset_id,
-                Asset.user_id == user_id
-            ).first()
-            data.append({
-                "日期": signal.date,
-                "股票": asset.name if asset else "-",
-                "代码": asset.code if asset else "-",
-                "类型": signal.signal_type.value,
-                "PB": f"{signal.pb:.2f}",
-                "阈值": f"{signal.triggered_threshold:.2f}"
-            })
-
-        df = pd.DataFrame(data)
-        st.dataframe(df, use_container_width=True, hide_index=True)
+        render_signal_table(ignored_signals)
     else:
         st.info("暂无已忽略信号")
 
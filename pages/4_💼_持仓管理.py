@@ -1,18 +1,18 @@
 """Portfolio management page."""
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
-from src.database import get_session, init_db
+from sqlalchemy.orm import selectinload
+from src.database import get_scoped_session, init_db
 from src.database.models import Asset, PortfolioPosition, Action
 from src.services import RiskControl, ActionService
-from src.ui import require_auth, render_auth_sidebar, get_current_user_id
+from src.ui import require_auth, render_auth_sidebar, get_current_user_id, truncate_text
 
 st.set_page_config(page_title="持仓管理 - 不败之地", page_icon="💼", layout="wide")
 st.title("💼 持仓管理")
 
 init_db()
-session = get_session()
+session = get_scoped_session()
 require_auth(session)
 user_id = get_current_user_id()
 with st.sidebar:
@@ -43,36 +43,34 @@ col_left, col_right = st.columns([1, 1])
 with col_left:
     st.subheader("持仓明细")
 
-    positions = session.query(PortfolioPosition).filter(
+    # 持仓对应的股票随持仓一并预加载
+    positions = session.query(PortfolioPosition).options(
+        selectinload(PortfolioPosition.asset)
+    ).filter(
         PortfolioPosition.position_pct > 0,
         PortfolioPosition.user_id == user_id
     ).all()
 
     if positions:
-        data = []
-        for pos in positions:
-            asset = session.query(Asset).filter(
-                Asset.id == pos.asset_id,
-                Asset.user_id == user_id
-            ).first()
-            if asset:
-                data.append({
-                    "股票": asset.name,
-                    "代码": asset.code,
-                    "仓位(%)": pos.position_pct,
-                    "持股数": pos.shares or 0,
-                    "成本": pos.avg_cost or 0,
-                    "更新时间": pos.updated_at.strftime("%Y-%m-%d %H:%M") if pos.updated_at else "-"
-                })
-
-        df = pd.DataFrame(data)
+        held = [pos for pos in positions if pos.asset]
+        # 数值列保持 float，由 column_config 负责格式化
+        df = pd.DataFrame({
+            "股票": [pos.asset.name for pos in held],
+            "代码": [pos.asset.code for pos in held],
+            "仓位(%)": pd.Series([pos.position_pct for pos in held], dtype="float64"),
+            "持股数": [pos.shares or 0 for pos in held],
+            "成本": pd.Series([pos.avg_cost for pos in held], dtype="float64"),
+            "更新时间": [pos.updated_at for pos in held]
+        })
         st.dataframe(
-            df.style.format({
-                "仓位(%)": "{:.1f}",
-                "成本": "{:.2f}"
-            }),
+            df,
             use_container_width=True,
-            hide_index=True
+            hide_index=True,
+            column_config={
+                "仓位(%)": st.column_config.NumberColumn(format="%.1f"),
+                "成本": st.column_config.NumberColumn(format="%.2f"),
+                "更新时间": st.column_config.DatetimeColumn(format="YYYY-MM-DD HH:mm")
+            }
         )
     else:
         st.info("暂无持仓")
@@ -81,39 +79,26 @@ with col_right:
     st.subheader("仓位分布")
 
     if positions:
-        chart_data = []
+        labels, values = [], []
         for pos in positions:
-            asset = session.query(Asset).filter(
-                Asset.id == pos.asset_id,
-                Asset.user_id == user_id
-            ).first()
+            asset = pos.asset
             if asset:
-                chart_data.append({
-                    "名称": asset.name,
-                    "仓位": pos.position_pct
-                })
+                labels.append(asset.name)
+                values.append(pos.position_pct)
 
         # Add cash
-        cash_pct = 100 - sum(p.position_pct for p in positions)
-        chart_data.append({"名称": "现金", "仓位": cash_pct})
-
-        fig = px.pie(
-            chart_data,
-            values="仓位",
-            names="名称",
-            hole=0.4
-        )
-        fig.update_traces(textposition='inside', textinfo='percent+label')
-        st.plotly_chart(fig, use_container_width=True)
+        labels.append("现金")
+        values.append(100 - sum(p.position_pct for p in positions))
+
+        fig = go.Figure(data=[go.Pie(
+            labels=labels, values=values, hole=0.4,
+            textposition="inside", textinfo="percent+label"
+        )])
+        st.plotly_chart(fig, use_container_width=True, config={"staticPlot": True})
     else:
         # Show 100% cash
-        fig = px.pie(
-            [{"名称": "现金", "仓位": 100}],
-            values="仓位",
-            names="名称",
-            hole=0.4
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        fig = go.Figure(data=[go.Pie(labels=["现金"], values=[100], hole=0.4)])
+        st.plotly_chart(fig, use_container_width=True, config={"staticPlot": True})
 
 st.divider()
 
@@ -123,24 +108,29 @@ st.subheader("最近交易记录")
 recent_actions = action_service.get_recent_actions(limit=20)
 
 if recent_actions:
-    action_data = []
-    for action in recent_actions:
-        asset = session.query(Asset).filter(
-            Asset.id == action.asset_id,
-            Asset.user_id == user_id
-        ).first()
-        action_data.append({
-            "日期": action.action_date,
-            "股票": asset.name if asset else "-",
-            "动作": action.action_type.value,
-            "仓位变动(%)": action.executed_position_pct or 0,
-            "价格": action.price or "-",
-            "合规": "✅" if action.rule_compliance else "❌",
-            "理由": action.reason[:30] + "..." if len(action.reason) > 30 else action.reason
-        })
-
-    df = pd.DataFrame(action_data)
-    st.dataframe(df, use_container_width=True, hide_index=True)
+    assets = [a.asset for a in recent_actions]
+
+    # 列式构建，数值列保持 float，由 column_config 在前端格式化
+    df = pd.DataFrame({
+        "日期": [a.action_date for a in recent_actions],
+        "股票": [asset.name if asset else "-" for asset in assets],
+        "动作": [a.action_type.value for a in recent_actions],
+        "仓位变动(%)": [a.executed_position_pct or 0 for a in recent_actions],
+        "价格": pd.Series([a.price for a in recent_actions], dtype="float64"),
+        "合规": ["✅" if a.rule_compliance else "❌" for a in recent_actions],
+        "理由": truncate_text([a.reason for a in recent_actions], 30)
+    })
+
+    st.dataframe(
+        df,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "日期": st.column_config.DateColumn(),
+            "仓位变动(%)": st.column_config.NumberColumn(format="%+.1f"),
+            "价格": st.column_config.NumberColumn(format="%.2f")
+        }
+    )
 else:
     st.info("暂无交易记录")
 
@@ -163,15 +153,14 @@ with col3:
     st.metric("合规率", f"{rate:.1f}%")
 
 if compliance['violations']:
-    st.warning(f"近90天有 {len(compliance['violations'])} 次违规操作")
+    st.warning(f"近90天有 {compliance['violation_count']} 次违规操作")
 
     with st.expander("查看违规详情"):
-        for v in compliance['violations']:
-            asset = session.query(Asset).filter(
-                Asset.id == v['asset_id'],
-                Asset.user_id == user_id
-            ).first()
-            st.markdown(f"- **{v['date']}** {asset.name if asset else '-'} ({v['type']}): {v['note']}")
+        # 违规条目拼成一个列表，一次 st.markdown 输出
+        st.markdown("\n".join(
+            f"- **{v['date']}** {v['asset_name'] or '-'} ({v['type']}): {v['note']}"
+            for v in compliance['violations']
+        ))
 
 st.divider()
 
@@ -181,14 +170,16 @@ with st.expander("⚙️ 手动调整仓位"):
 
     stocks = session.query(Asset).filter(Asset.user_id == user_id).all()
     if stocks:
+        # 代码 -> 股票映射：下拉选项的显示名与选中后的取值都走字典查找
+        stocks_by_code = {s.code: s for s in stocks}
         selected_code = st.selectbox(
             "选择股票",
-            options=[s.code for s in stocks],
-            format_func=lambda x: f"{x} - {next((s.name for s in stocks if s.code == x), '')}"
+            options=list(stocks_by_code),
+            format_func=lambda x: f"{x} - {stocks_by_code[x].name}"
         )
 
         if selected_code:
-            asset = next((s for s in stocks if s.code == selected_code), None)
+            asset = stocks_by_code.get(selected_code)
             if asset:
                 pos = session.query(PortfolioPosition).filter(
                     PortfolioPosition.asset_id == asset.id,
@@ -1,12 +1,16 @@
 """Stock detail page with PB history chart."""
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 from datetime import date, timedelta
-from src.database import get_session, init_db
-from src.database.models import Asset, Signal, Action
+from typing import Optional
+from sqlalchemy import select
+from src.database import get_scoped_session, init_db, session_scope
+from src.database.models import Asset, Signal, Action, SignalType, SignalStatus, ActionType
 from src.services import StockPoolService, ValuationService
-from src.ui import require_auth, render_auth_sidebar, get_current_user_id
+from src.services.cache_utils import load_stock_pool, load_pb_history
+from src.ui import require_auth, render_auth_sidebar, get_current_user_id, lttb_downsample, truncate_text
 
 try:
     from src.services.background_scanner import get_scanner
@@ -18,7 +22,7 @@ st.set_page_config(page_title="股票详情 - 不败之地", page_icon="📈", l
 st.title("📈 股票详情")
 
 init_db()
-session = get_session()
+session = get_scoped_session()
 require_auth(session)
 user_id = get_current_user_id()
 with st.sidebar:
@@ -27,17 +31,173 @@ with st.sidebar:
 stock_service = StockPoolService(session, user_id)
 valuation_service = ValuationService(session)
 
+SIGNAL_TYPE_LABELS = {t: t.value for t in SignalType}
+ACTION_TYPE_LABELS = {t: t.value for t in ActionType}
+SIGNAL_STATUS_LABELS = {
+    SignalStatus.OPEN: "🟢 OPEN",
+    SignalStatus.DONE: "✅ DONE",
+    SignalStatus.IGNORED: "⏭️ IGNORED"
+}
+SIGNAL_HISTORY_COLUMNS = {
+    "日期": st.column_config.DateColumn(),
+    "PB": st.column_config.NumberColumn(format="%.2f"),
+    "阈值": st.column_config.NumberColumn(format="%.2f")
+}
+ACTION_HISTORY_COLUMNS = {
+    "日期": st.column_config.DateColumn(),
+    "仓位变动(%)": st.column_config.NumberColumn(format="%.1f%%"),
+    "价格": st.column_config.NumberColumn(format="¥%.2f")
+}
+
+
+@st.fragment
+def render_pb_tab(asset_id: int, code: str, name: str,
+                  buy_pb: Optional[float], add_pb: Optional[float], sell_pb: Optional[float]):
+    """PB走势标签页：切换时间范围、获取数据只重跑本区块（局部重跑时使用独立会话）"""
+    # PB history chart
+    st.subheader("PB 历史走势")
+
+    # Time range selector
+    time_range = st.radio(
+        "时间范围",
+        options=["1年", "3年", "5年", "全部"],
+        horizontal=True
+    )
+
+    if time_range == "1年":
+        start_date = date.today() - timedelta(days=365)
+    elif time_range == "3年":
+        start_date = date.today() - timedelta(days=365 * 3)
+    elif time_range == "5年":
+        start_date = date.today() - timedelta(days=365 * 5)
+    else:
+        start_date = None
+
+    df = load_pb_history(asset_id, start_date)
+    auto_fetch_key = f"pb_autofetch_{code}_{time_range}"
+    if df.empty and not st.session_state.get(auto_fetch_key):
+        with st.spinner("正在获取PB历史数据..."):
+            try:
+                data_list = valuation_service.fetch_pb_data(code, allow_wait=False)
+                if data_list is None:
+                    st.info("PB数据获取任务进行中，稍后自动显示")
+                else:
+                    st.session_state[auto_fetch_key] = True
+                    if data_list:
+                        with session_scope() as db_session:
+                            ValuationService(db_session).batch_save_valuations(asset_id, data_list)
+                        load_pb_history.clear()
+                        df = load_pb_history(asset_id, start_date)
+                    else:
+                        st.warning("未能获取PB历史数据，请稍后重试")
+            except Exception as e:
+                st.error(f"获取PB历史数据失败: {e}")
+
+    if not df.empty:
+        # Create chart（长区间降采样后再绘图，完整数据保留在下方表格中）
+        valid = df.dropna(subset=["pb"])
+        # 同一股票、区间、数据与阈值重跑时复用已构建的图表，任一变化才重建
+        fig_key = (
+            asset_id, time_range, len(valid),
+            valid["date"].iloc[-1] if len(valid) else None,
+            buy_pb, add_pb, sell_pb
+        )
+        if st.session_state.get("detail_pb_fig_key") != fig_key:
+            chart_dates, chart_pbs = lttb_downsample(valid["date"].tolist(), valid["pb"].to_numpy())
+
+            # Threshold lines：作为 layout.shapes 一次性写入，不逐条 add_hline
+            threshold_lines = []
+            if buy_pb is not None:
+                threshold_lines.append((buy_pb, "green", "请客价"))
+                if add_pb:
+                    threshold_lines.append((add_pb, "blue", "加仓价"))
+                if sell_pb:
+                    threshold_lines.append((sell_pb, "red", "退出价"))
+
+            st.session_state.detail_pb_fig = go.Figure(
+                data=[go.Scatter(
+                    x=chart_dates,
+                    y=chart_pbs,
+                    mode='lines',
+                    name='PB',
+                    line=dict(color='#1f77b4', width=2)
+                )],
+                layout=dict(
+                    title=f"{name} PB 走势",
+                    xaxis_title="日期",
+                    yaxis_title="PB",
+                    hovermode="x unified",
+                    # 切换时间范围时保留缩放等交互状态，前端按差异更新
+                    uirevision=f"pb-{asset_id}",
+                    shapes=[
+                        dict(type="line", xref="x domain", x0=0, x1=1, yref="y", y0=value, y1=value,
+                             line=dict(color=color, dash="dash"))
+                        for value, color, _ in threshold_lines
+                    ],
+                    annotations=[
+                        dict(xref="x domain", x=1, yref="y", y=value, text=f"{label}: {value:.2f}",
+                             showarrow=False, xanchor="right", yanchor="bottom")
+                        for value, _, label in threshold_lines
+                    ]
+                )
+            )
+            st.session_state.detail_pb_fig_key = fig_key
+
+        st.plotly_chart(st.session_state.detail_pb_fig, use_container_width=True)
+
+        # Data table：折叠的 expander 也会把整张表发送到前端，改为开关打开后才构建
+        if st.toggle("查看数据", key=f"pb_table_{asset_id}"):
+            st.dataframe(
+                df,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "date": st.column_config.DateColumn("日期"),
+                    "pb": st.column_config.NumberColumn("PB", format="%.2f"),
+                    "price": st.column_config.NumberColumn("价格", format="%.2f")
+                }
+            )
+    else:
+        st.info("暂无PB历史数据")
+
+        if st.button("📥 获取历史数据"):
+            try:
+                with st.spinner("正在获取数据..."):
+                    data_list = valuation_service.fetch_pb_data(code, allow_wait=False)
+                if data_list:
+                    # 按批写入，进度条显示已保存的行数
+                    progress_bar = st.progress(0, text="正在保存数据...")
+
+                    def update_progress(saved: int, total: int) -> None:
+                        progress_bar.progress(saved / total, text=f"正在保存数据 {saved}/{total}")
+
+                    with session_scope() as db_session:
+                        count = ValuationService(db_session).batch_save_valuations(
+                            asset_id, data_list, progress_callback=update_progress
+                        )
+                    load_pb_history.clear()
+                    st.success(f"成功获取 {count} 条数据")
+                    st.rerun()
+                elif data_list is None:
+                    st.info("PB数据获取任务进行中，请稍后再试")
+                else:
+                    st.warning("未能获取数据，请检查股票代码或稍后重试")
+            except Exception as e:
+                st.error(f"获取数据失败: {e}")
+
+
 # Stock selector
-stocks = stock_service.get_all_stocks()
+stocks = load_stock_pool(user_id)
 
 if not stocks:
     st.info("股票池为空，请先添加股票")
     st.stop()
 
+stock_names = {s.code: s.name for s in stocks}
 selected_code = st.selectbox(
     "选择股票",
-    options=[s.code for s in stocks],
-    format_func=lambda x: f"{x} - {next((s.name for s in stocks if s.code == x), '')}"
+    options=list(stock_names),
+    format_func=lambda x: f"{x} - {stock_names.get(x, '')}"
 )
 
 if selected_code:
@@ -71,202 +231,112 @@ if selected_code:
         tab1, tab2, tab3, tab4 = st.tabs(["PB走势", "估值统计", "信号历史", "交易记录"])
 
         with tab1:
-            # PB history chart
-            st.subheader("PB 历史走势")
-
-            # Time range selector
-            time_range = st.radio(
-                "时间范围",
-                options=["1年", "3年", "5年", "全部"],
-                horizontal=True
+            threshold = asset.threshold
+            render_pb_tab(
+                asset.id, asset.code, asset.name,
+                threshold.buy_pb if threshold else None,
+                threshold.add_pb if threshold else None,
+                threshold.sell_pb if threshold else None
             )
 
-            if time_range == "1年":
-                start_date = date.today() - timedelta(days=365)
-            elif time_range == "3年":
-                start_date = date.today() - timedelta(days=365 * 3)
-            elif time_range == "5年":
-                start_date = date.today() - timedelta(days=365 * 5)
-            else:
-                start_date = None
-
-            valuations = valuation_service.get_pb_history(asset.id, start_date=start_date)
-            auto_fetch_key = f"pb_autofetch_{asset.code}_{time_range}"
-            if not valuations and not st.session_state.get(auto_fetch_key):
-                with st.spinner("正在获取PB历史数据..."):
-                    try:
-                        data_list = valuation_service.fetch_pb_data(asset.code, allow_wait=False)
-                        if data_list is None:
-                            st.info("PB数据获取任务进行中，稍后自动显示")
-                        else:
-                            st.session_state[auto_fetch_key] = True
-                            if data_list:
-                                valuation_service.batch_save_valuations(asset.id, data_list)
-                                valuations = valuation_service.get_pb_history(asset.id, start_date=start_date)
-                            else:
-                                st.warning("未能获取PB历史数据，请稍后重试")
-                    except Exception as e:
-                        st.error(f"获取PB历史数据失败: {e}")
-
-            if valuations:
-                # Create chart
-                dates = [v.date for v in valuations]
-                pbs = [v.pb for v in valuations]
-
-                fig = go.Figure()
-
-                # PB line
-                fig.add_trace(go.Scatter(
-                    x=dates,
-                    y=pbs,
-                    mode='lines',
-                    name='PB',
-                    line=dict(color='#1f77b4', width=2)
-                ))
-
-                # Threshold lines
-                if asset.threshold:
-                    fig.add_hline(
-                        y=asset.threshold.buy_pb,
-                        line_dash="dash",
-                        line_color="green",
-                        annotation_text=f"请客价: {asset.threshold.buy_pb:.2f}"
-                    )
-
-                    if asset.threshold.add_pb:
-                        fig.add_hline(
-                            y=asset.threshold.add_pb,
-                            line_dash="dash",
-                            line_color="blue",
-                            annotation_text=f"加仓价: {asset.threshold.add_pb:.2f}"
-                        )
-
-                    if asset.threshold.sell_pb:
-                        fig.add_hline(
-                            y=asset.threshold.sell_pb,
-                            line_dash="dash",
-                            line_color="red",
-                            annotation_text=f"退出价: {asset.threshold.sell_pb:.2f}"
-                        )
-
-                fig.update_layout(
-                    title=f"{asset.name} PB 走势",
-                    xaxis_title="日期",
-                    yaxis_title="PB",
-                    hovermode="x unified"
-                )
-
-                st.plotly_chart(fig, use_container_width=True)
-
-                # Data table
-                with st.expander("查看数据"):
-                    df = pd.DataFrame({
-                        "日期": dates,
-                        "PB": pbs,
-                        "价格": [v.price for v in valuations]
-                    })
-                    st.dataframe(df, use_container_width=True, hide_index=True)
-            else:
-                st.info("暂无PB历史数据")
-
-                if st.button("📥 获取历史数据"):
-                    with st.spinner("正在获取数据..."):
-                        try:
-                            data_list = valuation_service.fetch_pb_data(asset.code, allow_wait=False)
-                            if data_list:
-                                count = valuation_service.batch_save_valuations(asset.id, data_list)
-                                st.success(f"成功获取 {count} 条数据")
-                                st.rerun()
-                            elif data_list is None:
-                                st.info("PB数据获取任务进行中，请稍后再试")
-                            else:
-                                st.warning("未能获取数据，请检查股票代码或稍后重试")
-                        except Exception as e:
-                            st.error(f"获取数据失败: {e}")
-
         with tab2:
             st.subheader("估值统计")
 
-            latest = valuation_service.get_latest_pb(asset.id)
-
             if latest:
                 current_pb = latest.pb
 
-                # Stats for different periods
-                for years in [3, 5, 10]:
-                    stats = valuation_service.get_pb_stats(asset.id, years=years)
-                    if stats and stats['count'] > 0:
-                        percentile = valuation_service.calculate_pb_percentile(
-                            asset.id, current_pb, years=years
-                        )
-
-                        st.markdown(f"**近 {years} 年统计** (共 {stats['count']} 条数据)")
-
-                        col1, col2, col3, col4 = st.columns(4)
-                        with col1:
-                            st.metric("最低 PB", f"{stats['min_pb']:.2f}")
-                        with col2:
-                            st.metric("最高 PB", f"{stats['max_pb']:.2f}")
-                        with col3:
-                            st.metric("平均 PB", f"{stats['avg_pb']:.2f}")
-                        with col4:
-                            if percentile is not None:
-                                color = "🟢" if percentile <= 30 else ("🔴" if percentile >= 70 else "🟡")
-                                st.metric("当前分位", f"{color} {percentile:.1f}%")
-
-                        st.divider()
+                # 一次查询得到各时间窗口的统计与分位数，汇总成一张表输出
+                stats_by_years = valuation_service.get_pb_stats_multi(
+                    asset.id, current_pb, year_windows=(3, 5, 10)
+                )
+                if stats_by_years:
+                    stats_df = pd.DataFrame.from_dict(stats_by_years, orient="index")
+                    percentile = stats_df["percentile"].astype("float64")
+                    st.dataframe(
+                        pd.DataFrame({
+                            "区间": [f"近 {years} 年" for years in stats_df.index],
+                            "数据条数": stats_df["count"],
+                            "最低 PB": stats_df["min_pb"],
+                            "最高 PB": stats_df["max_pb"],
+                            "平均 PB": stats_df["avg_pb"],
+                            "分位": np.select([percentile <= 30, percentile >= 70], ["🟢", "🔴"], default="🟡"),
+                            "当前分位": percentile
+                        }),
+                        use_container_width=True,
+                        hide_index=True,
+                        column_config={
+                            "最低 PB": st.column_config.NumberColumn(format="%.2f"),
+                            "最高 PB": st.column_config.NumberColumn(format="%.2f"),
+                            "平均 PB": st.column_config.NumberColumn(format="%.2f"),
+                            "当前分位": st.column_config.ProgressColumn(
+                                format="%.1f%%", min_value=0, max_value=100
+                            )
+                        }
+                    )
+                else:
+                    st.info("暂无估值数据")
             else:
                 st.info("暂无估值数据")
 
         with tab3:
             st.subheader("信号历史")
 
-            signals = session.query(Signal).filter(
-                Signal.asset_id == asset.id,
-                Signal.user_id == user_id
-            ).order_by(Signal.date.desc()).limit(50).all()
-
-            if signals:
-                data = []
-                for s in signals:
-                    status_emoji = {"OPEN": "🟢", "DONE": "✅", "IGNORED": "⏭️"}.get(s.status.value, "")
-                    data.append({
-                        "日期": s.date,
-                        "类型": s.signal_type.value,
-                        "PB": f"{s.pb:.2f}",
-                        "阈值": f"{s.triggered_threshold:.2f}",
-                        "状态": f"{status_emoji} {s.status.value}",
-                        "解释": s.explanation[:50] + "..." if s.explanation and len(s.explanation) > 50 else s.explanation
-                    })
-
-                df = pd.DataFrame(data)
-                st.dataframe(df, use_container_width=True, hide_index=True)
+            # 只投影表格需要的列，结果直接转为 DataFrame
+            signal_rows = session.execute(
+                select(
+                    Signal.date, Signal.signal_type, Signal.pb,
+                    Signal.triggered_threshold, Signal.status, Signal.explanation
+                ).where(
+                    Signal.asset_id == asset.id,
+                    Signal.user_id == user_id
+                ).order_by(Signal.date.desc()).limit(50)
+            ).all()
+
+            if signal_rows:
+                # 行转列后直接按列构建，数值列指定 dtype，不经过逐行推断
+                dates, signal_types, pbs, thresholds, statuses, explanations = zip(*signal_rows)
+                df = pd.DataFrame({
+                    "日期": dates,
+                    "类型": pd.Series(signal_types, dtype="object").map(SIGNAL_TYPE_LABELS),
+                    "PB": np.array(pbs, dtype=np.float64),
+                    "阈值": np.array(thresholds, dtype=np.float64),
+                    "状态": pd.Series(statuses, dtype="object").map(SIGNAL_STATUS_LABELS),
+                    "解释": truncate_text(explanations, 50)
+                })
+                st.dataframe(
+                    df, use_container_width=True, hide_index=True,
+                    column_config=SIGNAL_HISTORY_COLUMNS
+                )
             else:
                 st.info("暂无信号历史")
 
         with tab4:
             st.subheader("交易记录")
 
-            actions = session.query(Action).filter(
-                Action.asset_id == asset.id,
-                Action.user_id == user_id
-            ).order_by(Action.action_date.desc()).limit(50).all()
-
-            if actions:
-                data = []
-                for a in actions:
-                    compliance_emoji = "✅" if a.rule_compliance else "❌"
-                    data.append({
-                        "日期": a.action_date,
-                        "动作": a.action_type.value,
-                        "仓位变动": f"{a.executed_position_pct:.1f}%" if a.executed_position_pct else "-",
-                        "价格": f"{a.price:.2f}" if a.price else "-",
-                        "合规": compliance_emoji,
-                        "理由": a.reason[:40] + "..." if len(a.reason) > 40 else a.reason
-                    })
-
-                df = pd.DataFrame(data)
-                st.dataframe(df, use_container_width=True, hide_index=True)
+            action_rows = session.execute(
+                select(
+                    Action.action_date, Action.action_type, Action.executed_position_pct,
+                    Action.price, Action.rule_compliance, Action.reason
+                ).where(
+                    Action.asset_id == asset.id,
+                    Action.user_id == user_id
+                ).order_by(Action.action_date.desc()).limit(50)
+            ).all()
+
+            if action_rows:
+                action_dates, action_types, position_pcts, prices, compliances, reasons = zip(*action_rows)
+                df = pd.DataFrame({
+                    "日期": action_dates,
+                    "动作": pd.Series(action_types, dtype="object").map(ACTION_TYPE_LABELS),
+                    "仓位变动(%)": np.array(position_pcts, dtype=np.float64),
+                    "价格": np.array(prices, dtype=np.float64),
+                    "合规": np.where(pd.Series(compliances, dtype="object").eq(True), "✅", "❌"),
+                    "理由": truncate_text(reasons, 40)
+                })
+                st.dataframe(
+                    df, use_container_width=True, hide_index=True,
+                    column_config=ACTION_HISTORY_COLUMNS
+                )
             else:
                 st.info("暂无交易记录")
 
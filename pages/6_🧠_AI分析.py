@@ -1,12 +1,13 @@
 """AI-powered fundamental analysis page using Qwen3-max."""
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
 from typing import Optional, Callable
-from src.database import get_session, init_db
-from src.database.models import Asset, AIAnalysisReport
-from src.services import StockPoolService, AIAnalyzer, RealtimeService, ValuationService
+from src.database import get_scoped_session, init_db, session_scope
+from src.database.models import AIAnalysisReport
+from src.services.cache_utils import load_stock_pool, load_pb_history, load_recent_reports, load_stored_report, get_ai_analyzer
 from src.ui import (
-    GLOBAL_CSS, APP_NAME_CN, APP_NAME_EN, render_header, render_footer, render_alert,
+    GLOBAL_CSS, APP_NAME_CN, APP_NAME_EN, render_header, render_footer, render_alert, render_card,
     require_auth, render_auth_sidebar, get_current_user_id
 )
 
@@ -24,17 +25,15 @@ st.markdown(render_header("AI 基本面分析", "使用 Qwen3-max 生成专业
 
 # Initialize services
 init_db()
-session = get_session()
+session = get_scoped_session()
 require_auth(session)
 user_id = get_current_user_id()
+# 本次重跑统一使用的当前时间（报告"今天/昨天"等标签保持一致）
+now = datetime.now()
 with st.sidebar:
     render_auth_sidebar()
     st.divider()
-stock_service = StockPoolService(session, user_id)
-valuation_service = ValuationService(session)
-realtime_service = RealtimeService()
-
-ai_analyzer = AIAnalyzer()
+ai_analyzer = get_ai_analyzer()
 
 # Session state
 if 'current_report' not in st.session_state:
@@ -42,79 +41,119 @@ if 'current_report' not in st.session_state:
 if 'fundamental_data' not in st.session_state:
     st.session_state.fundamental_data = None
 if 'show_history' not in st.session_state:
-    st.session_state.show_history = True
+    st.session_state.show_history = False
 if 'selected_report_code' not in st.session_state:
     st.session_state.selected_report_code = None
 if 'auto_generate_report_code' not in st.session_state:
     st.session_state.auto_generate_report_code = None
 if 'ai_input_code' not in st.session_state:
     st.session_state.ai_input_code = ""
+if 'report_job' not in st.session_state:
+    st.session_state.report_job = None
 
 st.divider()
 
 
-def get_historical_report(code: str):
-    """获取历史分析报告"""
-    return session.query(AIAnalysisReport).filter(
-        AIAnalysisReport.code == code,
-        AIAnalysisReport.user_id == user_id
-    ).order_by(AIAnalysisReport.created_at.desc()).first()
+def format_report_age(updated_at: datetime, now: datetime) -> str:
+    """报告时间距今的简短描述（今天/昨天/N 天前）"""
+    days_old = (now - updated_at).days
+    if days_old == 0:
+        return "今天"
+    if days_old == 1:
+        return "昨天"
+    return f"{days_old} 天前"
 
 
 def save_report(report, fundamental):
-    """保存分析报告到数据库"""
-    # 检查是否已存在该股票的报告
-    existing = session.query(AIAnalysisReport).filter(
-        AIAnalysisReport.code == fundamental.code,
-        AIAnalysisReport.user_id == user_id
-    ).first()
-
-    if existing:
-        # 更新现有报告
-        existing.name = fundamental.name
-        existing.summary = report.summary
-        existing.valuation_analysis = report.valuation_analysis
-        existing.fundamental_analysis = report.fundamental_analysis
-        existing.risk_analysis = report.risk_analysis
-        existing.investment_suggestion = report.investment_suggestion
-        existing.pb_recommendation = report.pb_recommendation
-        existing.full_report = report.full_report
-        existing.ai_score = report.ai_score
-        existing.price_at_report = fundamental.current_price
-        existing.pb_at_report = fundamental.pb
-        existing.pe_at_report = fundamental.pe_ttm
-        existing.market_cap_at_report = fundamental.market_cap
-        existing.updated_at = datetime.now()
-    else:
-        # 创建新报告
-        new_report = AIAnalysisReport(
-            user_id=user_id,
-            code=fundamental.code,
-            name=fundamental.name,
-            summary=report.summary,
-            valuation_analysis=report.valuation_analysis,
-            fundamental_analysis=report.fundamental_analysis,
-            risk_analysis=report.risk_analysis,
-            investment_suggestion=report.investment_suggestion,
-            pb_recommendation=report.pb_recommendation,
-            full_report=report.full_report,
-            ai_score=report.ai_score,
-            price_at_report=fundamental.current_price,
-            pb_at_report=fundamental.pb,
-            pe_at_report=fundamental.pe_ttm,
-            market_cap_at_report=fundamental.market_cap
-        )
-        session.add(new_report)
-
-    session.commit()
+    """保存分析报告到数据库（独立的短事务，结束即提交并归还连接）"""
+    with session_scope() as db_session:
+        # 检查是否已存在该股票的报告
+        existing = db_session.query(AIAnalysisReport).filter(
+            AIAnalysisReport.code == fundamental.code,
+            AIAnalysisReport.user_id == user_id
+        ).first()
+
+        if existing:
+            # 更新现有报告
+            existing.name = fundamental.name
+            existing.summary = report.summary
+            existing.valuation_analysis = report.valuation_analysis
+            existing.fundamental_analysis = report.fundamental_analysis
+            existing.risk_analysis = report.risk_analysis
+            existing.investment_suggestion = report.investment_suggestion
+            existing.pb_recommendation = report.pb_recommendation
+            existing.full_report = report.full_report
+            existing.ai_score = report.ai_score
+            existing.price_at_report = fundamental.current_price
+            existing.pb_at_report = fundamental.pb
+            existing.pe_at_report = fundamental.pe_ttm
+            existing.market_cap_at_report = fundamental.market_cap
+            existing.updated_at = datetime.now()
+        else:
+            # 创建新报告
+            new_report = AIAnalysisReport(
+                user_id=user_id,
+                code=fundamental.code,
+                name=fundamental.name,
+                summary=report.summary,
+                valuation_analysis=report.valuation_analysis,
+                fundamental_analysis=report.fundamental_analysis,
+                risk_analysis=report.risk_analysis,
+                investment_suggestion=report.investment_suggestion,
+                pb_recommendation=report.pb_recommendation,
+                full_report=report.full_report,
+                ai_score=report.ai_score,
+                price_at_report=fundamental.current_price,
+                pb_at_report=fundamental.pb,
+                pe_at_report=fundamental.pe_ttm,
+                market_cap_at_report=fundamental.market_cap
+            )
+            db_session.add(new_report)
+    # 只失效本用户的列表和这只股票的报告缓存
+    load_recent_reports.clear(user_id)
+    load_stored_report.clear(user_id, fundamental.code)
+
+
+@st.cache_resource
+def get_report_executor() -> ThreadPoolExecutor:
+    """AI 报告生成线程池（进程内共享），LLM 调用不再阻塞页面脚本"""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="ai-report")
+
+
+def load_report_inputs(selected_code, include_pb_history=True) -> dict:
+    """在页面线程中准备报告所需的 PB 历史与阈值（均来自缓存）"""
+    inputs = {
+        "pb_history": None,
+        "threshold_buy": None,
+        "threshold_add": None,
+        "threshold_sell": None
+    }
+    if not include_pb_history:
+        return inputs
+
+    # 股票池与阈值取自缓存，不再按代码单独查库
+    stock = {s.code: s for s in load_stock_pool(user_id)}.get(selected_code)
+    if stock:
+        start_date = date.today() - timedelta(days=5 * 365)
+        df_pb = load_pb_history(stock.id, start_date)
+        df_pb = df_pb[df_pb["pb"] > 0]
+        if not df_pb.empty:
+            inputs["pb_history"] = df_pb[["date", "pb"]].to_dict("records")
+
+        if stock.has_threshold:
+            inputs["threshold_buy"] = stock.buy_pb
+            inputs["threshold_add"] = stock.add_pb
+            inputs["threshold_sell"] = stock.sell_pb
+    return inputs
 
 
 def generate_new_report(
     selected_code,
-    include_pb_history=True,
-    progress_callback: Optional[Callable[[int, str], None]] = None
+    report_inputs: dict,
+    progress_callback: Optional[Callable[[int, str], None]] = None,
+    on_delta: Optional[Callable[[str], None]] = None
 ):
-    """生成新的AI分析报告"""
+    """生成新的AI分析报告（在后台线程中执行，不调用任何 st.* 接口）"""
     if progress_callback:
         progress_callback(10, "获取股票基本面数据...")
     fundamental = ai_analyzer.fetch_fundamental_data(selected_code)
@@ -122,36 +161,9 @@ def generate_new_report(
     if not fundamental:
         return None, "无法获取股票基本面数据，请检查代码是否正确"
 
-    # Get PB history if available
-    pb_history = None
-    threshold_buy = None
-    threshold_add = None
-    threshold_sell = None
-
-    if include_pb_history:
-        if progress_callback:
-            progress_callback(30, "加载PB历史数据...")
-        stock = stock_service.get_stock(selected_code)
-        if stock:
-            start_date = date.today() - timedelta(days=5 * 365)
-            valuations = valuation_service.get_pb_history(stock.id, start_date=start_date)
-            if valuations:
-                pb_history = [{"date": v.date, "pb": v.pb} for v in valuations if v.pb]
-
-            if stock.threshold:
-                threshold_buy = stock.threshold.buy_pb
-                threshold_add = stock.threshold.add_pb
-                threshold_sell = stock.threshold.sell_pb
-
     if progress_callback:
         progress_callback(60, "生成AI分析报告...")
-    report = ai_analyzer.generate_analysis_report(
-        fundamental=fundamental,
-        pb_history=pb_history,
-        threshold_buy=threshold_buy,
-        threshold_add=threshold_add,
-        threshold_sell=threshold_sell
-    )
+    report = ai_analyzer.generate_analysis_report(fundamental=fundamental, on_delta=on_delta, **report_inputs)
 
     if report:
         # 保存报告
@@ -164,13 +176,122 @@ def generate_new_report(
         return None, f"AI 分析报告生成失败: {error_msg}"
 
 
+def is_report_running() -> bool:
+    """当前会话是否有尚未完成的报告生成任务"""
+    job = st.session_state.report_job
+    return job is not None and not job["future"].done()
+
+
+def start_report_job(selected_code, include_pb_history=True, message="准备生成分析报告..."):
+    """提交后台生成任务，进度由 render_report_job 轮询展示"""
+    if is_report_running():
+        return
+
+    # 后台线程只写这个字典；正文增量追加到 chunks，由轮询片段拼接展示
+    progress = {"value": 5, "message": message, "chunks": []}
+
+    def update_progress(value: int, message: str) -> None:
+        progress["value"] = value
+        progress["message"] = message
+
+    report_inputs = load_report_inputs(selected_code, include_pb_history)
+    future = get_report_executor().submit(
+        generate_new_report, selected_code, report_inputs, update_progress, progress["chunks"].append
+    )
+    st.session_state.report_job = {"code": selected_code, "future": future, "progress": progress}
+
+
+@st.fragment(run_every=1)
+def render_report_job():
+    """每秒局部刷新生成进度，完成后整页重跑以显示新报告"""
+    job = st.session_state.report_job
+    if job is None:
+        return
+
+    future = job["future"]
+    if not future.done():
+        with st.status(f"正在生成 {job['code']} 的分析报告...", expanded=True):
+            st.progress(min(job["progress"]["value"], 100))
+            st.caption(job["progress"]["message"])
+            # 已生成的正文实时预览
+            partial = "".join(job["progress"]["chunks"])
+            if partial:
+                st.markdown(partial)
+        return
+
+    st.session_state.report_job = None
+    try:
+        result, error = future.result()
+    except Exception as e:
+        result, error = None, f"AI 分析报告生成失败: {e}"
+    st.session_state.report_job_error = None if result else error
+    st.rerun()
+
+
+HISTORY_PAGE_SIZE = 5  # 历史报告列表每页条数
+
+
+@st.fragment
+def render_report_history(user_id: int):
+    """最近分析报告列表（局部重跑：开关、翻页不触发整页重跑）"""
+    # 列表默认收起：打开开关后才读取（缓存的列表只含展示所需的列，不加载报告正文）
+    if not st.toggle("显示最近的分析报告", key="show_history"):
+        return
+
+    all_reports = load_recent_reports(user_id)
+    if not all_reports:
+        st.info("暂无历史分析报告，请先选择股票进行分析")
+        return
+
+    page_count = -(-len(all_reports) // HISTORY_PAGE_SIZE)
+    page = 1
+    if page_count > 1:
+        page = st.radio(
+            "页码", options=list(range(1, page_count + 1)), index=0, horizontal=True,
+            key="history_page", label_visibility="collapsed"
+        )
+
+    now = datetime.now()
+    start = (page - 1) * HISTORY_PAGE_SIZE
+    for report in all_reports[start:start + HISTORY_PAGE_SIZE]:
+        col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
+
+        with col1:
+            st.markdown(f"**{report.name}** ({report.code})")
+
+        with col2:
+            if report.ai_score and report.ai_score > 0:
+                st.markdown(f"{report.ai_score}分")
+            else:
+                st.markdown("-")
+
+        with col3:
+            st.caption(format_report_age(report.updated_at, now))
+
+        with col4:
+            if st.button("查看", key=f"view_{report.id}", use_container_width=True):
+                # 切换查看的报告需要整页重跑
+                st.session_state.selected_report_code = report.code
+                st.rerun(scope="app")
+
+
+# 报告各部分：(标签页标题, 报告字段, 缺省文案)
+REPORT_SECTIONS = (
+    ("📊 估值分析", "valuation_analysis", "暂无估值分析"),
+    ("📈 基本面分析", "fundamental_analysis", "暂无基本面分析"),
+    ("⚠️ 风险提示", "risk_analysis", "暂无风险分析"),
+    ("💰 投资建议", "investment_suggestion", "暂无投资建议"),
+    ("📋 PB阈值建议", "pb_recommendation", "暂无PB建议"),
+)
+
+
 # ==================== Stock Selection ====================
 col1, col2 = st.columns([2, 1])
 
 with col1:
     st.markdown("### 📊 选择分析对象")
 
-    stocks = stock_service.get_all_stocks()
+    stocks = load_stock_pool(user_id)
     selected_report_code = st.session_state.selected_report_code
     selected_code = selected_report_code
 
@@ -178,35 +299,32 @@ with col1:
 
     with tab1:
         if stocks:
-            stock_options = {f"{s.name} ({s.code})": s.code for s in stocks}
-            default_display = None
-            if selected_report_code:
-                for display, code in stock_options.items():
-                    if code == selected_report_code:
-                        default_display = display
-                        break
-            option_list = list(stock_options.keys())
-            if default_display and st.session_state.get("ai_stock_select") != default_display:
-                st.session_state["ai_stock_select"] = default_display
-            default_index = option_list.index(default_display) if default_display in option_list else 0
-            selected_display = st.selectbox(
+            # 选项直接使用代码，名称只用于展示，避免按标签反查代码
+            stock_names = {s.code: s.name for s in stocks}
+            default_code = selected_report_code if selected_report_code in stock_names else None
+            option_list = list(stock_names)
+            if default_code and st.session_state.get("ai_stock_select") != default_code:
+                st.session_state["ai_stock_select"] = default_code
+            default_index = option_list.index(default_code) if default_code else 0
+            selected_pool_code = st.selectbox(
                 "选择股票",
                 options=option_list,
                 index=default_index,
+                format_func=lambda code: f"{stock_names[code]} ({code})",
                 key="ai_stock_select",
                 help="从已添加的股票池中选择"
             )
-            if default_display and not st.session_state.ai_input_code:
-                selected_code = stock_options[selected_display] if selected_display else None
-            if selected_display:
+            if default_code and not st.session_state.ai_input_code:
+                selected_code = selected_pool_code
+            if selected_pool_code:
                 if st.button(
                     "🚀 生成 AI 分析报告",
                     type="primary",
                     use_container_width=True,
                     key="generate_report_from_pool"
                 ):
-                    st.session_state.auto_generate_report_code = stock_options[selected_display]
-                    st.session_state.selected_report_code = stock_options[selected_display]
+                    st.session_state.auto_generate_report_code = selected_pool_code
+                    st.session_state.selected_report_code = selected_pool_code
                     st.rerun()
         else:
             st.info("股票池为空，请先添加股票或直接输入代码")
@@ -251,44 +369,28 @@ if auto_generate_code and auto_generate_code != selected_code:
     selected_code = auto_generate_code
     st.session_state.selected_report_code = auto_generate_code
 
+if st.session_state.get("report_job_error"):
+    st.error(st.session_state.pop("report_job_error"))
+
 if selected_code:
     if st.session_state.auto_generate_report_code:
         st.session_state.auto_generate_report_code = None
-        progress_container = st.container()
-        with progress_container:
-            progress_bar = st.progress(0)
-            progress_text = st.empty()
-
-            def update_progress(value: int, message: str) -> None:
-                progress_bar.progress(min(value, 100))
-                progress_text.caption(message)
-
-            update_progress(5, "准备生成分析报告...")
-            result, error = generate_new_report(selected_code, include_pb_history, update_progress)
-            if result:
-                st.success("✅ 报告生成成功！")
-                st.rerun()
-            else:
-                st.error(error)
+        start_report_job(selected_code, include_pb_history)
+
+    # 报告在后台生成，期间页面其余部分（含历史报告）照常可用
+    if st.session_state.report_job is not None:
+        render_report_job()
 
-    historical_report = get_historical_report(selected_code)
+    historical_report = load_stored_report(user_id, selected_code)
 
     if historical_report:
         # 有历史报告
-        report_age = datetime.now() - historical_report.updated_at
-        days_old = report_age.days
-
         # 显示历史报告信息
         col1, col2, col3 = st.columns([2, 1, 1])
 
         with col1:
             st.markdown(f"### 📄 {historical_report.name} 分析报告")
-            if days_old == 0:
-                time_str = "今天"
-            elif days_old == 1:
-                time_str = "昨天"
-            else:
-                time_str = f"{days_old} 天前"
+            time_str = format_report_age(historical_report.updated_at, now)
 
             st.caption(f"📅 报告生成时间: {historical_report.updated_at.strftime('%Y-%m-%d %H:%M')} ({time_str})")
 
@@ -305,23 +407,14 @@ if selected_code:
                 st.metric("AI 评分", f"{historical_report.ai_score}分")
 
         with col3:
-            if st.button("📝 生成完整报告", type="primary", use_container_width=True):
-                progress_container = st.container()
-                with progress_container:
-                    progress_bar = st.progress(0)
-                    progress_text = st.empty()
-
-                    def update_progress(value: int, message: str) -> None:
-                        progress_bar.progress(min(value, 100))
-                        progress_text.caption(message)
-
-                    update_progress(5, "准备生成完整报告...")
-                    result, error = generate_new_report(selected_code, True, update_progress)
-                    if result:
-                        st.success("✅ 报告已更新！")
-                        st.rerun()
-                    else:
-                        st.error(error)
+            if st.button(
+                "📝 生成完整报告",
+                type="primary",
+                use_container_width=True,
+                disabled=is_report_running()
+            ):
+                start_report_job(selected_code, True, "准备生成完整报告...")
+                st.rerun()
 
         st.divider()
 
@@ -331,48 +424,11 @@ if selected_code:
         st.markdown(render_alert(historical_report.summary or "暂无总结", "info", "💡"), unsafe_allow_html=True)
 
         # Tabs for different sections
-        tab1, tab2, tab3, tab4, tab5 = st.tabs([
-            "📊 估值分析",
-            "📈 基本面分析",
-            "⚠️ 风险提示",
-            "💰 投资建议",
-            "📋 PB阈值建议"
-        ])
-
-        with tab1:
-            st.markdown(f"""
-            <div class="metric-card">
-                {historical_report.valuation_analysis or "暂无估值分析"}
-            </div>
-            """, unsafe_allow_html=True)
-
-        with tab2:
-            st.markdown(f"""
-            <div class="metric-card">
-                {historical_report.fundamental_analysis or "暂无基本面分析"}
-            </div>
-            """, unsafe_allow_html=True)
-
-        with tab3:
-            st.markdown(f"""
-            <div class="metric-card">
-                {historical_report.risk_analysis or "暂无风险分析"}
-            </div>
-            """, unsafe_allow_html=True)
-
-        with tab4:
-            st.markdown(f"""
-            <div class="metric-card">
-                {historical_report.investment_suggestion or "暂无投资建议"}
-            </div>
-            """, unsafe_allow_html=True)
-
-        with tab5:
-            st.markdown(f"""
-            <div class="metric-card">
-                {historical_report.pb_recommendation or "暂无PB建议"}
-            </div>
-            """, unsafe_allow_html=True)
+        for tab, (_, field, placeholder) in zip(
+            st.tabs([title for title, _, _ in REPORT_SECTIONS]), REPORT_SECTIONS
+        ):
+            with tab:
+                st.markdown(render_card(getattr(historical_report, field) or placeholder), unsafe_allow_html=True)
 
         # Full report expander
         with st.expander("📄 查看完整报告", expanded=False):
@@ -382,63 +438,20 @@ if selected_code:
         # 没有历史报告
         st.info(f"📋 暂无 {selected_code} 的分析报告")
 
-        if st.button("🚀 生成 AI 分析报告", type="primary", use_container_width=True):
-            progress_container = st.container()
-            with progress_container:
-                progress_bar = st.progress(0)
-                progress_text = st.empty()
-
-                def update_progress(value: int, message: str) -> None:
-                    progress_bar.progress(min(value, 100))
-                    progress_text.caption(message)
-
-                update_progress(5, "准备生成分析报告...")
-                result, error = generate_new_report(selected_code, include_pb_history, update_progress)
-                if result:
-                    st.success("✅ 报告生成成功！")
-                    st.rerun()
-                else:
-                    st.error(error)
+        if st.button(
+            "🚀 生成 AI 分析报告",
+            type="primary",
+            use_container_width=True,
+            disabled=is_report_running()
+        ):
+            start_report_job(selected_code, include_pb_history)
+            st.rerun()
 
 # ==================== All Reports History ====================
 st.divider()
 st.markdown("### 📚 历史分析报告")
 
-all_reports = session.query(AIAnalysisReport).filter(
-    AIAnalysisReport.user_id == user_id
-).order_by(AIAnalysisReport.updated_at.desc()).limit(10).all()
-
-if all_reports:
-    for report in all_reports:
-        report_age = datetime.now() - report.updated_at
-        days_old = report_age.days
-
-        col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
-
-        with col1:
-            st.markdown(f"**{report.name}** ({report.code})")
-
-        with col2:
-            if report.ai_score and report.ai_score > 0:
-                st.markdown(f"{report.ai_score}分")
-            else:
-                st.markdown("-")
-
-        with col3:
-            if days_old == 0:
-                st.caption("今天")
-            elif days_old == 1:
-                st.caption("昨天")
-            else:
-                st.caption(f"{days_old}天前")
-
-        with col4:
-            if st.button("查看", key=f"view_{report.id}", use_container_width=True):
-                # 这里可以设置 selected_code 来查看报告
-                st.session_state.selected_report_code = report.code
-                st.rerun()
-else:
-    st.info("暂无历史分析报告，请先选择股票进行分析")
+render_report_history(user_id)
 
 # Footer
 st.markdown(render_footer(), unsafe_allow_html=True)
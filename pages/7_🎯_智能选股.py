@@ -1,10 +1,12 @@
 """Smart stock screening page - background scan for undervalued stocks."""
 import streamlit as st
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from sqlalchemy import select, func, update
 
 # Database imports
-from src.database import get_session, init_db
+from src.database import get_scoped_session, init_db
 from src.database.models import Market, AIAnalysisReport
 
 # Import models for background scanning
@@ -20,35 +22,93 @@ except ImportError as e:
     CandidateStatus = None
     get_scanner = None
 
-from src.services import StockPoolService, AIAnalyzer
+from src.services import StockPoolService
+from src.services.cache_utils import load_stock_pool, load_recent_reports, load_stored_report
 from src.ui import (
     GLOBAL_CSS, APP_NAME_CN, APP_NAME_EN, render_header, render_footer,
     require_auth, render_auth_sidebar, get_current_user_id
 )
 
 
-def sync_ai_report_to_database(session, user_id: int, code: str, name: str, ai_score: int, ai_suggestion: str):
-    """同步AI评分到AIAnalysisReport表"""
-    existing = session.query(AIAnalysisReport).filter(
-        AIAnalysisReport.code == code,
-        AIAnalysisReport.user_id == user_id
-    ).first()
-    if existing:
-        # 更新现有记录
-        existing.ai_score = ai_score
-        existing.summary = ai_suggestion
-        existing.updated_at = datetime.now()
-    else:
-        # 创建新记录（简化版，只保存评分和摘要）
-        new_report = AIAnalysisReport(
-            user_id=user_id,
-            code=code,
-            name=name,
-            summary=ai_suggestion,
-            ai_score=ai_score
+def sync_ai_reports_to_database(session, user_id: int, candidates):
+    """同步备选股票的AI评分到AIAnalysisReport表（一次 IN 查询取已有报告，由调用方提交）"""
+    existing = {
+        r.code: r for r in session.query(AIAnalysisReport).filter(
+            AIAnalysisReport.code.in_([c.code for c in candidates]),
+            AIAnalysisReport.user_id == user_id
         )
-        session.add(new_report)
-    session.commit()
+    }
+    now = datetime.now()
+    for c in candidates:
+        report = existing.get(c.code)
+        if report:
+            # 更新现有记录
+            report.ai_score = c.ai_score
+            report.summary = c.ai_suggestion
+            report.updated_at = now
+        else:
+            # 创建新记录（简化版，只保存评分和摘要）
+            session.add(AIAnalysisReport(
+                user_id=user_id,
+                code=c.code,
+                name=c.name,
+                summary=c.ai_suggestion,
+                ai_score=c.ai_score
+            ))
+
+
+@st.fragment(run_every=5)
+def render_scan_status(scanner):
+    """扫描状态面板，每 5 秒局部刷新（不重新查询备选池）"""
+    progress_info = scanner.get_progress()
+
+    if progress_info:
+        is_running = scanner.is_running()
+
+        if is_running:
+            st.markdown(f"""
+            <div style="background: #E8F5E9; padding: 1rem; border-radius: 8px;">
+                <strong>🟢 扫描进行中</strong><br>
+                进度: {progress_info['current_index']}/{progress_info['total_stocks']} ({progress_info['progress_pct']:.1f}%)<br>
+                最近扫描: {progress_info['last_scanned_code'] or '-'}
+            </div>
+            """, unsafe_allow_html=True)
+
+            st.progress(progress_info['progress_pct'] / 100)
+        else:
+            st.markdown(f"""
+            <div style="background: #FFF3E0; padding: 1rem; border-radius: 8px;">
+                <strong>⏸️ 扫描已暂停</strong><br>
+                上次进度: {progress_info['current_index']}/{progress_info['total_stocks']}<br>
+                可继续扫描
+            </div>
+            """, unsafe_allow_html=True)
+    else:
+        st.info("尚未开始扫描")
+
+
+@st.fragment(run_every=10)
+def render_ai_score_stats(scanner):
+    """AI 评分统计，每 10 秒局部刷新以跟上后台评分进度（一条聚合查询）"""
+    stats = scanner.get_ai_score_stats()
+
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        st.metric("已评分", f"{stats['scored']} 只")
+
+    with col2:
+        if stats['avg_score'] is not None:
+            st.metric("平均评分", f"{stats['avg_score']:.1f}分")
+        else:
+            st.metric("平均评分", "-")
+
+    with col3:
+        st.metric("高分(≥80)", f"{stats['high_score']} 只")
+
+    if stats['unscored']:
+        st.caption(f"💡 有 {stats['unscored']} 只股票待评分，后台扫描时会自动进行AI评分")
+
 
 st.set_page_config(
     page_title=f"智能选股 - {APP_NAME_CN} | {APP_NAME_EN}",
@@ -64,7 +124,7 @@ st.markdown(render_header("智能选股", "后台扫描全市场低估股票", "
 
 # Initialize database and services
 init_db()
-session = get_session()
+session = get_scoped_session()
 require_auth(session)
 user_id = get_current_user_id()
 with st.sidebar:
@@ -115,30 +175,7 @@ with col1:
 
 with col2:
     st.markdown("#### 📊 扫描状态")
-
-    if progress_info:
-        is_running = scanner.is_running()
-
-        if is_running:
-            st.markdown(f"""
-            <div style="background: #E8F5E9; padding: 1rem; border-radius: 8px;">
-                <strong>🟢 扫描进行中</strong><br>
-                进度: {progress_info['current_index']}/{progress_info['total_stocks']} ({progress_info['progress_pct']:.1f}%)<br>
-                最近扫描: {progress_info['last_scanned_code'] or '-'}
-            </div>
-            """, unsafe_allow_html=True)
-
-            st.progress(progress_info['progress_pct'] / 100)
-        else:
-            st.markdown(f"""
-            <div style="background: #FFF3E0; padding: 1rem; border-radius: 8px;">
-                <strong>⏸️ 扫描已暂停</strong><br>
-                上次进度: {progress_info['current_index']}/{progress_info['total_stocks']}<br>
-                可继续扫描
-            </div>
-            """, unsafe_allow_html=True)
-    else:
-        st.info("尚未开始扫描")
+    render_scan_status(scanner)
 
 if not progress_info:
     if scanner.start_scan(pb_threshold_pct=float(bg_max_distance), scan_interval=bg_interval):
@@ -217,109 +254,147 @@ st.divider()
 # ==================== Candidate Pool ====================
 st.markdown("### 📋 备选池")
 
-# Get candidates
-candidates = session.query(StockCandidate).filter(
-    StockCandidate.status == CandidateStatus.PENDING,
-    StockCandidate.user_id == user_id
-).order_by(StockCandidate.pb_distance_pct).all()
-
-if candidates:
-    st.markdown(f"**找到 {len(candidates)} 只待处理股票**")
-
-    existing_stocks = {s.code for s in stock_service.get_all_stocks()}
-
-    candidate_data = []
-    for c in candidates:
-        in_pool = c.code in existing_stocks
-        distance_icon = "🟢" if c.pb_distance_pct <= 0 else "🟡" if c.pb_distance_pct <= 10 else "🟠"
+# 表格只投影展示所需的列，不构建 StockCandidate 对象（添加时再按选中代码取完整记录）
+CANDIDATE_COLUMNS = {
+    "code": StockCandidate.code,
+    "name": StockCandidate.name,
+    "industry": StockCandidate.industry,
+    "price": StockCandidate.current_price,
+    "pb": StockCandidate.current_pb,
+    "buy_pb": StockCandidate.recommended_buy_pb,
+    "distance": StockCandidate.pb_distance_pct,
+    "ai_score": StockCandidate.ai_score,
+    "scanned_at": StockCandidate.scanned_at,
+}
+raw = pd.DataFrame.from_records(
+    session.execute(
+        select(*CANDIDATE_COLUMNS.values()).where(
+            StockCandidate.status == CandidateStatus.PENDING,
+            StockCandidate.user_id == user_id
+        ).order_by(StockCandidate.pb_distance_pct)
+    ).all(),
+    columns=list(CANDIDATE_COLUMNS)
+)
 
-        # AI 评分显示
-        if c.ai_score and c.ai_score > 0:
-            ai_score_display = f"{c.ai_score}分"
-        else:
-            ai_score_display = "未评分"
-
-        candidate_data.append({
-            "状态": "✅ 已加入" if in_pool else "⬜ 待处理",
-            "距离": f"{distance_icon} {c.pb_distance_pct:+.1f}%",
-            "代码": c.code,
-            "名称": c.name,
-            "行业": c.industry or "-",
-            "现价": f"¥{c.current_price:.2f}" if c.current_price else "-",
-            "当前PB": f"{c.current_pb:.2f}" if c.current_pb else "-",
-            "请客价PB": f"{c.recommended_buy_pb:.2f}" if c.recommended_buy_pb else "-",
-            "AI评分": ai_score_display,
-            "扫描时间": c.scanned_at.strftime("%m-%d %H:%M") if c.scanned_at else "-"
-        })
-
-    df_candidates = pd.DataFrame(candidate_data)
-    st.dataframe(df_candidates, use_container_width=True, hide_index=True, height=300)
+if not raw.empty:
+    st.markdown(f"**找到 {len(raw)} 只待处理股票**")
+
+    # 股票池代码取自缓存（增删时已失效），不再每次重跑查库
+    existing_stocks = {s.code for s in load_stock_pool(user_id)}
+
+    # 直接在查询结果上按列修正取值，表头与格式由 column_config 在前端完成，不再另建一份表
+    in_pool = raw["code"].isin(existing_stocks).to_numpy()
+    raw["in_pool"] = in_pool
+    # 价格与 PB 为 0 或缺失时显示为空
+    raw[["price", "pb", "buy_pb"]] = raw[["price", "pb", "buy_pb"]].astype("float64").replace(0, np.nan)
+    raw["distance"] = raw["distance"].astype("float64")
+    # 未评分（含评分失败）留空
+    ai_score = raw["ai_score"].astype("float64")
+    raw["ai_score"] = ai_score.where(ai_score > 0)
+    raw["scanned_at"] = pd.to_datetime(raw["scanned_at"])
+
+    st.dataframe(
+        raw,
+        use_container_width=True,
+        hide_index=True,
+        height=300,
+        column_order=("in_pool", "distance", "code", "name", "industry", "price", "pb", "buy_pb", "ai_score", "scanned_at"),
+        column_config={
+            "in_pool": st.column_config.CheckboxColumn("已加入"),
+            "distance": st.column_config.NumberColumn("距离", format="%+.1f%%", help="当前PB距请客价的百分比，≤0 表示已进入请客价"),
+            "code": st.column_config.TextColumn("代码"),
+            "name": st.column_config.TextColumn("名称"),
+            "industry": st.column_config.TextColumn("行业"),
+            "price": st.column_config.NumberColumn("现价", format="¥%.2f"),
+            "pb": st.column_config.NumberColumn("当前PB", format="%.2f"),
+            "buy_pb": st.column_config.NumberColumn("请客价PB", format="%.2f"),
+            "ai_score": st.column_config.NumberColumn("AI评分", format="%d分", help="留空表示尚未评分"),
+            "scanned_at": st.column_config.DatetimeColumn("扫描时间", format="MM-DD HH:mm")
+        }
+    )
 
     # Batch operations
     st.divider()
 
-    available_candidates = [c for c in candidates if c.code not in existing_stocks]
+    # 尚未加入股票池的备选股：{代码: 名称}
+    available = raw.loc[~in_pool]
+    available_names = dict(zip(available["code"], available["name"]))
 
-    if available_candidates:
-        selected_candidates = st.multiselect(
+    if available_names:
+        # 选项直接用代码，显示名由 format_func 查表生成，免去从标签字符串解析代码
+        selected_codes = st.multiselect(
             "选择要加入股票池的股票",
-            options=[f"{c.name} ({c.code})" for c in available_candidates],
+            options=list(available_names),
+            format_func=lambda code: f"{available_names[code]} ({code})",
             default=[]
         )
 
         col1, col2, col3 = st.columns(3)
 
         with col1:
-            if st.button("✅ 添加选中到股票池", type="primary", use_container_width=True) and selected_candidates:
-                success = 0
-                for sel in selected_candidates:
-                    code = sel.split('(')[-1].replace(')', '').strip()
-                    c = next((x for x in available_candidates if x.code == code), None)
-                    if c:
-                        try:
-                            # 使用推荐的阈值
-                            add_pb = c.recommended_add_pb if c.recommended_add_pb else c.min_pb
-                            sell_pb = c.recommended_sell_pb if c.recommended_sell_pb else c.avg_pb
-
-                            asset = stock_service.add_stock(
-                                code=c.code,
-                                name=c.name,
-                                market=Market.A_SHARE,
-                                industry=c.industry,
-                                competence_score=3,
-                                notes=f"后台扫描推荐 - 距请客价{c.pb_distance_pct:+.1f}%",
-                                buy_pb=c.recommended_buy_pb,
-                                add_pb=add_pb,
-                                sell_pb=sell_pb
-                            )
-                            # 同步 AI 评分到 Asset 表
-                            if c.ai_score:
-                                stock_service.update_stock(
-                                    c.code,
-                                    ai_score=c.ai_score,
-                                    ai_suggestion=c.ai_suggestion
-                                )
-                                # 同步 AI 评分到 AIAnalysisReport 表
-                                sync_ai_report_to_database(
-                                    session, user_id, c.code, c.name,
-                                    c.ai_score, c.ai_suggestion
-                                )
-                            c.status = CandidateStatus.ADDED
-                            success += 1
-                        except Exception as e:
-                            print(f"添加股票失败 {c.code}: {e}")
-                session.commit()
-                if success:
-                    st.success(f"✅ 成功添加 {success} 只股票！")
-                    st.rerun()
+            if st.button("✅ 添加选中到股票池", type="primary", use_container_width=True) and selected_codes:
+                # 只为选中的股票取完整记录（推荐阈值、AI 建议等）
+                chosen = session.scalars(
+                    select(StockCandidate).where(
+                        StockCandidate.user_id == user_id,
+                        StockCandidate.status == CandidateStatus.PENDING,
+                        StockCandidate.code.in_(selected_codes)
+                    )
+                ).all()
+                try:
+                    # 股票、阈值、报告同步与状态更新合并为一个事务（使用推荐的阈值，AI 评分直接写入 Asset）
+                    added = stock_service.add_stocks([
+                        {
+                            "code": c.code,
+                            "name": c.name,
+                            "market": Market.A_SHARE,
+                            "industry": c.industry,
+                            "competence_score": 3,
+                            "ai_score": c.ai_score or None,
+                            "ai_suggestion": c.ai_suggestion if c.ai_score else None,
+                            "notes": f"后台扫描推荐 - 距请客价{c.pb_distance_pct:+.1f}%",
+                            "buy_pb": c.recommended_buy_pb,
+                            "add_pb": c.recommended_add_pb if c.recommended_add_pb else c.min_pb,
+                            "sell_pb": c.recommended_sell_pb if c.recommended_sell_pb else c.avg_pb
+                        }
+                        for c in chosen
+                    ], commit=False)
+                    added_codes = {a.code for a in added}
+                    if added_codes:
+                        # 同步 AI 评分到 AIAnalysisReport 表
+                        sync_ai_reports_to_database(
+                            session, user_id,
+                            [c for c in chosen if c.code in added_codes and c.ai_score]
+                        )
+                        # 一条 UPDATE 标记已添加
+                        session.execute(
+                            update(StockCandidate).where(
+                                StockCandidate.user_id == user_id,
+                                StockCandidate.status == CandidateStatus.PENDING,
+                                StockCandidate.code.in_(added_codes)
+                            ).values(status=CandidateStatus.ADDED, updated_at=datetime.now())
+                        )
+                        session.commit()
+                        load_stock_pool.clear(user_id)
+                        load_recent_reports.clear(user_id)
+                        for code in added_codes:
+                            load_stored_report.clear(user_id, code)
+                        st.success(f"✅ 成功添加 {len(added_codes)} 只股票！")
+                        st.rerun()
+                except Exception as e:
+                    session.rollback()
+                    st.error(f"添加股票失败: {e}")
 
         with col2:
-            if st.button("🗑️ 忽略选中", use_container_width=True) and selected_candidates:
-                for sel in selected_candidates:
-                    code = sel.split('(')[-1].replace(')', '').strip()
-                    c = next((x for x in available_candidates if x.code == code), None)
-                    if c:
-                        c.status = CandidateStatus.IGNORED
+            if st.button("🗑️ 忽略选中", use_container_width=True) and selected_codes:
+                # 一条 UPDATE 标记已忽略
+                session.execute(
+                    update(StockCandidate).where(
+                        StockCandidate.user_id == user_id,
+                        StockCandidate.status == CandidateStatus.PENDING,
+                        StockCandidate.code.in_(selected_codes)
+                    ).values(status=CandidateStatus.IGNORED, updated_at=datetime.now())
+                )
                 session.commit()
                 st.info("已忽略选中股票")
                 st.rerun()
@@ -338,47 +413,27 @@ if candidates:
     st.divider()
     st.markdown("#### 🤖 AI 评分统计")
 
-    scored_candidates = [c for c in available_candidates if c.ai_score and c.ai_score > 0]
-    unscored_candidates = [c for c in available_candidates if not c.ai_score]
-
-    col1, col2, col3 = st.columns(3)
-
-    with col1:
-        st.metric("已评分", f"{len(scored_candidates)} 只")
+    render_ai_score_stats(scanner)
 
-    with col2:
-        if scored_candidates:
-            avg_score = sum(c.ai_score for c in scored_candidates) / len(scored_candidates)
-            st.metric("平均评分", f"{avg_score:.1f}分")
-        else:
-            st.metric("平均评分", "-")
-
-    with col3:
-        high_score_count = len([c for c in scored_candidates if c.ai_score >= 80])
-        st.metric("高分(≥80)", f"{high_score_count} 只")
-
-    if unscored_candidates:
-        st.caption(f"💡 有 {len(unscored_candidates)} 只股票待评分，后台扫描时会自动进行AI评分")
 else:
     st.info("备选池为空，启动后台扫描后符合条件的股票会自动加入")
 
 # Show ignored/added history
 with st.expander("📜 历史记录"):
-    col1, col2 = st.columns(2)
-
-    with col1:
-        added = session.query(StockCandidate).filter(
-            StockCandidate.status == CandidateStatus.ADDED,
-            StockCandidate.user_id == user_id
-        ).count()
-        st.metric("已添加", f"{added} 只")
-
-    with col2:
-        ignored = session.query(StockCandidate).filter(
-            StockCandidate.status == CandidateStatus.IGNORED,
-            StockCandidate.user_id == user_id
-        ).count()
-        st.metric("已忽略", f"{ignored} 只")
+    # 未打开开关时跳过统计查询；打开后一次 GROUP BY 取回各状态数量
+    if st.toggle("显示统计", key="show_candidate_history"):
+        status_counts = dict(session.execute(
+            select(StockCandidate.status, func.count(StockCandidate.id)).where(
+                StockCandidate.user_id == user_id,
+                StockCandidate.status.in_([CandidateStatus.ADDED, CandidateStatus.IGNORED])
+            ).group_by(StockCandidate.status)
+        ).all())
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("已添加", f"{status_counts.get(CandidateStatus.ADDED, 0)} 只")
+        with col2:
+            st.metric("已忽略", f"{status_counts.get(CandidateStatus.IGNORED, 0)} 只")
 
     if st.button("🗑️ 清空所有历史"):
         session.query(StockCandidate).filter(
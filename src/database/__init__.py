@@ -2,10 +2,10 @@ from .models import (
     Base, Asset, Threshold, Valuation, PortfolioPosition, Signal, Action, Cost, VisitLog,
     StockCandidate, ScanProgress, CandidateStatus
 )
-from .connection import get_engine, get_session, init_db, session_scope
+from .connection import get_engine, get_session, get_scoped_session, init_db, session_scope
 
 __all__ = [
     'Base', 'Asset', 'Threshold', 'Valuation', 'PortfolioPosition',
     'Signal', 'Action', 'Cost', 'VisitLog', 'StockCandidate', 'ScanProgress',
-    'CandidateStatus', 'get_engine', 'get_session', 'init_db', 'session_scope'
+    'CandidateStatus', 'get_engine', 'get_session', 'get_scoped_session', 'init_db', 'session_scope'
 ]
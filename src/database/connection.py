@@ -2,6 +2,7 @@
 import os
 import sys
 import sqlite3
+import threading
 from contextlib import contextmanager
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, Session
@@ -25,21 +26,33 @@ def get_db_path():
 # Database file path
 DB_PATH = get_db_path()
 
+# 连接池：页面会话、后台扫描/评分线程与报告生成线程池共用同一个引擎
+POOL_SIZE = 10
+MAX_OVERFLOW = 20
+
 _engine = None
 _SessionLocal = None
+_engine_lock = threading.Lock()
+_db_initialized = False
+_init_lock = threading.Lock()
 
 
 def get_engine():
-    """Get or create database engine."""
+    """Get or create database engine (进程内唯一，多线程并发首次调用时也只创建一次)."""
     global _engine, DB_PATH
     if _engine is None:
-        # Refresh DB_PATH in case environment changed
-        DB_PATH = get_db_path()
-        _engine = create_engine(
-            f"sqlite:///{DB_PATH}",
-            echo=False,
-            connect_args={"check_same_thread": False}  # Allow multi-thread access
-        )
+        with _engine_lock:
+            if _engine is None:
+                # Refresh DB_PATH in case environment changed
+                DB_PATH = get_db_path()
+                _engine = create_engine(
+                    f"sqlite:///{DB_PATH}",
+                    echo=False,
+                    pool_size=POOL_SIZE,
+                    max_overflow=MAX_OVERFLOW,
+                    pool_pre_ping=True,  # Validate pooled connections before reuse
+                    connect_args={"check_same_thread": False}  # Allow multi-thread access
+                )
     return _engine
 
 
@@ -47,10 +60,40 @@ def get_session() -> Session:
     """Get a new database session."""
     global _SessionLocal
     if _SessionLocal is None:
-        _SessionLocal = sessionmaker(bind=get_engine())
+        engine = get_engine()
+        with _engine_lock:
+            if _SessionLocal is None:
+                _SessionLocal = sessionmaker(bind=engine)
     return _SessionLocal()
 
 
+def get_scoped_session() -> Session:
+    """
+    获取当前 Streamlit 会话复用的数据库会话
+
+    同一浏览器会话的多次重跑共用一个 Session 对象（保存在 st.session_state，
+    会话结束随之释放）。页面末尾的 session.close() 只把连接归还连接池，
+    Session 仍可在下次重跑时继续使用。上次重跑若中途中断（异常或 st.rerun），
+    遗留的事务在这里回滚。非 Streamlit 环境下返回新会话。
+    """
+    try:
+        import streamlit as st
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return get_session()
+
+    if get_script_run_ctx() is None:
+        return get_session()
+
+    session = st.session_state.get('_db_session')
+    if session is None:
+        session = get_session()
+        st.session_state['_db_session'] = session
+    elif session.in_transaction():
+        session.rollback()
+    return session
+
+
 @contextmanager
 def session_scope():
     """
@@ -241,14 +284,74 @@ def run_migrations(db_path: str):
         cursor.execute("PRAGMA foreign_keys=ON")
         print('Migration: Removed unique constraint on visit_logs.visit_date')
 
+    # Migration 7: Unique (user_id, visit_date) index so visits can be upserted atomically
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type='index' AND name='uq_visit_log_user_date'"
+    )
+    if not cursor.fetchone():
+        # 合并历史上同一用户同一天的重复记录，保留最早一行
+        cursor.execute('''
+            UPDATE visit_logs SET count = (
+                SELECT SUM(v2.count) FROM visit_logs v2
+                WHERE v2.user_id = visit_logs.user_id AND v2.visit_date = visit_logs.visit_date
+            )
+            WHERE user_id IS NOT NULL AND id IN (
+                SELECT MIN(id) FROM visit_logs WHERE user_id IS NOT NULL
+                GROUP BY user_id, visit_date HAVING COUNT(*) > 1
+            )
+        ''')
+        cursor.execute('''
+            DELETE FROM visit_logs
+            WHERE user_id IS NOT NULL AND id NOT IN (
+                SELECT MIN(id) FROM visit_logs WHERE user_id IS NOT NULL
+                GROUP BY user_id, visit_date
+            )
+        ''')
+        cursor.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS uq_visit_log_user_date ON visit_logs(user_id, visit_date)'
+        )
+        print('Migration: Added unique index on visit_logs(user_id, visit_date)')
+
+    # Migration 8: Index signals by (user_id, status) for open-signal lookups
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS ix_signal_user_status ON signals(user_id, status)'
+    )
+
+    # Migration 9: Composite indexes for the candidate pool and recent-report queries
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS ix_candidate_user_status_distance '
+        'ON stock_candidates(user_id, status, pb_distance_pct)'
+    )
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS ix_ai_report_user_updated ON ai_analysis_reports(user_id, updated_at)'
+    )
+
+    # Migration 10: Index pending candidates by scan time for the AI scoring loop
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS ix_candidate_user_status_scanned '
+        'ON stock_candidates(user_id, status, scanned_at)'
+    )
+
     conn.commit()
     conn.close()
 
 
 def init_db():
-    """Initialize database tables."""
-    engine = get_engine()
-    Base.metadata.create_all(engine)
+    """Initialize database tables.
+
+    每个页面在每次重跑时都会调用本函数，建表和迁移只需在进程内执行一次。
+    """
+    global _db_initialized
+    if _db_initialized:
+        return
+
+    with _init_lock:
+        if _db_initialized:
+            return
+
+        engine = get_engine()
+        Base.metadata.create_all(engine)
 
-    # Run migrations to add any missing columns/tables
-    run_migrations(DB_PATH)
+        # Run migrations to add any missing columns/tables
+        run_migrations(DB_PATH)
+        _db_initialized = True
@@ -150,6 +150,10 @@ class Signal(Base):
     status = Column(SQLEnum(SignalStatus), default=SignalStatus.OPEN)
     created_at = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        Index("ix_signal_user_status", "user_id", "status"),
+    )
+
     asset = relationship("Asset", back_populates="signals")
 
 
@@ -219,6 +223,10 @@ class VisitLog(Base):
     count = Column(Integer, default=1)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__ = (
+        Index("uq_visit_log_user_date", "user_id", "visit_date", unique=True),
+    )
+
 
 class CandidateStatus(str, Enum):
     PENDING = "PENDING"      # 待处理
@@ -252,6 +260,13 @@ class StockCandidate(Base):
     scanned_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__ = (
+        # 备选池主查询：按用户、状态过滤后按距请客价排序
+        Index("ix_candidate_user_status_distance", "user_id", "status", "pb_distance_pct"),
+        # AI 评分线程：按用户、状态过滤后按扫描时间取最早的未评分股票
+        Index("ix_candidate_user_status_scanned", "user_id", "status", "scanned_at"),
+    )
+
 
 class ScanProgress(Base):
     """扫描进度记录"""
@@ -308,6 +323,11 @@ class AIAnalysisReport(Base):
     created_at = Column(DateTime, default=datetime.now)     # 报告生成时间
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__ = (
+        # 最近报告列表：按用户取最近更新的若干份
+        Index("ix_ai_report_user_updated", "user_id", "updated_at"),
+    )
+
 
 class IndustryConfig(Base):
     """行业配置和默认阈值模板"""
@@ -1,7 +1,8 @@
 """Action service for trade execution logging."""
 from typing import List, Optional, Tuple
 from datetime import date, datetime
-from sqlalchemy.orm import Session
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session, joinedload
 
 from ..database.models import (
     Asset, Action, ActionType, Signal, SignalStatus,
@@ -240,36 +241,51 @@ class ActionService:
 
         return query.order_by(Action.action_date.desc()).all()
 
+    # 合规详情最多返回的违规条数
+    MAX_VIOLATIONS = 50
+
     def get_compliance_stats(self, days: int = 90) -> dict:
-        """获取合规统计"""
+        """获取合规统计（计数在 SQL 中聚合，违规详情带出对应股票）"""
         from datetime import timedelta
         start_date = date.today() - timedelta(days=days)
 
-        actions = self.session.query(Action).filter(
+        filters = (
             Action.action_date >= start_date,
             Action.action_type != ActionType.HOLD,
             Action.user_id == self.user_id
-        ).all()
+        )
+
+        total, compliant = self.session.query(
+            func.count(Action.id),
+            func.coalesce(func.sum(case((Action.rule_compliance == True, 1), else_=0)), 0)
+        ).filter(*filters).one()
 
-        if not actions:
+        if not total:
             return {
                 'total_actions': 0,
                 'compliant_actions': 0,
+                'violation_count': 0,
                 'compliance_rate': 100.0,
                 'violations': []
             }
 
-        compliant = [a for a in actions if a.rule_compliance]
-        violations = [a for a in actions if not a.rule_compliance]
+        violations = self.session.query(Action).options(
+            joinedload(Action.asset)
+        ).filter(
+            *filters,
+            Action.rule_compliance.is_not(True)
+        ).order_by(Action.action_date.desc()).limit(self.MAX_VIOLATIONS).all()
 
         return {
-            'total_actions': len(actions),
-            'compliant_actions': len(compliant),
-            'compliance_rate': (len(compliant) / len(actions)) * 100,
+            'total_actions': total,
+            'compliant_actions': compliant,
+            'violation_count': total - compliant,
+            'compliance_rate': (compliant / total) * 100,
             'violations': [
                 {
                     'action_id': a.id,
                     'asset_id': a.asset_id,
+                    'asset_name': a.asset.name if a.asset else None,
                     'date': a.action_date,
                     'type': a.action_type.value,
                     'note': a.compliance_note
@@ -279,7 +295,9 @@ class ActionService:
         }
 
     def get_recent_actions(self, limit: int = 10) -> List[Action]:
-        """获取最近的动作"""
-        return self.session.query(Action).filter(
+        """获取最近的动作（同一查询带出 action.asset）"""
+        return self.session.query(Action).options(
+            joinedload(Action.asset)
+        ).filter(
             Action.user_id == self.user_id
         ).order_by(Action.created_at.desc()).limit(limit).all()
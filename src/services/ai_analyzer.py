@@ -1,9 +1,10 @@
 """AI-powered stock analysis using Qwen API (Alibaba Cloud)."""
-from typing import Optional, Dict, List
+from typing import Callable, Optional, Dict, List
 from dataclasses import dataclass
 from datetime import datetime, date, timedelta
 import os
 import time
+import threading
 
 try:
     from openai import OpenAI
@@ -24,6 +25,10 @@ QWEN_MODEL = "qwen3-max"
 QWEN_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 ENABLE_THINKING = True  # 开启深度思考模式
 
+# 进程内共享的 AIAnalyzer（页面与后台扫描线程共用）
+_shared_analyzer: Optional["AIAnalyzer"] = None
+_shared_analyzer_lock = threading.Lock()
+
 
 def get_qwen_api_key() -> Optional[str]:
     """Get Qwen API key from Streamlit secrets or environment variable."""
@@ -79,39 +84,52 @@ class AIAnalyzer:
 
     def __init__(self, api_key: str = None):
         self.api_key = api_key or get_qwen_api_key()
-        self.last_error = None
+        self.init_error = None
         self.client = None
         self._pro = None
+        # 调用错误按线程隔离，便于多个会话共享同一实例
+        self._local = threading.local()
 
         if not OPENAI_AVAILABLE:
-            self.last_error = "OpenAI 库未安装或版本过低，请运行: pip install openai>=1.0.0"
+            self.init_error = "OpenAI 库未安装或版本过低，请运行: pip install openai>=1.0.0"
         elif self.api_key:
             try:
                 self.client = OpenAI(api_key=self.api_key, base_url=QWEN_BASE_URL)
             except Exception as e:
-                self.last_error = f"OpenAI 客户端初始化失败: {e}"
+                self.init_error = f"OpenAI 客户端初始化失败: {e}"
         else:
-            self.last_error = "未配置 Qwen API Key，请在 Streamlit Secrets 中设置 QWEN_API_KEY"
+            self.init_error = "未配置 Qwen API Key，请在 Streamlit Secrets 中设置 QWEN_API_KEY"
 
         # 初始化 Tushare
         self._init_tushare()
 
+    @property
+    def last_error(self) -> Optional[str]:
+        """当前线程最近一次调用的错误信息，未调用过时返回初始化错误"""
+        return getattr(self._local, 'last_error', self.init_error)
+
+    @last_error.setter
+    def last_error(self, value: Optional[str]):
+        self._local.last_error = value
+
     def _init_tushare(self):
         """初始化 Tushare API"""
         if not TUSHARE_AVAILABLE:
             return
 
         try:
-            from src.services.stock_analyzer import get_tushare_token
-            token = get_tushare_token()
-            if token:
-                ts.set_token(token)
-                self._pro = ts.pro_api()
+            from src.services.stock_analyzer import get_tushare_pro
+            self._pro = get_tushare_pro()
         except Exception as e:
             print(f"Tushare 初始化失败: {e}")
 
-    def _call_openai(self, prompt: str) -> Optional[str]:
-        """调用 Qwen API (OpenAI 兼容模式，支持 Thinking 深度思考)"""
+    def _call_openai(self, prompt: str, on_delta: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """
+        调用 Qwen API (OpenAI 兼容模式，支持 Thinking 深度思考)
+
+        传入 on_delta 时以流式方式请求，每收到一段正文就回调一次（参数为增量文本），
+        调用方可边生成边展示；返回值仍是完整正文。
+        """
         if not self.client:
             self.last_error = "未配置 Qwen API Key，请在 Streamlit Secrets 中设置 QWEN_API_KEY"
             return None
@@ -137,17 +155,38 @@ class AIAnalyzer:
                 request_params["temperature"] = 0.7
                 request_params["max_tokens"] = 4096
 
-            response = self.client.chat.completions.create(**request_params)
+            if on_delta is None:
+                response = self.client.chat.completions.create(**request_params)
+
+                # 获取回复内容
+                message = response.choices[0].message
+                content = message.content
 
-            # 获取回复内容
-            message = response.choices[0].message
-            content = message.content
+                # 如果有 thinking 内容，可以在日志中输出（用于调试）
+                if hasattr(message, 'reasoning_content') and message.reasoning_content:
+                    print(f"[Thinking] 思考过程: {len(message.reasoning_content)} 字符")
 
-            # 如果有 thinking 内容，可以在日志中输出（用于调试）
-            if hasattr(message, 'reasoning_content') and message.reasoning_content:
-                print(f"[Thinking] 思考过程: {len(message.reasoning_content)} 字符")
+                return content
 
-            return content
+            # 流式请求：正文增量逐段回调，结束后拼接为完整内容
+            request_params["stream"] = True
+            parts = []
+            reasoning_chars = 0
+            for chunk in self.client.chat.completions.create(**request_params):
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                reasoning = getattr(delta, 'reasoning_content', None)
+                if reasoning:
+                    reasoning_chars += len(reasoning)
+                if delta.content:
+                    parts.append(delta.content)
+                    on_delta(delta.content)
+
+            if reasoning_chars:
+                print(f"[Thinking] 思考过程: {reasoning_chars} 字符")
+
+            return "".join(parts) or None
 
         except Exception as e:
             error_str = str(e)
@@ -311,9 +350,10 @@ class AIAnalyzer:
         pb_history: List[Dict] = None,
         threshold_buy: float = None,
         threshold_add: float = None,
-        threshold_sell: float = None
+        threshold_sell: float = None,
+        on_delta: Optional[Callable[[str], None]] = None
     ) -> Optional[AnalysisReport]:
-        """生成 AI 分析报告"""
+        """生成 AI 分析报告（传入 on_delta 时流式接收正文，见 _call_openai）"""
 
         # 构建分析数据摘要
         pe_str = f"{fundamental.pe_ttm:.2f}倍" if fundamental.pe_ttm else "未知"
@@ -449,7 +489,7 @@ PB历史数据 (近5年):
 (用3-6条要点解释为什么是这个分数；若数据缺失导致不确定性，必须下调或标注)"""
 
         # 调用 Qwen3-max API
-        response = self._call_openai(prompt)
+        response = self._call_openai(prompt, on_delta=on_delta)
 
         if not response:
             return None
@@ -551,8 +591,8 @@ PB历史数据 (近5年):
             ai_score=ai_score
         )
 
-    def quick_analysis(self, code: str) -> Optional[str]:
-        """快速分析（简化版）"""
+    def quick_analysis(self, code: str, on_delta: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """快速分析（简化版，on_delta 同 _call_openai）"""
         fundamental = self.fetch_fundamental_data(code)
 
         if not fundamental:
@@ -574,4 +614,21 @@ PB历史数据 (近5年):
 
 请简要评估其估值水平和投资价值。"""
 
-        return self._call_openai(prompt)
+        return self._call_openai(prompt, on_delta=on_delta)
+
+
+def get_shared_ai_analyzer() -> AIAnalyzer:
+    """
+    获取进程内共享的 AIAnalyzer
+
+    OpenAI 客户端与 Tushare 连接只创建一次；last_error 按线程隔离，
+    页面会话与后台扫描线程共用同一实例不会互相覆盖错误信息。
+    未配置 API Key 时实例的 client 为 None，由调用方判断是否可用。
+    """
+    global _shared_analyzer
+
+    if _shared_analyzer is None:
+        with _shared_analyzer_lock:
+            if _shared_analyzer is None:
+                _shared_analyzer = AIAnalyzer()
+    return _shared_analyzer
@@ -1,6 +1,7 @@
 """Background stock scanner service for smart stock selection."""
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import json
 import os
 from datetime import datetime, timedelta
@@ -13,9 +14,11 @@ except ImportError:
     ts = None
     TUSHARE_AVAILABLE = False
 
+from sqlalchemy import select, func
 from src.database import get_session, init_db
 from src.database.models import StockCandidate, ScanProgress, CandidateStatus, Asset
-from src.services.ai_analyzer import AIAnalyzer, get_qwen_api_key
+from src.services.ai_analyzer import AIAnalyzer, get_shared_ai_analyzer
+from src.services.stock_pool import StockPoolService
 from src.services.stock_analyzer import _load_stock_basic_cache, _save_stock_basic_cache
 
 # 缓存文件路径
@@ -38,17 +41,18 @@ class BackgroundScanner:
         self._ai_stop_event = threading.Event()
         self._ai_thread: Optional[threading.Thread] = None
         self._ai_scoring_interval = 30  # AI评分间隔(秒)
+        self._ai_scoring_batch = 4  # 每轮并发评分的股票数（兼顾 LLM 接口频率限制）
 
     def _get_ai_analyzer(self) -> Optional[AIAnalyzer]:
-        """获取 AI 分析器实例（延迟初始化）"""
+        """获取 AI 分析器实例（延迟初始化，与页面共用进程内实例）"""
         if not self._enable_ai_scoring:
             return None
         if self._ai_analyzer is None:
-            api_key = get_qwen_api_key()
-            if api_key:
-                self._ai_analyzer = AIAnalyzer(api_key)
-            else:
-                print("未配置 Qwen API Key，AI 评分功能已禁用")
+            analyzer = get_shared_ai_analyzer()
+            if not analyzer.client:
+                print(f"{analyzer.init_error}，AI 评分功能已禁用")
+                return None
+            self._ai_analyzer = analyzer
         return self._ai_analyzer
 
     def get_ai_score(self, code: str, name: str = None) -> Optional[dict]:
@@ -123,15 +127,12 @@ class BackgroundScanner:
 
         try:
             print("使用 Tushare 获取股票列表...")
-            from src.services.stock_analyzer import get_tushare_token
-            token = get_tushare_token()
-            if not token:
+            from src.services.stock_analyzer import get_tushare_pro
+            pro = get_tushare_pro()
+            if not pro:
                 print("Tushare Token 未配置")
                 return stocks
 
-            ts.set_token(token)
-            pro = ts.pro_api()
-
             # 获取所有A股列表
             df = pro.stock_basic(
                 exchange='',
@@ -180,14 +181,11 @@ class BackgroundScanner:
                 return None
 
             try:
-                from src.services.stock_analyzer import get_tushare_token
-                token = get_tushare_token()
-                if not token:
+                from src.services.stock_analyzer import get_tushare_pro
+                pro = get_tushare_pro()
+                if not pro:
                     print("Tushare Token 未配置")
                     return None
-
-                ts.set_token(token)
-                pro = ts.pro_api()
             except Exception as e:
                 print(f"Tushare 初始化失败: {e}")
                 return None
@@ -417,12 +415,14 @@ class BackgroundScanner:
             db_session.commit()
             print(f"共获取 {len(stocks)} 只股票")
 
-            # 获取已在股票池中的股票
-            existing_codes = set(
-                a.code for a in db_session.query(Asset.code).filter(
-                    Asset.user_id == self.user_id
-                ).all()
-            )
+            # 已在股票池或备选池（待处理）中的股票一次取回，循环内不再逐只查库
+            existing_codes = StockPoolService(db_session, self.user_id).get_all_codes()
+            existing_codes.update(db_session.scalars(
+                select(StockCandidate.code).where(
+                    StockCandidate.status == CandidateStatus.PENDING,
+                    StockCandidate.user_id == self.user_id
+                )
+            ))
 
             # 从上次位置继续扫描
             start_index = progress.current_index
@@ -435,24 +435,11 @@ class BackgroundScanner:
                 stock = stocks[i]
                 code = stock['code']
 
-                # 跳过已在股票池的
+                # 跳过已在股票池或备选池的（进度随下一只分析的股票一并提交）
                 full_code = f"{code}.SH" if code.startswith('6') else f"{code}.SZ"
                 if full_code in existing_codes:
                     progress.current_index = i + 1
                     progress.last_scanned_code = code
-                    db_session.commit()
-                    continue
-
-                # 跳过已在备选池的
-                existing_candidate = db_session.query(StockCandidate).filter(
-                    StockCandidate.code == full_code,
-                    StockCandidate.status == CandidateStatus.PENDING,
-                    StockCandidate.user_id == self.user_id
-                ).first()
-                if existing_candidate:
-                    progress.current_index = i + 1
-                    progress.last_scanned_code = code
-                    db_session.commit()
                     continue
 
                 # 分析股票
@@ -497,6 +484,7 @@ class BackgroundScanner:
                             status=CandidateStatus.PENDING
                         )
                         db_session.add(candidate)
+                        existing_codes.add(candidate.code)
                         if self._enable_ai_scoring:
                             self.ensure_ai_scoring_running()
 
@@ -549,6 +537,39 @@ class BackgroundScanner:
             db_session.close()
         return None
 
+    def get_ai_score_stats(self) -> dict:
+        """
+        待处理备选股（不含已在股票池的）的 AI 评分统计，一条聚合查询完成
+
+        Returns:
+            {'scored', 'unscored', 'avg_score', 'high_score'}；ai_score 为 -1 表示评分失败，不计入两者
+        """
+        score = StockCandidate.ai_score
+        db_session = get_session()
+        try:
+            scored, unscored, avg_score, high_score = db_session.execute(
+                select(
+                    func.count().filter(score > 0),
+                    func.count().filter((score == None) | (score == 0)),
+                    func.avg(score).filter(score > 0),
+                    func.count().filter(score >= 80)
+                ).where(
+                    StockCandidate.user_id == self.user_id,
+                    StockCandidate.status == CandidateStatus.PENDING,
+                    StockCandidate.code.not_in(
+                        select(Asset.code).where(Asset.user_id == self.user_id)
+                    )
+                )
+            ).one()
+        finally:
+            db_session.close()
+        return {
+            'scored': scored,
+            'unscored': unscored,
+            'avg_score': avg_score,
+            'high_score': high_score
+        }
+
     def get_candidates(self, status: CandidateStatus = None) -> List[StockCandidate]:
         """获取备选池股票"""
         db_session = get_session()
@@ -644,31 +665,33 @@ class BackgroundScanner:
         while not self._ai_stop_event.is_set():
             db_session = get_session()
             try:
-                # 查找未评分的备选股票，按添加时间从早到晚排序
-                unscored = db_session.query(StockCandidate).filter(
+                # 查找未评分的备选股票，按添加时间从早到晚排序，每轮取一批
+                unscored_list = db_session.query(StockCandidate).filter(
                     StockCandidate.status == CandidateStatus.PENDING,
                     StockCandidate.user_id == self.user_id,
                     (StockCandidate.ai_score == None) | (StockCandidate.ai_score == 0)
-                ).order_by(StockCandidate.scanned_at.asc()).first()
-
-                if unscored:
-                    print(f"[AI评分] 正在评分: {unscored.name} ({unscored.code})")
-
-                    # 获取AI评分
-                    ai_result = self.get_ai_score(unscored.code, unscored.name)
-
-                    if ai_result:
-                        unscored.ai_score = ai_result['ai_score']
-                        unscored.ai_suggestion = ai_result['ai_suggestion']
-                        unscored.updated_at = datetime.now()
-                        db_session.commit()
-                        print(f"[AI评分] {unscored.name} 评分完成: {ai_result['ai_score']}分")
-                    else:
-                        # 标记为已尝试评分（设为-1表示评分失败）
-                        unscored.ai_score = -1
-                        unscored.updated_at = datetime.now()
-                        db_session.commit()
-                        print(f"[AI评分] {unscored.name} 评分失败")
+                ).order_by(StockCandidate.scanned_at.asc()).limit(self._ai_scoring_batch).all()
+
+                if unscored_list:
+                    print(f"[AI评分] 正在评分: {', '.join(f'{c.name} ({c.code})' for c in unscored_list)}")
+
+                    # 基本面与 LLM 请求均为网络 IO，一批股票并发评分
+                    targets = [(c.code, c.name) for c in unscored_list]
+                    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+                        ai_results = list(executor.map(lambda t: self.get_ai_score(*t), targets))
+
+                    now = datetime.now()
+                    for unscored, ai_result in zip(unscored_list, ai_results):
+                        if ai_result:
+                            unscored.ai_score = ai_result['ai_score']
+                            unscored.ai_suggestion = ai_result['ai_suggestion']
+                            print(f"[AI评分] {unscored.name} 评分完成: {ai_result['ai_score']}分")
+                        else:
+                            # 标记为已尝试评分（设为-1表示评分失败）
+                            unscored.ai_score = -1
+                            print(f"[AI评分] {unscored.name} 评分失败")
+                        unscored.updated_at = now
+                    db_session.commit()
 
             except Exception as e:
                 print(f"[AI评分] 评分出错: {e}")
@@ -686,10 +709,15 @@ class BackgroundScanner:
 
 # 全局扫描器实例
 _scanner_instance: dict[int, BackgroundScanner] = {}
+_scanner_lock = threading.Lock()
 
 
 def get_scanner(user_id: int) -> BackgroundScanner:
-    """获取全局扫描器实例"""
-    if user_id not in _scanner_instance:
-        _scanner_instance[user_id] = BackgroundScanner(user_id)
-    return _scanner_instance[user_id]
+    """获取全局扫描器实例（并发会话同时首次访问时也只创建一个）"""
+    scanner = _scanner_instance.get(user_id)
+    if scanner is None:
+        with _scanner_lock:
+            scanner = _scanner_instance.get(user_id)
+            if scanner is None:
+                scanner = _scanner_instance[user_id] = BackgroundScanner(user_id)
+    return scanner
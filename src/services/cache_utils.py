@@ -4,16 +4,24 @@ Streamlit缓存工具
 """
 import streamlit as st
 from functools import wraps
-from typing import Callable, Any
+from dataclasses import dataclass, fields
+from datetime import date, datetime
+from typing import Callable, Any, List, Optional
 import hashlib
 import json
+import time
 
 
 # 缓存配置常量
 TTL_REALTIME_QUOTE = 10  # 实时行情缓存：10秒
+TTL_BATCH_QUOTES = 15  # 批量行情缓存：15秒
 TTL_HISTORICAL_DATA = 3600  # 历史数据缓存：1小时
 TTL_STOCK_INFO = 86400  # 股票基本信息缓存：1天
 TTL_AI_REPORT = 604800  # AI报告缓存：7天
+TTL_STOCK_POOL = 300  # 股票池及阈值缓存：5分钟（增删改时主动失效）
+TTL_PB_HISTORY = 300  # 数据库中的PB历史缓存：5分钟（写入时主动失效）
+TTL_RECENT_REPORTS = 30  # 最近分析报告列表缓存：30秒（保存报告时主动失效）
+TTL_STORED_REPORT = 300  # 单只股票已保存报告缓存：5分钟（保存报告时主动失效）
 
 
 def cache_realtime_quote(func: Callable) -> Callable:
@@ -57,6 +65,221 @@ def cache_ai_report(func: Callable) -> Callable:
     return st.cache_data(ttl=TTL_AI_REPORT, show_spinner=False)(func)
 
 
+@st.cache_resource(show_spinner=False)
+def get_realtime_service():
+    """进程内共享的 RealtimeService（Tushare 客户端只初始化一次）"""
+    from .realtime_service import RealtimeService
+    return RealtimeService()
+
+
+@st.cache_resource(show_spinner=False)
+def get_stock_analyzer():
+    """进程内共享的 StockAnalyzer"""
+    from .stock_analyzer import StockAnalyzer
+    return StockAnalyzer()
+
+
+def get_ai_analyzer():
+    """进程内共享的 AIAnalyzer（与后台扫描器共用同一实例）"""
+    from .ai_analyzer import get_shared_ai_analyzer
+    return get_shared_ai_analyzer()
+
+
+@st.cache_data(ttl=TTL_BATCH_QUOTES, show_spinner=False)
+def get_cached_batch_quotes(codes: tuple) -> dict:
+    """
+    缓存批量实时行情
+
+    Streamlit 每次交互都会重跑整个脚本，TTL 内的重跑直接复用上次结果，
+    不再请求行情接口。调用方应传入排序后的代码元组以保证缓存键稳定：
+        get_cached_batch_quotes(tuple(sorted(stock_codes)))
+
+    手动刷新时调用 get_cached_batch_quotes.clear() 使缓存失效。
+
+    休市期间若快照已包含最新交易日数据，直接返回快照，不再请求接口。
+    """
+    from .realtime_service import is_market_open, load_quote_snapshot, save_quote_snapshot
+
+    if not is_market_open():
+        snapshot = load_quote_snapshot(codes)
+        if snapshot is not None:
+            return snapshot
+
+    quotes = get_realtime_service().get_batch_quotes(list(codes))
+    if quotes:
+        save_quote_snapshot(codes, quotes)
+    return quotes
+
+
+def get_session_quotes(stock_codes) -> dict:
+    """
+    会话级行情复用
+
+    将最近一次批量行情连同时间戳保存在 st.session_state 中，
+    同一会话内的多个区块、跨页面跳转在 TTL 内直接复用同一份结果，
+    连 st.cache_data 的反序列化开销也省去。过期或代码集合变化时
+    回落到 get_cached_batch_quotes。
+    """
+    codes = tuple(sorted(stock_codes))
+    if not codes:
+        return {}
+
+    entry = st.session_state.get('realtime_quotes')
+    if entry and entry['codes'] == codes and time.time() - entry['ts'] < TTL_BATCH_QUOTES:
+        return entry['data']
+
+    data = get_cached_batch_quotes(codes)
+    st.session_state['realtime_quotes'] = {'codes': codes, 'ts': time.time(), 'data': data}
+    return data
+
+
+def clear_quotes_cache():
+    """手动刷新行情：同时清除会话级和全局行情缓存"""
+    st.session_state.pop('realtime_quotes', None)
+    get_cached_batch_quotes.clear()
+
+
+@dataclass(frozen=True)
+class PoolStock:
+    """股票池条目的只读快照（不依赖数据库会话，可安全缓存）"""
+    id: int
+    code: str
+    name: str
+    market: Any
+    industry: Optional[str]
+    competence_score: Optional[int]
+    ai_score: Optional[int]
+    ai_suggestion: Optional[str]
+    has_threshold: bool
+    buy_pb: Optional[float]
+    add_pb: Optional[float]
+    sell_pb: Optional[float]
+
+
+@st.cache_data(ttl=TTL_STOCK_POOL, show_spinner=False)
+def load_stock_pool(user_id: int) -> List[PoolStock]:
+    """
+    缓存用户股票池及阈值
+
+    阈值随股票一次预加载，结果转成 PoolStock 普通记录后缓存，
+    避免每次重跑都查库并返回脱离会话的 ORM 对象。
+    股票池或阈值变更后调用 load_stock_pool.clear(user_id) 使该用户的缓存失效。
+    """
+    from ..database import session_scope
+    from .stock_pool import StockPoolService
+
+    with session_scope() as session:
+        stocks = StockPoolService(session, user_id).get_all_stocks()
+        return [
+            PoolStock(
+                id=s.id,
+                code=s.code,
+                name=s.name,
+                market=s.market,
+                industry=s.industry,
+                competence_score=s.competence_score,
+                ai_score=s.ai_score,
+                ai_suggestion=s.ai_suggestion,
+                has_threshold=s.threshold is not None,
+                buy_pb=s.threshold.buy_pb if s.threshold else None,
+                add_pb=s.threshold.add_pb if s.threshold else None,
+                sell_pb=s.threshold.sell_pb if s.threshold else None
+            )
+            for s in stocks
+        ]
+
+
+@st.cache_data(ttl=TTL_PB_HISTORY, show_spinner=False)
+def load_pb_history(asset_id: int, start_date: Optional[date] = None):
+    """
+    缓存数据库中的 PB 历史（date/pb/price 三列的 DataFrame）
+
+    按 (asset_id, start_date) 缓存，重跑和切换标签时不再查库。
+    写入估值数据后调用 load_pb_history.clear() 使缓存失效。
+    """
+    from ..database import session_scope
+    from .valuation import ValuationService
+
+    with session_scope() as session:
+        return ValuationService(session).get_pb_history_df(asset_id, start_date=start_date)
+
+
+@dataclass(frozen=True)
+class ReportSummary:
+    """分析报告列表条目的只读快照（不含报告正文）"""
+    id: int
+    code: str
+    name: str
+    ai_score: Optional[int]
+    updated_at: datetime
+
+
+@st.cache_data(ttl=TTL_RECENT_REPORTS, show_spinner=False)
+def load_recent_reports(user_id: int, limit: int = 10) -> List[ReportSummary]:
+    """
+    缓存用户最近更新的分析报告列表
+
+    只查询列表展示所需的列，不加载报告正文。
+    保存或同步报告后调用 load_recent_reports.clear(user_id) 使该用户的列表失效。
+    """
+    from sqlalchemy import select
+    from ..database import session_scope
+    from ..database.models import AIAnalysisReport
+
+    with session_scope() as session:
+        rows = session.execute(
+            select(
+                AIAnalysisReport.id, AIAnalysisReport.code, AIAnalysisReport.name,
+                AIAnalysisReport.ai_score, AIAnalysisReport.updated_at
+            ).where(
+                AIAnalysisReport.user_id == user_id
+            ).order_by(AIAnalysisReport.updated_at.desc()).limit(limit)
+        ).all()
+        return [ReportSummary(*row) for row in rows]
+
+
+@dataclass(frozen=True)
+class StoredReport:
+    """已保存分析报告的只读快照（报告页展示所需字段）"""
+    id: int
+    code: str
+    name: str
+    summary: Optional[str]
+    valuation_analysis: Optional[str]
+    fundamental_analysis: Optional[str]
+    risk_analysis: Optional[str]
+    investment_suggestion: Optional[str]
+    pb_recommendation: Optional[str]
+    full_report: Optional[str]
+    ai_score: Optional[int]
+    price_at_report: Optional[float]
+    pb_at_report: Optional[float]
+    pe_at_report: Optional[float]
+    updated_at: datetime
+
+
+@st.cache_data(ttl=TTL_STORED_REPORT, show_spinner=False)
+def load_stored_report(user_id: int, code: str) -> Optional[StoredReport]:
+    """
+    缓存某只股票最近一次保存的分析报告
+
+    报告页每次重跑都要展示当前股票的报告，缓存后只在切换股票时查库。
+    保存或同步报告后调用 load_stored_report.clear(user_id, code) 使该报告缓存失效。
+    """
+    from sqlalchemy import select
+    from ..database import session_scope
+    from ..database.models import AIAnalysisReport
+
+    with session_scope() as session:
+        row = session.execute(
+            select(*(getattr(AIAnalysisReport, f.name) for f in fields(StoredReport))).where(
+                AIAnalysisReport.code == code,
+                AIAnalysisReport.user_id == user_id
+            ).order_by(AIAnalysisReport.created_at.desc()).limit(1)
+        ).first()
+        return StoredReport(*row) if row else None
+
+
 def cache_with_custom_ttl(ttl: int):
     """
     自定义TTL的缓存装饰器
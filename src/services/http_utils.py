@@ -15,7 +15,8 @@ class HTTPClient:
         timeout: int = 30,
         max_retries: int = 3,
         backoff_factor: float = 0.5,
-        status_forcelist: tuple = (429, 500, 502, 503, 504)
+        status_forcelist: tuple = (429, 500, 502, 503, 504),
+        pool_maxsize: int = 32
     ):
         """
         初始化HTTP客户端
@@ -25,6 +26,7 @@ class HTTPClient:
             max_retries: 最大重试次数
             backoff_factor: 重试退避因子
             status_forcelist: 需要重试的HTTP状态码
+            pool_maxsize: 每个主机的连接池大小（并发请求时复用 TCP/TLS 连接）
         """
         self.timeout = timeout
         self.max_retries = max_retries
@@ -38,7 +40,11 @@ class HTTPClient:
             allowed_methods=["GET", "POST"]
         )
 
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = HTTPAdapter(
+            max_retries=retry_strategy,
+            pool_connections=pool_maxsize,
+            pool_maxsize=pool_maxsize
+        )
         self.session.mount("http://", adapter)
         self.session.mount("https://", adapter)
 
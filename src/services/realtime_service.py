@@ -1,7 +1,12 @@
 """Real-time data fetching service using Tushare."""
-from typing import Optional, Dict, List
-from datetime import datetime, date, timedelta
-from dataclasses import dataclass
+from typing import Optional, Dict, List, Iterable
+from datetime import datetime, date, time, timedelta
+from dataclasses import dataclass, asdict
+from concurrent.futures import ThreadPoolExecutor
+from zoneinfo import ZoneInfo
+import os
+import json
+import threading
 
 try:
     import tushare as ts
@@ -9,6 +14,24 @@ try:
 except ImportError:
     TUSHARE_AVAILABLE = False
 
+# A股交易时段（北京时间，含集合竞价前后缓冲；不考虑节假日）
+MARKET_TZ = ZoneInfo('Asia/Shanghai')
+MARKET_OPEN_TIME = time(9, 25)
+MARKET_CLOSE_TIME = time(15, 5)
+# Tushare 日线数据通常在收盘后 15:30-17:00 发布
+DAILY_DATA_READY_TIME = time(17, 0)
+
+# 行情快照文件：休市期间直接复用，避免重复请求
+CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data')
+QUOTE_SNAPSHOT_FILE = os.path.join(CACHE_DIR, 'realtime_quotes_snapshot.json')
+_snapshot_lock = threading.Lock()
+
+# 全市场股票名称表：一次 stock_basic 请求，进程内缓存一天，所有实例共享
+NAME_MAP_TTL = timedelta(days=1)
+_name_map: Dict[str, str] = {}
+_name_map_time: Optional[datetime] = None
+_name_map_lock = threading.Lock()
+
 
 @dataclass
 class RealtimeQuote:
@@ -32,6 +55,11 @@ class RealtimeQuote:
 class RealtimeService:
     """实时数据服务 - 基于 Tushare"""
 
+    # 批量获取时的并发线程数（兼顾 Tushare 频率限制）
+    MAX_WORKERS = 8
+    # 单次请求合并的股票数
+    BATCH_SIZE = 80
+
     def __init__(self):
         self._cache: Dict[str, RealtimeQuote] = {}
         self._cache_time: Optional[datetime] = None
@@ -45,11 +73,8 @@ class RealtimeService:
             return
 
         try:
-            from src.services.stock_analyzer import get_tushare_token
-            token = get_tushare_token()
-            if token:
-                ts.set_token(token)
-                self._pro = ts.pro_api()
+            from src.services.stock_analyzer import get_tushare_pro
+            self._pro = get_tushare_pro()
         except Exception as e:
             print(f"Tushare 初始化失败: {e}")
 
@@ -67,6 +92,36 @@ class RealtimeService:
         else:
             return f"{code}.SH"
 
+    def _build_quote(self, ts_code: str, name: str, df_daily, pb, pe) -> RealtimeQuote:
+        """由单只股票按交易日倒序排列的日线数据构造行情"""
+        # 获取最新交易日数据
+        latest = df_daily.iloc[0]
+
+        # 获取前一交易日收盘价
+        prev_close = df_daily.iloc[1]['close'] if len(df_daily) > 1 else latest['close']
+
+        # 计算涨跌幅
+        price = latest['close']
+        change = price - prev_close
+        change_pct = (change / prev_close * 100) if prev_close > 0 else 0
+
+        return RealtimeQuote(
+            code=ts_code,
+            name=name,
+            price=price,
+            change=change,
+            change_pct=change_pct,
+            pb=pb,
+            pe=pe,
+            volume=int(latest['vol']) if 'vol' in latest else 0,
+            amount=latest['amount'] if 'amount' in latest else 0,
+            high=latest['high'] if 'high' in latest else price,
+            low=latest['low'] if 'low' in latest else price,
+            open=latest['open'] if 'open' in latest else price,
+            prev_close=prev_close,
+            update_time=datetime.now()
+        )
+
     def get_realtime_quote(self, code: str) -> Optional[RealtimeQuote]:
         """获取股票行情（使用Tushare最新日频数据）"""
         if not self._pro:
@@ -91,17 +146,11 @@ class RealtimeService:
                 print(f"未找到K线数据: {ts_code}")
                 return None
 
-            # 获取最新交易日数据
-            latest = df_daily.iloc[0]
-
-            # 获取前一交易日收盘价
-            prev_close = df_daily.iloc[1]['close'] if len(df_daily) > 1 else latest['close']
-
             # 获取基本面数据（PB、PE）
             df_basic = self._pro.daily_basic(
                 ts_code=ts_code,
-                start_date=latest['trade_date'],
-                end_date=latest['trade_date'],
+                start_date=df_daily.iloc[0]['trade_date'],
+                end_date=df_daily.iloc[0]['trade_date'],
                 fields='ts_code,trade_date,pb,pe'
             )
 
@@ -111,31 +160,10 @@ class RealtimeService:
                 pb = df_basic.iloc[0]['pb'] if 'pb' in df_basic.columns else None
                 pe = df_basic.iloc[0]['pe'] if 'pe' in df_basic.columns else None
 
-            # 获取股票名称
-            df_info = self._pro.stock_basic(ts_code=ts_code, fields='ts_code,name')
-            name = df_info.iloc[0]['name'] if df_info is not None and not df_info.empty else ts_code
-
-            # 计算涨跌幅
-            price = latest['close']
-            change = price - prev_close
-            change_pct = (change / prev_close * 100) if prev_close > 0 else 0
-
-            return RealtimeQuote(
-                code=ts_code,
-                name=name,
-                price=price,
-                change=change,
-                change_pct=change_pct,
-                pb=pb,
-                pe=pe,
-                volume=int(latest['vol']) if 'vol' in latest else 0,
-                amount=latest['amount'] if 'amount' in latest else 0,
-                high=latest['high'] if 'high' in latest else price,
-                low=latest['low'] if 'low' in latest else price,
-                open=latest['open'] if 'open' in latest else price,
-                prev_close=prev_close,
-                update_time=datetime.now()
-            )
+            # 获取股票名称（共享的全市场名称表）
+            name = self._get_name_map().get(ts_code, ts_code)
+
+            return self._build_quote(ts_code, name, df_daily, pb, pe)
 
         except Exception as e:
             print(f"获取行情失败 {ts_code}: {e}")
@@ -144,6 +172,53 @@ class RealtimeService:
 
         return None
 
+    def _get_name_map(self) -> Dict[str, str]:
+        """全部上市股票的名称（一次请求，进程内缓存 NAME_MAP_TTL）"""
+        global _name_map, _name_map_time
+
+        with _name_map_lock:
+            if _name_map and _name_map_time and datetime.now() - _name_map_time < NAME_MAP_TTL:
+                return _name_map
+            try:
+                df_info = self._pro.stock_basic(fields='ts_code,name')
+                if df_info is not None and not df_info.empty:
+                    _name_map = dict(zip(df_info['ts_code'], df_info['name']))
+                    _name_map_time = datetime.now()
+            except Exception as e:
+                print(f"获取股票名称失败: {e}")
+            # 刷新失败时沿用上一份名称表
+            return _name_map
+
+    def _fetch_chunk(self, ts_codes: List[str], names: Dict[str, str]) -> Dict[str, RealtimeQuote]:
+        """一批股票合并为一次 daily 和一次 daily_basic 请求"""
+        joined = ','.join(ts_codes)
+        end_date = datetime.now().strftime('%Y%m%d')
+        start_date = (datetime.now() - timedelta(days=10)).strftime('%Y%m%d')
+
+        df_daily = self._pro.daily(ts_code=joined, start_date=start_date, end_date=end_date)
+        if df_daily is None or df_daily.empty:
+            return {}
+
+        df_daily = df_daily.sort_values(['ts_code', 'trade_date'], ascending=[True, False])
+        latest_dates = df_daily.groupby('ts_code', sort=False)['trade_date'].first()
+
+        df_basic = self._pro.daily_basic(
+            ts_code=joined,
+            start_date=latest_dates.min(),
+            end_date=latest_dates.max(),
+            fields='ts_code,trade_date,pb,pe'
+        )
+        basic = {}
+        if df_basic is not None and not df_basic.empty:
+            for row in df_basic.itertuples(index=False):
+                basic[(row.ts_code, row.trade_date)] = (row.pb, row.pe)
+
+        results = {}
+        for ts_code, df_code in df_daily.groupby('ts_code', sort=False):
+            pb, pe = basic.get((ts_code, latest_dates[ts_code]), (None, None))
+            results[ts_code] = self._build_quote(ts_code, names.get(ts_code, ts_code), df_code, pb, pe)
+        return results
+
     def get_batch_quotes(self, codes: List[str]) -> Dict[str, RealtimeQuote]:
         """批量获取实时行情 - 使用 Tushare"""
         results = {}
@@ -152,15 +227,30 @@ class RealtimeService:
             print("Tushare API 未初始化，无法批量获取行情")
             return results
 
-        # 逐个获取（Tushare 不支持真正的批量实时行情）
-        for code in codes:
-            try:
-                quote = self.get_realtime_quote(code)
-                if quote:
-                    results[quote.code] = quote
-            except Exception as e:
-                print(f"获取 {code} 行情失败: {e}")
-                continue
+        # daily / daily_basic 支持逗号分隔的多个 ts_code：每批一次请求，
+        # 多批之间并发执行；失败批次中的股票再并发逐只获取
+        ts_codes = list(dict.fromkeys(self._normalize_code(code) for code in codes))
+        if ts_codes:
+            chunks = [ts_codes[i:i + self.BATCH_SIZE] for i in range(0, len(ts_codes), self.BATCH_SIZE)]
+            names = self._get_name_map()
+            failed_codes: List[str] = []
+
+            def fetch_chunk(chunk: List[str]) -> Dict[str, RealtimeQuote]:
+                try:
+                    return self._fetch_chunk(chunk, names)
+                except Exception as e:
+                    print(f"批量获取行情失败，改为逐只获取: {e}")
+                    failed_codes.extend(chunk)
+                    return {}
+
+            with ThreadPoolExecutor(max_workers=self.MAX_WORKERS) as executor:
+                for chunk_quotes in executor.map(fetch_chunk, chunks):
+                    results.update(chunk_quotes)
+
+                # 逐只请求是纯 IO 等待，复用同一线程池并发执行
+                for quote in executor.map(self.get_realtime_quote, failed_codes):
+                    if quote:
+                        results[quote.code] = quote
 
         self._cache = results
         self._cache_time = datetime.now()
@@ -174,3 +264,99 @@ class RealtimeService:
     def get_cache_time(self) -> Optional[datetime]:
         """获取缓存更新时间"""
         return self._cache_time
+
+
+def is_market_open(now: Optional[datetime] = None) -> bool:
+    """当前是否处于A股交易时段（周一至周五 09:25-15:05，北京时间）"""
+    now = now or datetime.now(MARKET_TZ)
+    if now.weekday() >= 5:
+        return False
+    return MARKET_OPEN_TIME <= now.time() <= MARKET_CLOSE_TIME
+
+
+def _last_data_ready_time(now: datetime) -> datetime:
+    """最近一个交易日日线数据的就绪时间"""
+    ready = datetime.combine(now.date(), DAILY_DATA_READY_TIME, tzinfo=MARKET_TZ)
+    if now < ready:
+        ready -= timedelta(days=1)
+    while ready.weekday() >= 5:
+        ready -= timedelta(days=1)
+    return ready
+
+
+def _is_fresh(fetched_at: Optional[str], ready: datetime) -> bool:
+    """抓取时间是否在最近一次日线数据就绪之后"""
+    return bool(fetched_at) and datetime.fromisoformat(fetched_at) >= ready
+
+
+def load_quote_snapshot(codes: Iterable[str]) -> Optional[Dict[str, RealtimeQuote]]:
+    """
+    读取休市期间可直接使用的行情快照
+
+    只有当所有代码都在最近一次日线数据就绪之后抓取过时才返回快照
+    （仅包含请求的代码），否则返回 None，由调用方重新请求。
+    """
+    ready = _last_data_ready_time(datetime.now(MARKET_TZ))
+
+    with _snapshot_lock:
+        try:
+            if not os.path.exists(QUOTE_SNAPSHOT_FILE):
+                return None
+            with open(QUOTE_SNAPSHOT_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"加载行情快照失败: {e}")
+            return None
+
+    fetched = data.get('fetched', {})
+    stored = data.get('quotes', {})
+    quotes = {}
+    for code in codes:
+        if not _is_fresh(fetched.get(code), ready):
+            return None
+        item = stored.get(code)
+        if item:
+            item['update_time'] = datetime.fromisoformat(item['update_time'])
+            quotes[code] = RealtimeQuote(**item)
+    return quotes
+
+
+def save_quote_snapshot(codes: Iterable[str], quotes: Dict[str, RealtimeQuote]):
+    """
+    将本次抓取的行情写入快照文件
+
+    只保留仍在最近一次日线数据就绪之后抓取的旧条目，过期代码
+    （如已移出股票池的股票）在下次写入时丢弃，文件不会无限增长。
+    """
+    now = datetime.now(MARKET_TZ)
+    ready = _last_data_ready_time(now)
+    fetched_at = now.isoformat()
+
+    with _snapshot_lock:
+        try:
+            fetched, stored = {}, {}
+            if os.path.exists(QUOTE_SNAPSHOT_FILE):
+                with open(QUOTE_SNAPSHOT_FILE, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                old_stored = data.get('quotes', {})
+                for code, old_fetched in data.get('fetched', {}).items():
+                    if _is_fresh(old_fetched, ready):
+                        fetched[code] = old_fetched
+                        if code in old_stored:
+                            stored[code] = old_stored[code]
+
+            for code in codes:
+                fetched[code] = fetched_at
+                # 本次未返回行情的代码不沿用旧数据
+                stored.pop(code, None)
+            for quote_code, quote in quotes.items():
+                item = asdict(quote)
+                item['update_time'] = quote.update_time.isoformat()
+                stored[quote_code] = item
+
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(QUOTE_SNAPSHOT_FILE, 'w', encoding='utf-8') as f:
+                # Tushare 返回的 numpy 数值统一转为 float
+                json.dump({'fetched': fetched, 'quotes': stored}, f, ensure_ascii=False, default=float)
+        except Exception as e:
+            print(f"保存行情快照失败: {e}")
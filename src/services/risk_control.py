@@ -146,10 +146,12 @@ class RiskControl:
 
     def _get_total_position(self) -> float:
         """获取当前总仓位"""
-        positions = self.session.query(PortfolioPosition).filter(
+        total = self.session.query(
+            func.coalesce(func.sum(PortfolioPosition.position_pct), 0)
+        ).filter(
             PortfolioPosition.user_id == self.user_id
-        ).all()
-        return sum(p.position_pct for p in positions if p.position_pct)
+        ).scalar()
+        return float(total)
 
     def get_position_summary(self) -> dict:
         """获取仓位汇总"""
@@ -280,17 +282,15 @@ class RiskControl:
         if not asset or not asset.industry:
             return True, None  # 无行业信息，跳过检查
 
-        # 获取同行业所有持仓
-        industry_positions = self.session.query(
-            PortfolioPosition, Asset
+        # 汇总同行业持仓
+        current_industry_pct = float(self.session.query(
+            func.coalesce(func.sum(PortfolioPosition.position_pct), 0)
         ).join(
             Asset, PortfolioPosition.asset_id == Asset.id
         ).filter(
             PortfolioPosition.user_id == self.user_id,
             Asset.industry == asset.industry
-        ).all()
-
-        current_industry_pct = sum(p[0].position_pct for p in industry_positions if p[0].position_pct)
+        ).scalar())
         new_industry_pct = current_industry_pct + additional_pct
 
         if new_industry_pct > self.max_industry_concentration:
@@ -320,14 +320,12 @@ class RiskControl:
 
         # 获取今日已发生的交易金额
         today = date.today()
-        today_actions = self.session.query(Action).filter(
+        today_total_amount = float(self.session.query(
+            func.coalesce(func.sum(Action.executed_amount), 0)
+        ).filter(
             Action.user_id == self.user_id,
             Action.action_date == today
-        ).all()
-
-        today_total_amount = sum(
-            a.executed_amount or 0 for a in today_actions
-        )
+        ).scalar())
 
         # 计算换手率
         new_turnover = ((today_total_amount + trade_amount) / portfolio.total_asset) * 100
@@ -1,9 +1,11 @@
 """Signal engine for PB trigger detection."""
 from typing import List, Optional, Dict
 from datetime import date, datetime, timedelta
-from sqlalchemy.orm import Session
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
 
-from ..database.models import Asset, Signal, SignalType, SignalStatus, Valuation
+from ..database.models import Asset, Signal, SignalType, SignalStatus, Valuation, PortfolioPosition
 from .valuation import ValuationService
 
 
@@ -116,6 +118,95 @@ class SignalEngine:
 
         return None
 
+    def check_triggers_bulk(self, stocks, quotes_by_code: Dict) -> List[Signal]:
+        """
+        批量检查触发信号（基于实时行情 PB）
+
+        stocks 为带 id/code/buy_pb/add_pb/sell_pb/has_threshold 属性的记录
+        （如 load_stock_pool 返回的 PoolStock）。今日已有的未处理信号、
+        持仓、冷却期各用一条 IN 查询取回，触发判断用数组比较一次完成，
+        新信号统一写入后只提交一次。返回今日所有触发的信号（含已存在的）。
+        """
+        watched = []
+        for stock in stocks:
+            quote = quotes_by_code.get(stock.code)
+            if stock.has_threshold and quote and quote.pb:
+                watched.append((stock, quote.pb))
+        if not watched:
+            return []
+
+        today = date.today()
+        asset_ids = [stock.id for stock, _ in watched]
+
+        # 今日已存在的未处理信号
+        existing = {}
+        for signal in self.session.query(Signal).filter(
+            Signal.asset_id.in_(asset_ids),
+            Signal.user_id == self.user_id,
+            Signal.date == today,
+            Signal.status == SignalStatus.OPEN
+        ):
+            existing.setdefault(signal.asset_id, signal)
+
+        held_ids = {
+            asset_id for (asset_id,) in self.session.query(PortfolioPosition.asset_id).filter(
+                PortfolioPosition.asset_id.in_(asset_ids),
+                PortfolioPosition.user_id == self.user_id,
+                PortfolioPosition.position_pct > 0
+            )
+        }
+
+        # 触发判断：优先级 SELL > ADD > BUY，与 check_triggers 一致
+        current_pb = np.array([pb for _, pb in watched], dtype=np.float64)
+        buy_pb = np.array([stock.buy_pb for stock, _ in watched], dtype=np.float64)
+        add_pb = np.array([stock.add_pb or np.nan for stock, _ in watched], dtype=np.float64)
+        sell_pb = np.array([stock.sell_pb or np.nan for stock, _ in watched], dtype=np.float64)
+        has_position = np.array([stock.id in held_ids for stock, _ in watched], dtype=bool)
+
+        sell_mask = has_position & (current_pb >= sell_pb)
+        add_mask = ~sell_mask & has_position & (current_pb <= add_pb)
+        buy_mask = ~sell_mask & ~add_mask & (current_pb <= buy_pb)
+
+        masks = [sell_mask, add_mask, buy_mask]
+        actions = np.select(masks, ["SELL", "ADD", "BUY"], default="")
+        thresholds = np.select(masks, [sell_pb, add_pb, buy_pb], default=np.nan)
+
+        # 冷却期内最近一次触发日期，一条查询取回，过滤时按 (asset_id, 信号类型) 查表
+        recent_signals = self.get_recent_signal_dates(asset_ids)
+
+        signals = []
+        new_signals = []
+        for i in np.flatnonzero(sell_mask | add_mask | buy_mask):
+            stock, pb = watched[i]
+            if stock.id in existing:
+                signals.append(existing[stock.id])
+                continue
+
+            action = str(actions[i])
+            signal_type = SignalType[action]
+            # 与 check_triggers 共用同一套过滤条件
+            filter_ok, _ = self.check_filters(stock, signal_type, recent_signals)
+            if not filter_ok:
+                continue
+
+            threshold_pb = float(thresholds[i])
+            new_signals.append(Signal(
+                user_id=self.user_id,
+                asset_id=stock.id,
+                date=today,
+                signal_type=signal_type,
+                pb=pb,
+                triggered_threshold=threshold_pb,
+                explanation=self._generate_explanation(stock, pb, threshold_pb, action),
+                status=SignalStatus.OPEN
+            ))
+
+        if new_signals:
+            self.session.add_all(new_signals)
+            self.session.commit()
+
+        return signals + new_signals
+
     def _generate_explanation(
         self,
         asset: Asset,
@@ -171,8 +262,10 @@ class SignalEngine:
         return signals
 
     def get_open_signals(self) -> List[Signal]:
-        """获取所有未处理的信号"""
-        return self.session.query(Signal).filter(
+        """获取所有未处理的信号（同一查询带出 signal.asset）"""
+        return self.session.query(Signal).options(
+            joinedload(Signal.asset)
+        ).filter(
             Signal.user_id == self.user_id,
             Signal.status == SignalStatus.OPEN
         ).order_by(Signal.date.desc()).all()
@@ -180,18 +273,54 @@ class SignalEngine:
     def get_today_signals(self) -> List[Signal]:
         """获取今日信号"""
         today = date.today()
-        return self.session.query(Signal).filter(
+        return self.session.query(Signal).options(
+            joinedload(Signal.asset)
+        ).filter(
             Signal.user_id == self.user_id,
             Signal.date == today
         ).order_by(Signal.created_at.desc()).all()
 
     def get_signals_by_status(self, status: SignalStatus) -> List[Signal]:
         """按状态获取信号"""
-        return self.session.query(Signal).filter(
+        return self.session.query(Signal).options(
+            joinedload(Signal.asset)
+        ).filter(
             Signal.user_id == self.user_id,
             Signal.status == status
         ).order_by(Signal.date.desc()).all()
 
+    def get_signals_with_assets(
+        self,
+        status: SignalStatus,
+        min_competence: Optional[int] = None
+    ) -> List[tuple[Signal, Asset]]:
+        """
+        按状态获取信号及对应股票，关注指数评分在 SQL 中过滤
+
+        Args:
+            status: 信号状态
+            min_competence: 最低关注指数评分（None 表示不过滤）
+
+        Returns:
+            (信号, 股票) 列表
+        """
+        query = self.session.query(Signal, Asset).join(
+            Asset, Asset.id == Signal.asset_id
+        ).filter(
+            Signal.user_id == self.user_id,
+            Signal.status == status
+        )
+        if min_competence is not None:
+            query = query.filter(Asset.competence_score >= min_competence)
+        return query.order_by(Signal.date.desc()).all()
+
+    def count_signals_by_status(self, status: SignalStatus) -> int:
+        """按状态统计信号数量"""
+        return self.session.query(func.count(Signal.id)).filter(
+            Signal.user_id == self.user_id,
+            Signal.status == status
+        ).scalar()
+
     def update_signal_status(self, signal_id: int, status: SignalStatus) -> Optional[Signal]:
         """更新信号状态"""
         signal = self.session.query(Signal).filter(
@@ -241,10 +370,37 @@ class SignalEngine:
         # 可以从 Tushare/AkShare 获取财务数据
         return True, None
 
+    def get_recent_signal_dates(
+        self,
+        asset_ids: List[int]
+    ) -> Dict[tuple[int, SignalType], date]:
+        """
+        批量获取冷却期内各股票、各信号类型最近一次触发日期
+
+        Args:
+            asset_ids: 股票ID列表
+
+        Returns:
+            {(asset_id, 信号类型): 最近触发日期}，未启用冷却期时为空
+        """
+        if not self.enable_cooldown or not asset_ids:
+            return {}
+
+        cooldown_date = date.today() - timedelta(days=self.signal_cooldown_days)
+        rows = self.session.query(
+            Signal.asset_id, Signal.signal_type, func.max(Signal.date)
+        ).filter(
+            Signal.asset_id.in_(asset_ids),
+            Signal.user_id == self.user_id,
+            Signal.date >= cooldown_date
+        ).group_by(Signal.asset_id, Signal.signal_type)
+        return {(asset_id, signal_type): last_date for asset_id, signal_type, last_date in rows}
+
     def check_signal_cooldown(
         self,
         asset_id: int,
-        signal_type: SignalType
+        signal_type: SignalType,
+        recent_signals: Optional[Dict[tuple[int, SignalType], date]] = None
     ) -> tuple[bool, Optional[str]]:
         """
         检查信号冷却期
@@ -252,6 +408,7 @@ class SignalEngine:
         Args:
             asset_id: 股票ID
             signal_type: 信号类型
+            recent_signals: 预先取回的 get_recent_signal_dates 结果（None 时单独查询）
 
         Returns:
             (是否可以触发, 冷却原因)
@@ -260,17 +417,12 @@ class SignalEngine:
             return True, None
 
         # 检查最近N天是否有相同类型的信号
-        cooldown_date = date.today() - timedelta(days=self.signal_cooldown_days)
-
-        recent_signal = self.session.query(Signal).filter(
-            Signal.asset_id == asset_id,
-            Signal.user_id == self.user_id,
-            Signal.signal_type == signal_type,
-            Signal.date >= cooldown_date
-        ).order_by(Signal.date.desc()).first()
+        if recent_signals is None:
+            recent_signals = self.get_recent_signal_dates([asset_id])
 
-        if recent_signal:
-            days_ago = (date.today() - recent_signal.date).days
+        last_date = recent_signals.get((asset_id, signal_type))
+        if last_date:
+            days_ago = (date.today() - last_date).days
             return False, f"冷却期内：{days_ago}天前已触发过 {signal_type.value} 信号"
 
         return True, None
@@ -278,7 +430,8 @@ class SignalEngine:
     def check_filters(
         self,
         asset: Asset,
-        signal_type: SignalType
+        signal_type: SignalType,
+        recent_signals: Optional[Dict[tuple[int, SignalType], date]] = None
     ) -> tuple[bool, Optional[str]]:
         """
         综合检查所有过滤条件
@@ -286,6 +439,7 @@ class SignalEngine:
         Args:
             asset: 股票资产
             signal_type: 信号类型
+            recent_signals: 预先取回的冷却期信号日期（批量检查时传入，避免逐只查询）
 
         Returns:
             (是否通过, 不通过原因)
@@ -296,7 +450,7 @@ class SignalEngine:
             return False, f"ROE过滤: {roe_msg}"
 
         # 2. 信号冷却期
-        cooldown_ok, cooldown_msg = self.check_signal_cooldown(asset.id, signal_type)
+        cooldown_ok, cooldown_msg = self.check_signal_cooldown(asset.id, signal_type, recent_signals)
         if not cooldown_ok:
             return False, f"信号冷却: {cooldown_msg}"
 
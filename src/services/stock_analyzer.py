@@ -23,6 +23,11 @@ _stock_basic_cache: Dict[str, dict] = {}
 _stock_basic_cache_time: Optional[datetime] = None
 _cache_lock = threading.Lock()
 
+# 全局共享的 Tushare Pro 客户端
+_pro_client = None
+_pro_client_token: Optional[str] = None
+_pro_lock = threading.Lock()
+
 
 def get_tushare_token() -> Optional[str]:
     """
@@ -46,6 +51,29 @@ def get_tushare_token() -> Optional[str]:
     return None
 
 
+def get_tushare_pro(token: Optional[str] = None):
+    """
+    获取进程内共享的 Tushare Pro 客户端
+
+    直接用 token 构造客户端，不再每次调用 ts.set_token（它会把 token 写入本地文件）。
+    token 变化时重新创建；未安装 Tushare 或无 token 时返回 None。
+    """
+    global _pro_client, _pro_client_token
+
+    if not TUSHARE_AVAILABLE:
+        return None
+
+    token = token or get_tushare_token()
+    if not token:
+        return None
+
+    with _pro_lock:
+        if _pro_client is None or _pro_client_token != token:
+            _pro_client = ts.pro_api(token)
+            _pro_client_token = token
+        return _pro_client
+
+
 @dataclass
 class StockInfo:
     """股票基本信息"""
@@ -136,8 +164,7 @@ class StockAnalyzer:
                     token = get_tushare_token()
 
                 if token:
-                    ts.set_token(token)
-                    self.pro = ts.pro_api()
+                    self.pro = get_tushare_pro(token)
                 else:
                     print("未配置 Tushare Token，无法获取数据")
             except Exception as e:
@@ -1,7 +1,8 @@
 """Stock pool management service."""
-from typing import List, Optional
+from typing import Dict, List, Optional, Set
 from datetime import datetime
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, selectinload
 from ..database.models import Asset, Threshold, Market
 
 
@@ -23,42 +24,83 @@ class StockPoolService:
         notes: Optional[str] = None,
         buy_pb: Optional[float] = None,
         add_pb: Optional[float] = None,
-        sell_pb: Optional[float] = None
+        sell_pb: Optional[float] = None,
+        ai_score: Optional[int] = None,
+        ai_suggestion: Optional[str] = None
     ) -> Asset:
-        """添加股票到股票池"""
-        # Check if already exists
-        existing = self.session.query(Asset).filter(
-            Asset.code == code,
-            Asset.user_id == self.user_id
-        ).first()
-        if existing:
+        """添加股票到股票池（AI 评分随新记录一并写入，无需再调用 update_stock）"""
+        added = self.add_stocks([{
+            "code": code,
+            "name": name,
+            "market": market,
+            "industry": industry,
+            "tags": tags,
+            "competence_score": competence_score,
+            "notes": notes,
+            "buy_pb": buy_pb,
+            "add_pb": add_pb,
+            "sell_pb": sell_pb,
+            "ai_score": ai_score,
+            "ai_suggestion": ai_suggestion
+        }])
+        if not added:
             raise ValueError(f"股票 {code} 已存在于股票池中")
-
-        asset = Asset(
-            user_id=self.user_id,
-            code=code,
-            name=name,
-            market=market,
-            industry=industry,
-            tags=tags,
-            competence_score=competence_score,
-            notes=notes
-        )
-        self.session.add(asset)
-        self.session.flush()  # Get the asset.id
-
-        # Add threshold if buy_pb is provided
-        if buy_pb is not None:
-            threshold = Threshold(
-                asset_id=asset.id,
-                buy_pb=buy_pb,
-                add_pb=add_pb,
-                sell_pb=sell_pb
+        return added[0]
+
+    def add_stocks(self, stocks: List[Dict], commit: bool = True) -> List[Asset]:
+        """
+        批量添加股票（一次查重、一次 flush 插入、一次提交）
+
+        Args:
+            stocks: 每项为 add_stock 的关键字参数，另可带 ai_score / ai_suggestion
+            commit: 为 False 时只 flush，由调用方与其他写入合并为一个事务提交
+
+        Returns:
+            新添加的股票列表（已在股票池中的代码会被跳过）
+        """
+        codes = [s["code"] for s in stocks]
+        existing = {
+            code for (code,) in self.session.query(Asset.code).filter(
+                Asset.code.in_(codes),
+                Asset.user_id == self.user_id
             )
-            self.session.add(threshold)
-
-        self.session.commit()
-        return asset
+        }
+
+        assets, thresholds = [], []
+        for item in stocks:
+            if item["code"] in existing:
+                continue
+            existing.add(item["code"])
+            assets.append(Asset(
+                user_id=self.user_id,
+                code=item["code"],
+                name=item["name"],
+                market=item["market"],
+                industry=item.get("industry"),
+                tags=item.get("tags"),
+                competence_score=item.get("competence_score", 3),
+                ai_score=item.get("ai_score"),
+                ai_suggestion=item.get("ai_suggestion"),
+                notes=item.get("notes")
+            ))
+            thresholds.append((item.get("buy_pb"), item.get("add_pb"), item.get("sell_pb")))
+
+        if not assets:
+            return []
+
+        self.session.add_all(assets)
+        self.session.flush()  # 一次批量 INSERT 取回所有 asset.id
+
+        self.session.add_all([
+            Threshold(asset_id=asset.id, buy_pb=buy_pb, add_pb=add_pb, sell_pb=sell_pb)
+            for asset, (buy_pb, add_pb, sell_pb) in zip(assets, thresholds)
+            if buy_pb is not None
+        ])
+        if commit:
+            self.session.commit()
+        else:
+            self.session.flush()
+        return assets
 
     def remove_stock(self, code: str) -> bool:
         """从股票池删除股票"""
@@ -73,18 +115,28 @@ class StockPoolService:
         return False
 
     def get_stock(self, code: str) -> Optional[Asset]:
-        """获取单只股票信息"""
-        return self.session.query(Asset).filter(
+        """获取单只股票信息（阈值随同一条 JOIN 查询取回）"""
+        return self.session.query(Asset).options(
+            joinedload(Asset.threshold)
+        ).filter(
             Asset.code == code,
             Asset.user_id == self.user_id
         ).first()
 
     def get_all_stocks(self) -> List[Asset]:
-        """获取所有股票"""
-        return self.session.query(Asset).filter(
+        """获取所有股票（预加载阈值，避免逐只懒加载）"""
+        return self.session.query(Asset).options(
+            selectinload(Asset.threshold)
+        ).filter(
             Asset.user_id == self.user_id
         ).order_by(Asset.created_at.desc()).all()
 
+    def get_all_codes(self) -> Set[str]:
+        """获取股票池中所有股票代码（只查询 code 一列，不构建 Asset 对象）"""
+        return set(self.session.scalars(
+            select(Asset.code).where(Asset.user_id == self.user_id)
+        ))
+
     def update_stock(
         self,
         code: str,
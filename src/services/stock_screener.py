@@ -3,6 +3,7 @@ from typing import Optional, List, Dict
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 try:
     import tushare as ts
@@ -65,6 +66,9 @@ class StockScreener:
         "600900", "601985", "600886",
     ]
 
+    # 扫描并发数；每个线程自带 0.5s 请求间隔，过大易触发 Tushare 限频
+    SCAN_WORKERS = 4
+
     def __init__(self):
         self._pro = None
         self._init_tushare()
@@ -76,11 +80,8 @@ class StockScreener:
             return
 
         try:
-            from src.services.stock_analyzer import get_tushare_token
-            token = get_tushare_token()
-            if token:
-                ts.set_token(token)
-                self._pro = ts.pro_api()
+            from src.services.stock_analyzer import get_tushare_pro
+            self._pro = get_tushare_pro()
         except Exception as e:
             print(f"Tushare 初始化失败: {e}")
 
@@ -184,10 +185,9 @@ class StockScreener:
             )
 
             if df is not None and not df.empty:
-                for _, row in df.iterrows():
-                    pb = row.get('pb')
-                    if pb and pb > 0:
-                        pb_values.append(round(pb, 2))
+                # 列式过滤，替代逐行 iterrows
+                pb = df['pb']
+                pb_values = pb[pb > 0].round(2).tolist()
 
         except Exception as e:
             error_msg = str(e)
@@ -232,6 +232,50 @@ class StockScreener:
             'percentile_75': round(percentile_75, 2)
         }
 
+    def _scan_one(self, code: str, max_distance_pct: float) -> Optional[StockRecommendation]:
+        """分析单只股票，PB 在请客价范围内时返回推荐结果"""
+        # 获取股票基本数据
+        stock_data = self._fetch_stock_data(code)
+        if not stock_data:
+            return None
+
+        # 获取历史PB
+        ts_code = self._get_ts_code(code)
+        pb_values = self._fetch_pb_history(ts_code)
+
+        # 分析PB
+        pb_analysis = self._analyze_pb(pb_values)
+        if not pb_analysis:
+            return None
+
+        current_pb = stock_data['current_pb']
+        recommended_buy_pb = pb_analysis['recommended_buy_pb']
+
+        # 计算距离请客价的百分比
+        if recommended_buy_pb <= 0:
+            return None
+        distance_pct = ((current_pb - recommended_buy_pb) / recommended_buy_pb) * 100
+
+        # 筛选：当前PB在请客价的±max_distance_pct%范围内
+        if distance_pct > max_distance_pct:
+            return None
+
+        return StockRecommendation(
+            code=stock_data['code'],
+            name=stock_data['name'],
+            industry=stock_data['industry'],
+            current_price=stock_data['price'],
+            current_pb=current_pb,
+            recommended_buy_pb=recommended_buy_pb,
+            pb_distance_pct=round(distance_pct, 2),
+            min_pb=pb_analysis['min_pb'],
+            max_pb=pb_analysis['max_pb'],
+            avg_pb=pb_analysis['avg_pb'],
+            market_cap=stock_data['market_cap'],
+            pe_ttm=stock_data['pe_ttm'],
+            roe=None  # 暂不获取ROE
+        )
+
     def scan_stocks(self, max_distance_pct: float = 20.0, limit: int = 10,
                     progress_callback=None) -> List[StockRecommendation]:
         """
@@ -251,53 +295,26 @@ class StockScreener:
             print("Tushare API 未初始化，无法扫描股票")
             return []
 
-        recommendations = []
         total = len(self.STOCK_UNIVERSE)
-
-        for idx, code in enumerate(self.STOCK_UNIVERSE):
-            if progress_callback:
-                progress_callback(idx + 1, total, f"正在分析 {code}...")
-
-            # 获取股票基本数据
-            stock_data = self._fetch_stock_data(code)
-            if not stock_data:
-                continue
-
-            # 获取历史PB
-            ts_code = self._get_ts_code(code)
-            pb_values = self._fetch_pb_history(ts_code)
-
-            # 分析PB
-            pb_analysis = self._analyze_pb(pb_values)
-            if not pb_analysis:
-                continue
-
-            current_pb = stock_data['current_pb']
-            recommended_buy_pb = pb_analysis['recommended_buy_pb']
-
-            # 计算距离请客价的百分比
-            if recommended_buy_pb > 0:
-                distance_pct = ((current_pb - recommended_buy_pb) / recommended_buy_pb) * 100
-            else:
-                continue
-
-            # 筛选：当前PB在请客价的±max_distance_pct%范围内
-            if distance_pct <= max_distance_pct:
-                recommendations.append(StockRecommendation(
-                    code=stock_data['code'],
-                    name=stock_data['name'],
-                    industry=stock_data['industry'],
-                    current_price=stock_data['price'],
-                    current_pb=current_pb,
-                    recommended_buy_pb=recommended_buy_pb,
-                    pb_distance_pct=round(distance_pct, 2),
-                    min_pb=pb_analysis['min_pb'],
-                    max_pb=pb_analysis['max_pb'],
-                    avg_pb=pb_analysis['avg_pb'],
-                    market_cap=stock_data['market_cap'],
-                    pe_ttm=stock_data['pe_ttm'],
-                    roe=None  # 暂不获取ROE
-                ))
+        # 按股票池顺序存放结果，保证相同距离时排序稳定
+        results: List[Optional[StockRecommendation]] = [None] * total
+
+        # 每只股票的行情与历史PB请求互不依赖，并发执行以摊平网络等待
+        with ThreadPoolExecutor(max_workers=self.SCAN_WORKERS) as executor:
+            futures = {
+                executor.submit(self._scan_one, code, max_distance_pct): idx
+                for idx, code in enumerate(self.STOCK_UNIVERSE)
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                idx = futures[future]
+                try:
+                    results[idx] = future.result()
+                except Exception as e:
+                    print(f"分析股票失败 {self.STOCK_UNIVERSE[idx]}: {e}")
+                if progress_callback:
+                    progress_callback(done, total, f"已分析 {self.STOCK_UNIVERSE[idx]}")
+
+        recommendations = [r for r in results if r is not None]
 
         # 按距离请客价百分比排序（越低越好）
         recommendations.sort(key=lambda x: x.pb_distance_pct)
@@ -1,8 +1,10 @@
 """Valuation data fetching and management service."""
-from typing import List, Optional, Tuple
+from typing import Callable, List, Optional, Tuple
 from datetime import date, datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import numpy as np
 import pandas as pd
 import threading
 
@@ -149,23 +151,71 @@ class ValuationService:
         self.session.commit()
         return valuation
 
-    def batch_save_valuations(self, asset_id: int, data_list: List[dict]) -> int:
+    def batch_save_valuations(
+        self,
+        asset_id: int,
+        data_list: List[dict],
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> int:
         """批量保存估值数据"""
-        count = 0
-        for data in data_list:
-            if data.get('pb') is not None:
-                self.save_valuation(
-                    asset_id=asset_id,
-                    val_date=data['date'],
-                    pb=data['pb'],
-                    price=data.get('price'),
-                    book_value_per_share=data.get('book_value_per_share'),
-                    data_source=data.get('data_source', 'akshare'),
-                    pb_method=data.get('pb_method', 'direct'),
-                    report_period=data.get('report_period')
-                )
-                count += 1
-        return count
+        return self.bulk_save_valuations(
+            [{**data, 'asset_id': asset_id} for data in data_list],
+            progress_callback=progress_callback
+        )
+
+    # 批量写入时每条 executemany 的行数（每批结束回调一次进度）
+    BULK_CHUNK_SIZE = 1000
+
+    def bulk_save_valuations(
+        self,
+        rows: List[dict],
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> int:
+        """
+        批量写入估值数据：按批 executemany upsert，整体一次提交
+
+        rows 每项需包含 asset_id、date、pb，其余字段可选；
+        (asset_id, date) 已存在时用新值覆盖，与 save_valuation 行为一致。
+        progress_callback(已写入行数, 总行数) 在每批写入后调用。
+        """
+        now = datetime.now()
+        values = [
+            {
+                'asset_id': row['asset_id'],
+                'date': row['date'],
+                'pb': row['pb'],
+                'price': row.get('price'),
+                'book_value_per_share': row.get('book_value_per_share'),
+                'data_source': row.get('data_source', 'akshare'),
+                'pb_method': row.get('pb_method') or 'direct',
+                'report_period': row.get('report_period'),
+                'fetched_at': now
+            }
+            for row in rows if row.get('pb') is not None
+        ]
+        if not values:
+            return 0
+
+        stmt = sqlite_insert(Valuation)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['asset_id', 'date'],
+            set_={
+                col: stmt.excluded[col]
+                for col in ('pb', 'price', 'book_value_per_share', 'data_source',
+                            'pb_method', 'report_period', 'fetched_at')
+            }
+        )
+        total = len(values)
+        try:
+            for start in range(0, total, self.BULK_CHUNK_SIZE):
+                self.session.execute(stmt, values[start:start + self.BULK_CHUNK_SIZE])
+                if progress_callback:
+                    progress_callback(min(start + self.BULK_CHUNK_SIZE, total), total)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        return total
 
     def update_all_stocks(self, user_id: Optional[int] = None) -> dict:
         """更新所有股票的PB数据"""
@@ -210,6 +260,26 @@ class ValuationService:
 
         return query.order_by(Valuation.date).all()
 
+    def get_pb_history_df(
+        self,
+        asset_id: int,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None
+    ) -> pd.DataFrame:
+        """获取PB历史数据（只投影 date/pb/price 三列，直接构造 DataFrame，不创建 ORM 对象）"""
+        stmt = select(Valuation.date, Valuation.pb, Valuation.price).where(Valuation.asset_id == asset_id)
+
+        if start_date:
+            stmt = stmt.where(Valuation.date >= start_date)
+        if end_date:
+            stmt = stmt.where(Valuation.date <= end_date)
+
+        # 分批从游标读取，长区间不必先 fetchall 出完整的行列表
+        result = self.session.execute(
+            stmt.order_by(Valuation.date).execution_options(yield_per=200)
+        )
+        return pd.DataFrame.from_records(result, columns=["date", "pb", "price"])
+
     def calculate_pb_percentile(
         self,
         asset_id: int,
@@ -259,3 +329,58 @@ class ValuationService:
             'count': result.count,
             'years': years
         }
+
+    def get_pb_stats_multi(
+        self,
+        asset_id: int,
+        current_pb: Optional[float] = None,
+        year_windows: Tuple[int, ...] = (3, 5, 10)
+    ) -> dict:
+        """
+        一次查询计算多个时间窗口的PB统计与分位数
+
+        取最长窗口内的全部PB（按日期升序），各窗口按日期切片后在内存中
+        计算最小/最大/平均值，分位数口径与 calculate_pb_percentile 一致。
+
+        Returns:
+            {years: stats}，stats 字段同 get_pb_stats，另含 'percentile'；
+            无数据的窗口不出现在结果中
+        """
+        if not year_windows:
+            return {}
+
+        today = date.today()
+        rows = self.session.execute(
+            select(Valuation.date, Valuation.pb).where(
+                Valuation.asset_id == asset_id,
+                Valuation.date >= today - timedelta(days=365 * max(year_windows)),
+                Valuation.pb.isnot(None)
+            ).order_by(Valuation.date)
+        ).all()
+        if not rows:
+            return {}
+
+        dates = np.array([row.date for row in rows], dtype='datetime64[D]')
+        pbs = np.array([row.pb for row in rows], dtype=np.float64)
+
+        stats = {}
+        for years in year_windows:
+            start = np.datetime64(today - timedelta(days=365 * years), 'D')
+            window = pbs[np.searchsorted(dates, start):]
+            if window.size == 0:
+                continue
+
+            percentile = None
+            if current_pb is not None:
+                count_below = np.searchsorted(np.sort(window), current_pb, side='right')
+                percentile = float(count_below / window.size * 100)
+
+            stats[years] = {
+                'min_pb': float(window.min()),
+                'max_pb': float(window.max()),
+                'avg_pb': float(window.mean()),
+                'count': int(window.size),
+                'years': years,
+                'percentile': percentile
+            }
+        return stats
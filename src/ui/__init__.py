@@ -10,12 +10,18 @@ from .styles import (
     render_header,
     render_main_header,
     render_metric_card,
+    render_card,
     render_alert,
     render_footer,
+    render_nav_card,
+    render_nav_grid,
+    render_sidebar_brand,
     get_status_style,
     format_change
 )
 from .auth import require_auth, render_auth_sidebar, get_current_user_id
+from .charts import lttb_downsample, MAX_CHART_POINTS
+from .tables import truncate_text
 
 __all__ = [
     'APP_NAME_CN',
@@ -28,11 +34,18 @@ __all__ = [
     'render_header',
     'render_main_header',
     'render_metric_card',
+    'render_card',
     'render_alert',
     'render_footer',
+    'render_nav_card',
+    'render_nav_grid',
+    'render_sidebar_brand',
     'get_status_style',
     'format_change',
     'require_auth',
     'render_auth_sidebar',
-    'get_current_user_id'
+    'get_current_user_id',
+    'lttb_downsample',
+    'MAX_CHART_POINTS',
+    'truncate_text'
 ]
@@ -0,0 +1,60 @@
+"""Chart data helpers for UBA."""
+from typing import Sequence, Tuple, List
+
+# 单条折线交给 Plotly 的最大点数，超过后 SVG 渲染明显变慢
+MAX_CHART_POINTS = 800
+
+
+def lttb_downsample(x: Sequence, y: Sequence[float], n_out: int = MAX_CHART_POINTS) -> Tuple[List, List]:
+    """
+    LTTB（Largest-Triangle-Three-Buckets）降采样
+
+    按桶选取与前一选中点、下一桶均值构成三角形面积最大的点，
+    在大幅减少点数的同时保留走势形状（峰谷不被抹平）。
+    点数不超过 n_out 时原样返回。y 中不应包含 None/NaN。
+
+    Args:
+        x: 横轴数据（日期或数值）
+        y: 纵轴数值
+        n_out: 输出点数上限
+
+    Returns:
+        (降采样后的 x 列表, 降采样后的 y 列表)
+    """
+    n = len(y)
+    if n_out < 3 or n <= n_out:
+        return list(x), list(y)
+
+    # 仅在需要降采样时加载 numpy
+    import numpy as np
+
+    values = np.asarray(y, dtype=np.float64)
+    try:
+        positions = np.asarray(x, dtype='datetime64[D]').astype(np.float64)
+    except (TypeError, ValueError):
+        # 无法解析为日期时按等间距处理
+        positions = np.arange(n, dtype=np.float64)
+
+    # 首尾两点固定保留，中间 n-2 个点均分为 n_out-2 个桶
+    edges = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    selected = [0]
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = positions[next_start:next_end].mean()
+        avg_y = values[next_start:next_end].mean()
+
+        areas = np.abs(
+            (positions[a] - avg_x) * (values[start:end] - values[a])
+            - (positions[a] - positions[start:end]) * (avg_y - values[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected.append(a)
+    selected.append(n - 1)
+
+    x_list = list(x)
+    return [x_list[i] for i in selected], values[selected].tolist()
@@ -1,5 +1,6 @@
 """Global UI styles and theme configuration for UBA (Unbeaten Area)."""
 import textwrap
+from functools import lru_cache
 
 # App Branding
 APP_NAME_CN = "不败之地"
@@ -336,6 +337,7 @@ def render_header(title: str, subtitle: str = None, icon: str = "📊"):
     """)
 
 
+@lru_cache(maxsize=None)
 def render_main_header():
     """Render the main app header with full branding."""
     return textwrap.dedent(f"""
@@ -358,6 +360,11 @@ def render_metric_card(value: str, label: str, icon: str = "", delta: str = None
     return f'<div class="metric-card"><div style="display: flex; align-items: center; gap: 8px;"><span style="font-size: 1.5rem;">{icon}</span><div><div class="metric-value">{value}</div><div class="metric-label">{label}</div>{delta_html}</div></div></div>'
 
 
+def render_card(content: str) -> str:
+    """Wrap markdown/HTML content in a metric-card container."""
+    return f'<div class="metric-card">\n    {content}\n</div>'
+
+
 def render_alert(message: str, type: str = "info", icon: str = None):
     """Render a styled alert box."""
     icons = {
@@ -375,6 +382,7 @@ def render_alert(message: str, type: str = "info", icon: str = None):
     """)
 
 
+@lru_cache(maxsize=None)
 def render_footer():
     """Render the app footer."""
     return textwrap.dedent(f"""
@@ -385,6 +393,38 @@ def render_footer():
     """)
 
 
+@lru_cache(maxsize=None)
+def render_sidebar_brand():
+    """Render the sidebar branding block."""
+    return textwrap.dedent(f"""
+    <div style="text-align: center; padding: 1rem 0;">
+        <div style="font-size: 2.5rem;">🛡️</div>
+        <div style="font-size: 1.2rem; font-weight: 700; color: #1E88E5;">{APP_NAME_CN}</div>
+        <div style="font-size: 0.8rem; color: #666;">{APP_NAME_EN} • {APP_FULL_NAME}</div>
+    </div>
+    """)
+
+
+@lru_cache(maxsize=None)
+def render_nav_card(title: str, items: tuple) -> str:
+    """Render a static navigation card (cached, inputs never change)."""
+    items_html = "".join(f"<li>{item}</li>" for item in items)
+    return (
+        f'<div class="metric-card"><h4>{title}</h4>'
+        f'<ul style="color: #666; margin: 0; padding-left: 1.2rem;">{items_html}</ul></div>'
+    )
+
+
+@lru_cache(maxsize=None)
+def render_nav_grid(cards: tuple) -> str:
+    """Render all navigation cards as one CSS grid (single markdown block)."""
+    cards_html = "".join(render_nav_card(title, items) for title, items in cards)
+    return (
+        '<div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(240px, 1fr)); '
+        f'gap: 1rem;">{cards_html}</div>'
+    )
+
+
 def get_status_style(status: str) -> str:
     """Get CSS class for status badge."""
     status_map = {
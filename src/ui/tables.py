@@ -0,0 +1,23 @@
+"""Table data helpers for UBA."""
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+
+def truncate_text(values: Iterable, width: int, ellipsis: str = "...") -> pd.Series:
+    """
+    批量截断文本列，超长部分以省略号结尾
+
+    Args:
+        values: 文本序列（可含 None）
+        width: 保留的最大字符数
+        ellipsis: 被截断时追加的后缀
+
+    Returns:
+        截断后的字符串 Series
+    """
+    text = pd.Series(values, dtype="object").fillna("").astype(str)
+    return text.str.slice(0, width).str.cat(
+        np.where(text.str.len() > width, ellipsis, "")
+    )